@@ -2,6 +2,8 @@ import os
 import shutil
 
 from core import FileSystem
+from shared import serialization
+from shared.io_executor import get_io_executor
 from utils import data
 
 
@@ -33,10 +35,7 @@ class BotFileSystem(FileSystem):
             file_name += ".json"
 
         file = os.path.join(folder_path, file_name)
-        if not os.path.isfile(file):
-            return None
-        else:
-            return data.load(file)
+        return await get_io_executor().read(file, self.__load_if_present)
 
     async def save_data_in_data_path_for_guild(self, ctx, path_modifier, file_name, item_to_save):
         folder_path = os.path.join(self._get_guild_folder_path(ctx), path_modifier)
@@ -54,11 +53,16 @@ class BotFileSystem(FileSystem):
         if not file_name.endswith(".json"):
             file_name += ".json"
 
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-
+        # The folder is created by the writer, the item is copied on the loop and encoded alongside the write
         file = os.path.join(folder_path, file_name)
-        data.save(item_to_save, file)
+        await get_io_executor().write(file, item_to_save, serialization.dumps, snapshot=serialization.snapshot)
+
+    @staticmethod
+    def __load_if_present(file):
+        if not os.path.isfile(file):
+            return None
+        else:
+            return data.load(file)
 
     async def delete_in_data_path_for_guild(self, ctx, path_modifier):
         await self.__delete(os.path.join(self._get_guild_folder_path(ctx), path_modifier))
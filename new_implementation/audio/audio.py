@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import itertools
 import math
 from asyncio import QueueFull
@@ -8,12 +9,29 @@ import discord
 from async_timeout import timeout
 from discord.ext import commands
 
+from new_implementation.audio.library import get_music_library
+from new_implementation.audio.mixer import AudioMixer
+from new_implementation.audio.resolver import get_track_resolver
+from new_implementation.audio.sources.local_source import LocalSource
+from new_implementation.audio.sources.opus_cache import CachedOpusSource, get_opus_cache
 from new_implementation.audio.sources.source import SourceError
 from new_implementation.audio.sources.ytdl_source import YTDLSource
 from new_implementation.bots.cogs import DnDiscordCog
 from new_implementation.core.permissions_handler import PermissionLevel
 from new_implementation.utils import utils
-from new_implementation.utils.message import send_message
+from new_implementation.utils.message import send_message, LongMessage
+
+
+# How long before the current track ends that we open the next track's stream
+PREFETCH_LEAD = 30
+
+# Ambient layers mixed under the playlist, and how many frames (of 20ms) a layer must play for before it is looped
+MAX_LAYERS = 8
+MIN_LOOP_FRAMES = 50
+
+# Layers up to a minute long (around 11MB of PCM) are looped from memory, longer ones are opened again every loop
+MAX_LOOP_FRAMES = 3000
+PLAYLIST_LAYER = "playlist"
 
 
 class BardError(Exception):
@@ -21,12 +39,115 @@ class BardError(Exception):
 
 
 class Track:
-    __slots__ = ('source', 'requester', 'creation_info')
+    """
+    A requested track. Tracks are queued as soon as they are requested, the resolver looks up their info in the
+    background and their stream is only opened just before they are played.
+    """
 
-    def __init__(self, source: YTDLSource, creation_info: str):
-        self.source = source
-        self.requester = source.requester
+    __slots__ = ('ctx', 'requester', 'creation_info', 'source_type', 'info', 'source', 'resolution', 'lookup', 'opening', 'cancelled')
+
+    def __init__(self, ctx: commands.Context, creation_info: str, source_type=YTDLSource):
+        self.ctx = ctx
+        self.requester = ctx.author
         self.creation_info = creation_info
+        self.source_type = source_type
+        self.info = None
+        self.source = None
+        self.resolution = asyncio.get_event_loop().create_future()
+        self.lookup = None
+        self.opening = None
+        self.cancelled = False
+
+    def get_title(self):
+        return self.info['title'] if self.info is not None else self.creation_info
+
+    def get_url(self):
+        return self.info['webpage_url'] if self.info is not None else None
+
+    def get_duration(self):
+        return self.info.get('duration') if self.info is not None else None
+
+    def set_info(self, info):
+        self.info = info
+        if not self.resolution.done():
+            self.resolution.set_result(info)
+
+    def set_error(self, error):
+        if not self.resolution.done():
+            self.resolution.set_exception(error)
+
+            # Whoever plays the track finds out about it, there is no need for asyncio to complain as well
+            self.resolution.exception()
+
+    def set_lookup(self, lookup):
+        self.lookup = lookup
+
+    def is_cancelled(self):
+        return self.cancelled
+
+    async def open(self, volume, cached=True):
+        """
+        Waits for the track to be resolved and opens its stream, only the first call does any work. Returns False if
+        the track could not be played.
+        """
+        if self.opening is None:
+            self.opening = asyncio.get_event_loop().create_task(self.__open(volume, cached))
+
+        # A prefetch being cancelled mustn't take the open down with it
+        return await asyncio.shield(self.opening)
+
+    async def reopen(self, volume, cached=True):
+        # Played again on repeat, which is when a track is most likely to have just made it into the opus cache
+        cached_source = self.__open_cached(self.info, volume) if cached else None
+        if cached_source is not None:
+            self.source.cleanup()
+            self.source = cached_source
+
+        # The volume is baked into cached tracks, so a change means going back to the original
+        elif isinstance(self.source, CachedOpusSource) and self.source.cached_volume != volume:
+            self.source.cleanup()
+            self.source = await self.source_type.from_info(self.ctx, self.info)
+
+        else:
+            await self.source.recreate()
+
+        # Either may have had to look the stream url up again
+        self.info = self.source.data
+
+    async def __open(self, volume, cached):
+        # The resolver has already told the requester why it couldn't be found
+        try:
+            info = await self.resolution
+        except Exception:
+            return False
+
+        try:
+            self.source = self.__open_cached(info, volume) if cached else None
+            if self.source is None:
+                self.source = await self.source_type.from_info(self.ctx, info)
+                self.info = self.source.data
+
+            # Taken out of the playlist whilst we were opening it
+            if self.cancelled:
+                self.source.cleanup()
+                return False
+
+            return True
+
+        except SourceError as e:
+            await send_message(self.ctx, "I encountered the following issue: {} - when trying to play your request".format(str(e)))
+            return False
+
+    def __open_cached(self, info, volume):
+        opus_cache = get_opus_cache()
+        return opus_cache.open(self.ctx, self.source_type, info, volume) if opus_cache is not None else None
+
+    def close(self):
+        self.cancelled = True
+        if self.lookup is not None and not self.lookup.done():
+            self.lookup.cancel()
+        if self.source is not None:
+            self.source.cleanup()
 
     def create_embed(self):
         embed = (discord.Embed(title='Now playing',
@@ -82,16 +203,22 @@ class Playlist(asyncio.Queue):
         self._wakeup_next(self._getters)
 
     def clear(self):
+        for track in self._queue:
+            track.close()
         self._queue.clear()
 
     def shuffle(self):
         random.shuffle(self._queue)
 
     def remove(self, index: int):
+        self._queue[index].close()
         del self._queue[index]
 
 
 class AudioPlayer:
+    # Cached tracks are already opus, so can only be used when the track is the only thing being played
+    use_opus_cache = True
+
     def __init__(self, engine):
         self.engine = engine
         self.player = self.engine.loop.create_task(self.audio_player_task())
@@ -101,6 +228,7 @@ class AudioPlayer:
         self.voice_channel = None
         self.next = asyncio.Event()
         self.playlist = Playlist()
+        self.prefetch = None
         self.volume = 0.5
         self.info = None
 
@@ -129,6 +257,10 @@ class AudioPlayer:
     def is_playing(self):
         return self.voice_channel is not None and self.voice_channel.is_playing() and self.current_track is not None
 
+    def is_volume_fixed(self):
+        # Cached tracks have their volume baked in, a change only applies from the next track
+        return self.is_playing and isinstance(self.current_track.source, CachedOpusSource)
+
     async def audio_player_task(self):
         try:
             while True:
@@ -140,20 +272,48 @@ class AudioPlayer:
                             self.current_track = await self.playlist.get()
 
                     except asyncio.TimeoutError:
+                        # Still playing something that isn't in the playlist
+                        if not self.is_idle():
+                            continue
+
                         self.engine.loop.create_task(self.stop())
                         self.exists = False
                         return
+
+                    # Usually already opened by the prefetch, otherwise we wait for it here
+                    if not await self.current_track.open(self.volume, cached=self.use_opus_cache):
+                        continue
                 else:
-                    await self.current_track.source.recreate()
+                    await self.current_track.reopen(self.volume, cached=self.use_opus_cache)
 
                 self.current_track.source.volume = self.volume
-                self.voice_channel.play(self.current_track.source, after=self.play_next_track)
+                self.start_track(self.current_track)
+                self.schedule_prefetch(self.current_track.get_duration())
                 await self.info.send(embed=self.current_track.create_embed())
                 await self.next.wait()
 
         except:
             print("Error in audio loop")
 
+    def schedule_prefetch(self, duration):
+        # Open the next track's stream shortly before this one ends so it can start straight away
+        if self.prefetch is not None:
+            self.prefetch.cancel()
+
+        delay = max(duration - PREFETCH_LEAD, 0) if duration else 0
+        self.prefetch = self.engine.loop.create_task(self.prefetch_next_track(delay))
+
+    async def prefetch_next_track(self, delay):
+        await asyncio.sleep(delay)
+        if len(self.playlist) > 0 and not self.loop:
+            await self.playlist[0].open(self.volume, cached=self.use_opus_cache)
+
+    def start_track(self, track):
+        self.voice_channel.play(track.source, after=self.play_next_track)
+
+    def is_idle(self):
+        return True
+
     def play_next_track(self, error=None):
         if error:
             raise BardError(str(error))
@@ -167,6 +327,8 @@ class AudioPlayer:
             self.voice_channel.stop()
 
     async def stop(self):
+        if self.prefetch is not None:
+            self.prefetch.cancel()
         self.playlist.clear()
 
         if self.voice_channel:
@@ -177,7 +339,116 @@ class AudioPlayer:
         self.player.cancel()
 
 
+class AmbiancePlayer(AudioPlayer):
+    """
+    An audio player that mixes looping ambient layers (i.e. rain under tavern chatter) with its playlist, which plays
+    as a layer of its own. Everything goes out through a single mixer on the one voice connection.
+    """
+
+    use_opus_cache = False
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        self.mixer = AudioMixer(engine.loop)
+
+        # layer name -> track / volume, kept here as a layer drops out of the mixer whilst it is being looped
+        self.layer_tracks = dict()
+        self.layer_volumes = dict()
+
+    def start_track(self, track):
+        self.mixer.add_layer(PLAYLIST_LAYER, track.source, after=lambda layer: self.play_next_track())
+        self.ensure_mixing()
+
+    def is_idle(self):
+        return len(self.layer_tracks) == 0
+
+    def skip(self):
+        self.mixer.remove_layer(PLAYLIST_LAYER)
+
+    def ensure_mixing(self):
+        # The mixer stops once it runs out of layers, so it is restarted whenever one is added
+        if self.voice_channel is not None and not self.voice_channel.is_playing() and not self.voice_channel.is_paused():
+            self.voice_channel.play(self.mixer)
+
+    def get_layers(self):
+        return [(name, track, self.layer_volumes[name]) for name, track in self.layer_tracks.items()]
+
+    def add_layer(self, name, track, volume):
+        self.remove_layer(name)
+        self.layer_tracks[name] = track
+        self.layer_volumes[name] = volume
+        self.engine.loop.create_task(self.__open_layer(name, track))
+
+    def remove_layer(self, name):
+        track = self.layer_tracks.pop(name, None)
+        if track is None:
+            return False
+
+        del self.layer_volumes[name]
+        track.close()
+        self.mixer.remove_layer(name)
+        return True
+
+    def set_layer_volume(self, name, volume):
+        if name not in self.layer_tracks:
+            return False
+
+        self.layer_volumes[name] = volume
+        layer = self.mixer.get_layer(name)
+        if layer is not None:
+            layer.source.volume = volume
+        return True
+
+    async def stop(self):
+        for name in list(self.layer_tracks):
+            self.remove_layer(name)
+        self.mixer.clear()
+        await super().stop()
+
+    async def __open_layer(self, name, track):
+        # The resolver has already told the requester why it couldn't be found
+        try:
+            info = await track.resolution
+            source = await track.source_type.from_info(track.ctx, info)
+            track.info = source.data
+
+        except SourceError as e:
+            self.__drop_layer(name, track)
+            return await send_message(track.ctx, "I encountered the following issue: {} - when trying to play your request".format(str(e)))
+
+        except Exception:
+            return self.__drop_layer(name, track)
+
+        # Removed or replaced whilst we were opening it
+        if self.layer_tracks.get(name) is not track:
+            return source.cleanup()
+
+        track.source = source
+        source.volume = self.layer_volumes[name]
+        self.mixer.add_layer(name, source, after=functools.partial(self.__layer_finished, track), min_recording=MIN_LOOP_FRAMES, max_recording=MAX_LOOP_FRAMES)
+        self.ensure_mixing()
+
+    def __layer_finished(self, track, layer):
+        if self.layer_tracks.get(layer.name) is not track:
+            return
+
+        # Ambient layers loop until they are removed, unless they stop almost as soon as they start
+        if layer.frames < MIN_LOOP_FRAMES:
+            self.__drop_layer(layer.name, track)
+            self.engine.loop.create_task(send_message(track.ctx, "The layer `" + layer.name + "` stopped straight away so it won't be repeated."))
+            return
+
+        self.engine.loop.create_task(self.__open_layer(layer.name, track))
+
+    def __drop_layer(self, name, track):
+        if self.layer_tracks.get(name) is track:
+            del self.layer_tracks[name]
+            del self.layer_volumes[name]
+
+
 class AudioCog(DnDiscordCog):
+    player_type = AudioPlayer
+
     def __init__(self, engine, command_prefix, audio_bot_type):
         super().__init__(engine)
 
@@ -196,6 +467,8 @@ class AudioCog(DnDiscordCog):
         self.notify_command.name = self.command_prefix + ":notify"
         self.play_now_command.name = self.command_prefix + ":play_now"
         self.play_command.name = self.command_prefix + ":play"
+        self.play_local_command.name = self.command_prefix + ":play_local"
+        self.library_command.name = self.command_prefix + ":library"
         self.pause_command.name = self.command_prefix + ":pause"
         self.resume_command.name = self.command_prefix + ":resume"
         self.next_command.name = self.command_prefix + ":next"
@@ -222,7 +495,7 @@ class AudioCog(DnDiscordCog):
             return self.audio_players[guild_id]
 
         # Build a new audio player
-        audio_player = AudioPlayer(self.engine)
+        audio_player = self.player_type(self.engine)
         self.audio_players[guild_id] = audio_player
         return audio_player
 
@@ -364,20 +637,12 @@ class AudioCog(DnDiscordCog):
         if not audio_player.voice_channel:
             return await send_message(ctx, "Please summon the: " + self.audio_bot_type + " to a voice channel first.")
 
-        # Finding a valid thing to play can take some time
-        async with ctx.typing():
-            try:
-                # Create a youtube-dl source
-                source = await YTDLSource.create_source(ctx, info, loop=self.engine.loop)
-
-            except SourceError as e:
-                return await send_message(ctx, "I encountered the following issue: {} - when trying to play your request".format(str(e)))
-
-            else:
-                track = Track(source, info)
-                await audio_player.play_now(track)
-                audio_player.skip()
-                await send_message(ctx, "Playing: ", embed=track.create_embed())
+        # The track is looked up in the background, the player waits for it when it reaches the front
+        track = Track(ctx, info)
+        get_track_resolver().submit(track)
+        await audio_player.play_now(track)
+        audio_player.skip()
+        await send_message(ctx, "Playing: `" + info + "` as soon as it has been found.")
 
     @commands.command(name="audio_player:play")
     async def play_command(self, ctx: commands.Context, *, info: str):
@@ -406,19 +671,83 @@ class AudioCog(DnDiscordCog):
         if not audio_player.voice_channel:
             return await send_message(ctx, "Please summon the: " + self.audio_bot_type + " to a voice channel first.")
 
-        # Finding a valid thing to play can take some time
-        async with ctx.typing():
-            try:
-                # Create a youtube-dl source
-                source = await YTDLSource.create_source(ctx, info, loop=self.engine.loop)
+        # The track is looked up in the background whilst it waits in the playlist
+        track = Track(ctx, info)
+        get_track_resolver().submit(track)
+        await audio_player.playlist.put(track)
+        await send_message(ctx, "The following song will be played when it comes up in the playlist: `" + info + "`")
 
-            except SourceError as e:
-                return await send_message(ctx, "I encountered the following issue: {} - when trying to play your request".format(str(e)))
+    @commands.command(name="audio_player:play_local")
+    async def play_local_command(self, ctx: commands.Context, *, info: str):
+        """
+        This command adds the best match for the provided keywords (or path) in the local music library to the playlist
+
+        :param ctx: The invocation context
+        :param info: The path within the library or keywords associated with the track
+        :return:
+        """
+        # Check if we the caller is a game master
+        permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, self.command_prefix + ":play", permissions_level=PermissionLevel.GAME_MASTER)
+        if not permission:
+
+            # Handle the special case where a game was not actually running - if that's the case check for a couple of special roles
+            if reason == "You cannot do this as there is no game running in your guild.":
+                permission, reason = await self.engine.get_permission_handler().check_guild_permissions_for_user(ctx, self.command_prefix + ":play", permissions_level=PermissionLevel.GAME_MASTER, elevated_roles=["Bard"])
+                if not permission:
+                    return await send_message(ctx, reason)
 
             else:
-                track = Track(source, info)
-                await audio_player.playlist.put(track)
-                await send_message(ctx, "The following song will be played when it comes up in the playlist: ", embed=track.create_embed())
+                return await send_message(ctx, reason)
+
+        # Check that we have an audio player and that the audio player has been summoned
+        audio_player = self.get_audio_player_for_context(ctx)
+        if not audio_player.voice_channel:
+            return await send_message(ctx, "Please summon the: " + self.audio_bot_type + " to a voice channel first.")
+
+        # Local tracks are found in the catalogue, but go through the resolver so they keep their place in the playlist
+        track = Track(ctx, info, source_type=LocalSource)
+        get_track_resolver().submit(track)
+        await audio_player.playlist.put(track)
+        await send_message(ctx, "The following track from the local library will be played when it comes up in the playlist: `" + info + "`")
+
+    @commands.command(name="audio_player:library")
+    async def library_command(self, ctx: commands.Context, *, query: str = ""):
+        """
+        Searches the local music library
+
+        :param ctx: The invocation context
+        :param query: Keywords to search titles, tags and paths for
+        :return:
+        """
+        # Check if we the caller is a game master
+        permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, self.command_prefix + ":library", permissions_level=PermissionLevel.GAME_MASTER)
+        if not permission:
+
+            # Handle the special case where a game was not actually running - if that's the case check for a couple of special roles
+            if reason == "You cannot do this as there is no game running in your guild.":
+                permission, reason = await self.engine.get_permission_handler().check_guild_permissions_for_user(ctx, self.command_prefix + ":library", permissions_level=PermissionLevel.GAME_MASTER, elevated_roles=["Bard"])
+                if not permission:
+                    return await send_message(ctx, reason)
+
+            else:
+                return await send_message(ctx, reason)
+
+        music_library = get_music_library()
+        if music_library is None:
+            return await send_message(ctx, "There is no local music library set up.")
+
+        # Without a query just say how big the library is
+        if not query:
+            return await send_message(ctx, "The local music library has " + str(music_library.get_statistics()["tracks"]) + " tracks.")
+
+        results = music_library.search(query)
+        if not results:
+            return await send_message(ctx, "Nothing in the local music library matches: " + query)
+
+        long_message = LongMessage()
+        for result in results:
+            long_message.add(result["webpage_url"] + " - " + result["title"] + (" (" + LocalSource.parse_duration(result["duration"]) + ")" if result["duration"] else ""))
+        return await send_message(ctx, long_message)
 
     @commands.command(name="audio_player:pause")
     async def pause_command(self, ctx: commands.Context):
@@ -540,7 +869,7 @@ class AudioCog(DnDiscordCog):
             audio_player.loop = False
 
         audio_player.playlist.clear()
-        audio_player.voice_channel.stop()
+        audio_player.skip()
         return await send_message(ctx, "The " + self.audio_bot_type + " has been stopped and the playlist cleared.")
 
     @commands.command(name="audio_player:volume")
@@ -583,6 +912,8 @@ class AudioCog(DnDiscordCog):
 
         # Set the volume and inform
         audio_player.volume = volume / 100
+        if audio_player.is_volume_fixed():
+            return await send_message(ctx, "The " + self.audio_bot_type + "'s volume is set to: " + str(audio_player.volume * 100) + "%, this track is played at a fixed volume so the change applies from the next track.")
         return await send_message(ctx, "The " + self.audio_bot_type + "'s volume is set to: " + str(audio_player.volume * 100) + "%")
 
     @commands.command(name="audio_player:repeat")
@@ -689,6 +1020,6 @@ class AudioCog(DnDiscordCog):
         # Format the embed
         queue = ""
         for i, track in enumerate(audio_player.playlist[start:end], start=start):
-            queue += "`{0}.` [**{1.source.title}**]({1.source.url})\n".format(i + 1, track)
+            queue += "`{0}.` [**{1}**]({2})\n".format(i + 1, track.get_title(), track.get_url() or "")
         embed = (discord.Embed(description="`**{} tracks: **\n\n`".format(len(audio_player.playlist), queue)).set_footer(text="`Viewing page {}/{}`".format(page, pages)))
         return await ctx.send(embed=embed)
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from new_implementation.audio.sources.source import SourceError
+from new_implementation.core.instrumentation import Histogram
+
+
+class ExtractionQueueFull(SourceError):
+    pass
+
+
+class ExtractionTimeout(SourceError):
+    pass
+
+
+class ExtractionJob:
+    __slots__ = ("guild_id", "function", "args", "future", "queued_at", "started_at")
+
+    def __init__(self, guild_id, function, args, future):
+        self.guild_id = guild_id
+        self.function = function
+        self.args = args
+        self.future = future
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+
+
+class ExtractionExecutor:
+    """
+    A thread pool of its own for youtube-dl extraction, so a burst of lookups can't hold up other blocking work.
+
+    Every guild gets its own queue and free workers take jobs from the guilds in turn, so one guild queueing up a
+    whole album doesn't hold everyone else up. Queues are bounded per guild and overall. A job whose caller gives up
+    (i.e. it times out or is cancelled) is dropped if it hasn't started yet; one that has started can't be stopped, but
+    its result is thrown away.
+    """
+
+    def __init__(self, max_workers=4, max_queued_per_guild=10, max_queued=200, timeout=60):
+        self.max_workers = max_workers
+        self.max_queued_per_guild = max_queued_per_guild
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dndiscord-extraction")
+        self.queues = OrderedDict()
+        self.queued = 0
+        self.running = 0
+
+        # Metrics
+        self.queue_wait = Histogram()
+        self.extraction_time = Histogram()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.timed_out = 0
+
+    def configure(self, max_workers=None, max_queued_per_guild=None, max_queued=None, timeout=None):
+        if max_workers is not None and max_workers != self.max_workers:
+            self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dndiscord-extraction")
+            self.max_workers = max_workers
+        if max_queued_per_guild is not None:
+            self.max_queued_per_guild = max_queued_per_guild
+        if max_queued is not None:
+            self.max_queued = max_queued
+        if timeout is not None:
+            self.timeout = timeout
+
+    async def run(self, guild_id, function, *args, timeout=None):
+        queue = self.queues.get(guild_id)
+        if self.queued >= self.max_queued or (queue is not None and len(queue) >= self.max_queued_per_guild):
+            self.rejected += 1
+            raise ExtractionQueueFull('There are too many tracks being looked up right now, please try again shortly')
+
+        if queue is None:
+            queue = deque()
+            self.queues[guild_id] = queue
+
+        job = ExtractionJob(guild_id, function, args, asyncio.get_event_loop().create_future())
+        queue.append(job)
+        self.queued += 1
+        self.__dispatch()
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout if timeout is not None else self.timeout)
+
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            self.__abandon(job)
+            raise ExtractionTimeout('Timed out whilst looking the track up')
+
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            self.__abandon(job)
+            raise
+
+    def get_statistics(self):
+        return {
+            "workers": self.max_workers,
+            "running": self.running,
+            "queued": self.queued,
+            "guilds_waiting": len(self.queues),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "queue_wait": self.queue_wait.get_snapshot(),
+            "extraction_time": self.extraction_time.get_snapshot()
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def __dispatch(self):
+        loop = asyncio.get_event_loop()
+        while self.running < self.max_workers and self.queues:
+            # Take the next job from the guild at the front, then send that guild to the back
+            guild_id, queue = next(iter(self.queues.items()))
+            job = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.queues.move_to_end(guild_id)
+            else:
+                del self.queues[guild_id]
+
+            job.started_at = time.perf_counter()
+            self.queue_wait.record(job.started_at - job.queued_at)
+            self.running += 1
+            loop.run_in_executor(self.executor, job.function, *job.args).add_done_callback(lambda future, job=job: self.__finished(job, future))
+
+    def __finished(self, job, future):
+        self.running -= 1
+        self.extraction_time.record(time.perf_counter() - job.started_at)
+        if future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+
+        # Unless whoever asked for it has stopped waiting
+        if not job.future.done():
+            if future.exception() is not None:
+                job.future.set_exception(future.exception())
+            else:
+                job.future.set_result(future.result())
+
+        self.__dispatch()
+
+    def __abandon(self, job):
+        if job.started_at is None:
+            queue = self.queues.get(job.guild_id)
+            if queue is not None:
+                queue.remove(job)
+                self.queued -= 1
+                if not queue:
+                    del self.queues[job.guild_id]
+
+        job.future.cancel()
+
+
+extraction_executor = None
+
+
+def configure_extraction_executor(max_workers=None, max_queued_per_guild=None, max_queued=None, timeout=None):
+    executor = get_extraction_executor()
+    executor.configure(max_workers=max_workers, max_queued_per_guild=max_queued_per_guild, max_queued=max_queued, timeout=timeout)
+    return executor
+
+
+def get_extraction_executor():
+    global extraction_executor
+    if extraction_executor is None:
+        extraction_executor = ExtractionExecutor()
+
+    return extraction_executor
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import re
+import time
+
+from new_implementation.data.data import DataAccessObject
+from shared.io_executor import get_io_executor
+
+# mutagen is optional - without it titles come from file names and durations are unknown
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+AUDIO_EXTENSIONS = {".mp3", ".ogg", ".opus", ".flac", ".wav", ".m4a", ".aac", ".webm"}
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def get_words(text):
+    return set(WORD_PATTERN.findall(text.lower()))
+
+
+def probe_file(path, name):
+    """
+    The title, tags and duration (in seconds, 0 if unknown) of an audio file.
+    """
+    title = os.path.splitext(os.path.basename(name))[0].replace("_", " ")
+    tags = [part for part in os.path.dirname(name).split(os.sep) if part]
+    duration = 0
+    if mutagen is not None:
+        try:
+            audio_file = mutagen.File(path, easy=True)
+            if audio_file is not None:
+                if audio_file.info is not None and getattr(audio_file.info, "length", None):
+                    duration = int(audio_file.info.length)
+                if audio_file.tags is not None:
+                    title = audio_file.tags.get("title", [title])[0]
+                    for key in ("artist", "album", "genre"):
+                        tags.extend(audio_file.tags.get(key, []))
+
+        # An unreadable file is still playable as far as we know, it just won't have any extra detail
+        except Exception:
+            pass
+
+    return {"title": title, "tags": tags, "duration": duration}
+
+
+def scan_directory(directory, entries):
+    """
+    Walks the directory and returns the catalogue entries for every audio file in it. Files whose modification time and
+    size match the existing entry are not probed again.
+    """
+    scanned = dict()
+    probed = 0
+    for path, directory_names, file_names in os.walk(directory):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            if os.path.splitext(file_name)[1].lower() not in AUDIO_EXTENSIONS:
+                continue
+
+            file_path = os.path.join(path, file_name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            name = os.path.relpath(file_path, directory)
+            entry = entries.get(name)
+            if entry is None or entry["mtime"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                entry = dict(probe_file(file_path, name), mtime=stat.st_mtime_ns, size=stat.st_size)
+                probed += 1
+            scanned[name] = entry
+
+    return scanned, probed
+
+
+class MusicLibrary:
+    """
+    A catalogue of the audio files in the music directory.
+
+    The catalogue (title, tags and duration of every file, keyed by its path within the directory) is kept by the
+    storage layer so starting up only means reading it back. It is then brought up to date in the background, only
+    files that are new or have a different modification time are looked at. Lookups go through a word index over
+    titles, tags and paths.
+    """
+
+    def __init__(self, directory, catalogue_path, persistence, rescan_interval=300):
+        self.directory = directory
+        self.catalogue_path = catalogue_path
+        self.persistence = persistence
+        self.rescan_interval = rescan_interval
+        self.entries = dict()
+        self.words = dict()
+        self.rescan_task = None
+
+        # Statistics
+        self.scans = 0
+        self.probed = 0
+
+    async def start(self):
+        tree = await self.persistence.load_raw(self.catalogue_path)
+        if isinstance(tree, dict):
+            self.__set_entries(tree)
+
+        if self.rescan_task is None:
+            self.rescan_task = asyncio.get_event_loop().create_task(self.__run_rescans())
+
+    def stop(self):
+        if self.rescan_task is not None:
+            self.rescan_task.cancel()
+            self.rescan_task = None
+
+    async def rescan(self):
+        entries, probed = await get_io_executor().run(scan_directory, self.directory, self.entries)
+        self.scans += 1
+        self.probed += probed
+
+        # Nothing new, removed or modified
+        if probed == 0 and entries.keys() == self.entries.keys():
+            return False
+
+        self.__set_entries(entries)
+        dao = DataAccessObject()
+        dao.set_payload(entries)
+        await self.persistence.save(self.catalogue_path, dao)
+        return True
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        return self.__get_info(name, entry) if entry is not None else None
+
+    def search(self, query, limit=10):
+        # Every word of the query has to match, better matches have fewer other words in them
+        words = get_words(query)
+        if not words:
+            return list()
+
+        names = None
+        for word in words:
+            matches = self.words.get(word, set())
+            names = matches if names is None else names & matches
+            if not names:
+                return list()
+
+        ranked = sorted(names, key=lambda name: (len(get_words(self.entries[name]["title"])), name))
+        return [self.__get_info(name, self.entries[name]) for name in ranked[:limit]]
+
+    def find(self, query):
+        # An exact path within the library wins over a search
+        info = self.get(query)
+        if info is not None:
+            return info
+
+        results = self.search(query, limit=1)
+        return results[0] if results else None
+
+    def get_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get_statistics(self):
+        return {
+            "tracks": len(self.entries),
+            "words": len(self.words),
+            "scans": self.scans,
+            "probed": self.probed
+        }
+
+    def __set_entries(self, entries):
+        words = dict()
+        for name, entry in entries.items():
+            for word in get_words(entry["title"] + " " + " ".join(entry["tags"]) + " " + os.path.splitext(name)[0]):
+                words.setdefault(word, set()).add(name)
+
+        self.entries = entries
+        self.words = words
+
+    def __get_info(self, name, entry):
+        # In the shape sources expect from youtube-dl
+        return {
+            "title": entry["title"],
+            "tags": entry["tags"],
+            "duration": entry["duration"],
+            "uploader": "Local library",
+            "upload_date": time.strftime("%Y%m%d", time.localtime(entry["mtime"] / 1e9)),
+            "webpage_url": name,
+            "url": self.get_path(name)
+        }
+
+    async def __run_rescans(self):
+        while True:
+            try:
+                await self.rescan()
+            except Exception as e:
+                print("Music library scan failed: " + str(e))
+
+            await asyncio.sleep(self.rescan_interval)
+
+
+music_library = None
+
+
+def configure_music_library(directory, catalogue_path, persistence, rescan_interval=None):
+    global music_library
+    if music_library is not None:
+        music_library.stop()
+
+    music_library = MusicLibrary(directory, catalogue_path, persistence)
+    if rescan_interval is not None:
+        music_library.rescan_interval = rescan_interval
+
+    return music_library
+
+
+def get_music_library():
+    return music_library
@@ -0,0 +1,198 @@
+import threading
+
+import discord
+from discord.opus import Encoder
+
+# numpy is optional - without it frames are mixed with audioop, as discord's own volume transformer does
+try:
+    import numpy
+except ImportError:
+    numpy = None
+    import audioop
+
+FRAME_SIZE = Encoder.FRAME_SIZE
+SILENCE = b"\x00" * FRAME_SIZE
+
+
+def read_frame(source):
+    """
+    The next 20ms of PCM from the source and the volume to play it at. A volume transformer's own scaling is skipped,
+    its volume is applied as part of the mix instead.
+    """
+    if isinstance(source, discord.PCMVolumeTransformer):
+        return source.original.read(), source.volume
+
+    return source.read(), 1.0
+
+
+def get_volume(source):
+    return source.volume if isinstance(source, discord.PCMVolumeTransformer) else 1.0
+
+
+def mix_frames(frames, volumes):
+    """
+    Mixes equally sized 16 bit PCM frames together, each scaled by its volume, clipping the result.
+    """
+    if numpy is not None:
+        # One row per frame, the whole mix is then a single weighted sum down the rows
+        samples = numpy.frombuffer(b"".join(frames), dtype=numpy.int16).reshape(len(frames), -1)
+        mixed = numpy.dot(numpy.asarray(volumes, dtype=numpy.float32), samples)
+        return numpy.clip(mixed, -32768, 32767).astype(numpy.int16).tobytes()
+
+    mixed = None
+    for frame, volume in zip(frames, volumes):
+        scaled = audioop.mul(frame, 2, volume)
+        mixed = scaled if mixed is None else audioop.add(mixed, scaled, 2)
+    return mixed
+
+
+class MixerLayer:
+    __slots__ = ("name", "source", "after", "frames", "recording", "min_recording", "max_recording", "position")
+
+    def __init__(self, name, source, after=None, min_recording=1, max_recording=0):
+        self.name = name
+        self.source = source
+        self.after = after
+        self.frames = 0
+        self.recording = list() if max_recording > 0 else None
+        self.min_recording = min_recording
+        self.max_recording = max_recording
+        self.position = None
+
+    def can_replay(self):
+        return self.recording is not None and len(self.recording) >= self.min_recording
+
+    def is_replaying(self):
+        return self.position is not None
+
+    def replay_frame(self):
+        frame = self.recording[self.position]
+        self.position = (self.position + 1) % len(self.recording)
+        return frame
+
+    def record_frame(self, frame):
+        if self.recording is None:
+            return
+
+        # Too long to keep in memory, it is opened again instead
+        if len(self.recording) >= self.max_recording:
+            self.recording = None
+        else:
+            self.recording.append(frame)
+
+
+class AudioMixer(discord.AudioSource):
+    """
+    Plays any number of layers over a single voice connection. Every 20ms the voice client reads one frame from each
+    layer, scales them by their volumes and sums them into the one frame it sends.
+
+    Layers are added and removed from the bot's loop whilst the voice client reads from its own thread. A layer that
+    runs out is removed and its after callback is called back on the loop with the layer. Stopping the voice client
+    doesn't touch the layers, use clear for that.
+
+    A layer added with max_recording keeps its first play in memory, up to that many frames. If it runs out before
+    then (having played at least min_recording frames) it is played again from memory until it is removed, its source
+    is closed and its after callback is never called.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.layers = dict()
+        self.lock = threading.Lock()
+
+    def add_layer(self, name, source, after=None, min_recording=1, max_recording=0):
+        if source.is_opus():
+            raise ValueError("Opus sources can't be mixed")
+
+        with self.lock:
+            replaced = self.layers.pop(name, None)
+            self.layers[name] = MixerLayer(name, source, after, min_recording, max_recording)
+
+        if replaced is not None:
+            self.__end(replaced)
+
+    def remove_layer(self, name):
+        with self.lock:
+            layer = self.layers.pop(name, None)
+
+        if layer is not None:
+            self.__end(layer)
+
+        return layer is not None
+
+    def get_layer(self, name):
+        return self.layers.get(name)
+
+    def get_layers(self):
+        with self.lock:
+            return list(self.layers.values())
+
+    def has_layers(self):
+        return len(self.layers) > 0
+
+    def clear(self):
+        with self.lock:
+            layers = list(self.layers.values())
+            self.layers.clear()
+
+        for layer in layers:
+            self.__end(layer)
+
+    def read(self):
+        layers = self.get_layers()
+        if not layers:
+            return b""
+
+        frames = list()
+        volumes = list()
+        for layer in layers:
+            if layer.is_replaying():
+                frame, volume = layer.replay_frame(), get_volume(layer.source)
+
+            else:
+                frame, volume = read_frame(layer.source)
+                if not frame:
+                    if not layer.can_replay():
+                        self.__finish(layer)
+                        continue
+
+                    # The whole layer is in memory, there is no need to open it again to loop it
+                    layer.source.cleanup()
+                    layer.position = 0
+                    frame = layer.replay_frame()
+
+                else:
+                    # The last frame of a stream can be short
+                    if len(frame) < FRAME_SIZE:
+                        frame = frame + SILENCE[len(frame):]
+                    layer.record_frame(frame)
+
+            layer.frames += 1
+            frames.append(frame)
+            volumes.append(volume)
+
+        # Everything ended this frame, the next read ends playback unless something was added in the meantime
+        if not frames:
+            return SILENCE
+
+        return mix_frames(frames, volumes)
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        pass
+
+    def __finish(self, layer):
+        with self.lock:
+            # Removed (or replaced) whilst we were reading it
+            if self.layers.get(layer.name) is not layer:
+                return
+            del self.layers[layer.name]
+
+        self.__end(layer)
+
+    def __end(self, layer):
+        layer.source.cleanup()
+        if layer.after is not None:
+            self.loop.call_soon_threadsafe(layer.after, layer)
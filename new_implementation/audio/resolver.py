@@ -0,0 +1,74 @@
+import asyncio
+import traceback
+
+from new_implementation.audio.sources.source import SourceError
+from new_implementation.utils import utils
+from new_implementation.utils.message import send_message
+
+
+class TrackResolver:
+    """
+    Looks requested tracks up in the background so they can be queued straight away. Every lookup goes straight to the
+    extraction executor under the track's guild, so guilds take turns and a guild asking for too much at once is
+    turned away. Closing a track that is still being looked up drops its lookup.
+    """
+
+    def __init__(self):
+        self.lookups = set()
+
+        # Statistics
+        self.resolved = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def submit(self, track):
+        lookup = asyncio.get_event_loop().create_task(self.__resolve(track))
+        self.lookups.add(lookup)
+        lookup.add_done_callback(self.lookups.discard)
+        track.set_lookup(lookup)
+
+    def get_statistics(self):
+        return {
+            "looking_up": len(self.lookups),
+            "resolved": self.resolved,
+            "failed": self.failed,
+            "cancelled": self.cancelled
+        }
+
+    async def stop(self):
+        lookups = list(self.lookups)
+        for lookup in lookups:
+            lookup.cancel()
+        await asyncio.gather(*lookups, return_exceptions=True)
+
+    async def __resolve(self, track):
+        try:
+            track.set_info(await track.source_type.fetch_info(track.creation_info, guild_id=utils.get_guild_id_from_context(track.ctx)))
+            self.resolved += 1
+
+        except asyncio.CancelledError:
+            # Removed from the playlist whilst it was waiting, there is nobody left to tell
+            self.cancelled += 1
+            track.set_error(SourceError('The track was removed before it could be found'))
+            raise
+
+        except SourceError as e:
+            self.failed += 1
+            track.set_error(e)
+            await send_message(track.ctx, "I encountered the following issue: {} - when trying to play your request".format(str(e)))
+
+        except Exception as e:
+            self.failed += 1
+            track.set_error(e)
+            traceback.print_exc()
+
+
+track_resolver = None
+
+
+def get_track_resolver():
+    global track_resolver
+    if track_resolver is None:
+        track_resolver = TrackResolver()
+
+    return track_resolver
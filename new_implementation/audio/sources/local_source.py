@@ -0,0 +1,49 @@
+import asyncio
+
+import discord
+from discord.ext import commands
+
+from new_implementation.audio.library import get_music_library
+from new_implementation.audio.sources.source import Source, SourceError
+
+
+class LocalSourceError(SourceError):
+    pass
+
+
+class LocalSource(Source):
+    FFMPEG_OPTIONS = {
+        'options': '-vn',
+        'executable': 'D:/ffmpeg/bin/ffmpeg.exe'
+    }
+
+    def __init__(self, ctx: commands.Context, source: discord.FFmpegPCMAudio, *, data: dict, volume: float = 0.5):
+        super().__init__(ctx=ctx, source=source, data=data, volume=volume)
+
+    def __str__(self):
+        return '**{0.title}** from the local library'.format(self)
+
+    async def recreate(self):
+        self.original = discord.FFmpegPCMAudio(self.data['url'], **LocalSource.FFMPEG_OPTIONS)
+
+    @classmethod
+    async def create_source(cls, ctx: commands.Context, search: str, *, loop: asyncio.BaseEventLoop = None):
+        return await cls.from_info(ctx, await cls.fetch_info(search, loop=loop))
+
+    @classmethod
+    async def from_info(cls, ctx: commands.Context, info: dict):
+        # Local files don't expire, the info is always good to play
+        return cls(ctx, discord.FFmpegPCMAudio(info['url'], **cls.FFMPEG_OPTIONS), data=info)
+
+    @classmethod
+    async def fetch_info(cls, search: str, *, loop: asyncio.BaseEventLoop = None, guild_id=None):
+        # Everything we need is already in the catalogue, there is nothing to resolve over the network
+        music_library = get_music_library()
+        if music_library is None:
+            raise LocalSourceError('There is no local music library set up')
+
+        info = music_library.find(search)
+        if info is None:
+            raise LocalSourceError('Couldn\'t find anything in the local library that matches `{}`'.format(search))
+
+        return info
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import os
+import time
+import urllib.parse
+from collections import OrderedDict
+
+from new_implementation.data.persistence import write_bytes_atomically
+from shared.io_executor import get_io_executor
+
+# The parts of youtube-dl's info that sources use, the rest (formats, thumbnails etc.) is large and never read
+TRACK_FIELDS = (
+    "uploader", "uploader_url", "upload_date", "title", "thumbnail", "description", "duration", "tags", "webpage_url",
+    "view_count", "like_count", "dislike_count", "url"
+)
+
+# Leave a little time between looking a stream url up and ffmpeg actually opening it
+STREAM_EXPIRY_MARGIN = 300
+
+# How long a stream url is trusted for when its host doesn't say
+STREAM_TTL = 3 * 60 * 60
+
+
+def get_stream_expiry(info, resolved_at, stream_ttl):
+    # Youtube (and a few others) tell us exactly when their stream urls stop working
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(info.get("url") or "").query)
+    if "expire" in query:
+        try:
+            return min(int(query["expire"][0]) - STREAM_EXPIRY_MARGIN, resolved_at + stream_ttl)
+        except ValueError:
+            pass
+
+    return resolved_at + stream_ttl
+
+
+class TrackMetadataCache:
+    """
+    Disk backed cache of youtube-dl lookups.
+
+    Searches map onto the canonical (webpage) url of whatever they found and canonical urls map onto the track info.
+    Track info is kept until its stream url expires, after which only the stream url needs to be looked up again. The
+    cache is written in the background through the io executor whenever it changes.
+    """
+
+    def __init__(self, path, stream_ttl=STREAM_TTL, search_ttl=7 * 24 * 60 * 60, max_entries=5000):
+        self.path = path
+        self.stream_ttl = stream_ttl
+        self.search_ttl = search_ttl
+        self.max_entries = max_entries
+        self.searches = OrderedDict()
+        self.tracks = OrderedDict()
+        self.loaded = False
+
+        # Statistics
+        self.search_hits = 0
+        self.search_misses = 0
+        self.track_hits = 0
+        self.track_refreshes = 0
+
+    async def load(self):
+        if self.loaded:
+            return
+
+        contents = await get_io_executor().read(self.path, read_cache_file)
+        self.loaded = True
+        if contents is None:
+            return
+
+        now = time.time()
+        for search, (webpage_url, stored_at) in contents.get("searches", dict()).items():
+            if now - stored_at < self.search_ttl:
+                self.searches[search] = (webpage_url, stored_at)
+        for webpage_url, (info, resolved_at) in contents.get("tracks", dict()).items():
+            self.tracks[webpage_url] = (info, resolved_at)
+
+    async def get_webpage_url(self, search):
+        await self.load()
+
+        # Searching for a url we already know about
+        if search in self.tracks:
+            self.search_hits += 1
+            return search
+
+        entry = self.searches.get(search)
+        if entry is None or time.time() - entry[1] >= self.search_ttl:
+            self.search_misses += 1
+            return None
+
+        self.search_hits += 1
+        self.searches.move_to_end(search)
+        return entry[0]
+
+    async def get_track_info(self, webpage_url):
+        """
+        The cached info for the track, None if we don't know it or its stream url has expired.
+        """
+        await self.load()
+        entry = self.tracks.get(webpage_url)
+        if entry is None:
+            return None
+
+        info, resolved_at = entry
+        if time.time() >= get_stream_expiry(info, resolved_at, self.stream_ttl):
+            self.track_refreshes += 1
+            return None
+
+        self.track_hits += 1
+        self.tracks.move_to_end(webpage_url)
+        return dict(info, resolved_at=resolved_at)
+
+    def put_search(self, search, webpage_url):
+        self.searches[search] = (webpage_url, time.time())
+        self.searches.move_to_end(search)
+        self.__trim(self.searches)
+        self.__save()
+
+    def put_track(self, webpage_url, info):
+        self.tracks[webpage_url] = ({field: info[field] for field in TRACK_FIELDS if field in info}, time.time())
+        self.tracks.move_to_end(webpage_url)
+        self.__trim(self.tracks)
+        self.__save()
+
+    def get_statistics(self):
+        return {
+            "searches": len(self.searches),
+            "tracks": len(self.tracks),
+            "search_hits": self.search_hits,
+            "search_misses": self.search_misses,
+            "track_hits": self.track_hits,
+            "track_refreshes": self.track_refreshes
+        }
+
+    def __trim(self, entries):
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def __save(self):
+        # Writes are coalesced by the io executor, so a burst of lookups only writes the file once or twice
+        asyncio.get_event_loop().create_task(self.__write())
+
+    async def __write(self):
+        try:
+            await get_io_executor().write(self.path, self, encode_cache, write_cache_file, snapshot=snapshot_cache)
+        except Exception as e:
+            print("Could not save the youtube-dl metadata cache due to: " + str(e))
+
+
+def read_cache_file(path):
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, "rb") as cache_file:
+            return json.loads(cache_file.read())
+
+    # It is only a cache, a broken one is treated as an empty one
+    except ValueError:
+        return None
+
+
+def snapshot_cache(cache):
+    # Entries are replaced rather than changed, so copying the mappings is enough
+    return {"searches": dict(cache.searches), "tracks": dict(cache.tracks)}
+
+
+def encode_cache(snapshot):
+    return json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+
+
+def write_cache_file(path, data):
+    write_bytes_atomically(path, data)
+
+
+metadata_cache = None
+
+
+def configure_metadata_cache(path, stream_ttl=None, search_ttl=None):
+    global metadata_cache
+    metadata_cache = TrackMetadataCache(path)
+    if stream_ttl is not None:
+        metadata_cache.stream_ttl = stream_ttl
+    if search_ttl is not None:
+        metadata_cache.search_ttl = search_ttl
+
+    return metadata_cache
+
+
+def get_metadata_cache():
+    return metadata_cache
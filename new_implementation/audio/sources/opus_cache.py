@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import os
+import shlex
+
+import discord
+from discord.oggparse import OggStream
+
+CACHE_EXTENSION = ".opus"
+
+# Ogg Opus header packets, these describe the stream rather than being part of it
+HEADER_PACKETS = (b"OpusHead", b"OpusTags")
+
+# The volume tracks are cached at, the audio players' starting volume
+CACHE_VOLUME = 0.5
+
+
+class CachedOpusSource(discord.AudioSource):
+    """
+    Plays a track from the opus cache. The cached file is already Opus (at the volume it was cached for) so its
+    packets are handed to the voice client as they are, there is no ffmpeg process and no encoding.
+    """
+
+    def __init__(self, ctx, path, *, data: dict, volume: float = 0.5):
+        self.path = path
+        self.volume = volume
+        self.cached_volume = volume
+        self.requester = ctx.author
+        self.channel = ctx.channel
+        self.data = data
+
+        self.uploader = data.get('uploader')
+        self.uploader_url = data.get('uploader_url')
+        self.title = data.get('title')
+        self.thumbnail = data.get('thumbnail')
+        self.url = data.get('webpage_url')
+
+        self.file = None
+        self.packets = None
+        self.recreate_sync()
+
+    def __str__(self):
+        return '**{0.title}**'.format(self)
+
+    def recreate_sync(self):
+        self.cleanup()
+        self.file = open(self.path, "rb")
+        self.packets = OggStream(self.file).iter_packets()
+
+    async def recreate(self):
+        self.recreate_sync()
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        for packet in self.packets:
+            if not packet.startswith(HEADER_PACKETS):
+                return packet
+
+        return b''
+
+    def cleanup(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class OpusCache:
+    """
+    An on disk cache of tracks transcoded to Opus, capped at max_bytes.
+
+    A track is transcoded in the background once it has been played min_plays times. Cached files are keyed by the
+    source type and the source's id for the track. The volume is baked in, every track is cached once at the cache's
+    volume and is only played from the cache at that volume. Using a cached file touches its modification time and the
+    least recently used files are removed once the cache grows past its cap.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, min_plays=2, bitrate=128, max_transcodes=2, volume=CACHE_VOLUME):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.bitrate = bitrate
+        self.volume = volume
+        self.plays = dict()
+        self.transcodes = dict()
+        self.transcode_slots = asyncio.Semaphore(max_transcodes)
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.transcoded = 0
+        self.evictions = 0
+
+    def get_key(self, source_type, source_id):
+        return hashlib.sha1((source_type.__name__ + ":" + source_id).encode("utf-8")).hexdigest()
+
+    def is_cached_volume(self, volume):
+        return round(volume * 100) == round(self.volume * 100)
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    def open(self, ctx, source_type, info, volume):
+        """
+        A source playing the track straight from the cache, None if it isn't cached or is wanted at a different volume
+        to the one it was cached at. Every call counts as a play, so frequently played tracks are transcoded for next time.
+        """
+        key = self.get_key(source_type, info['webpage_url'])
+        path = self.get_path(key)
+        if self.is_cached_volume(volume):
+            try:
+                os.utime(path)
+                source = CachedOpusSource(ctx, path, data=info, volume=self.volume)
+                self.hits += 1
+                return source
+
+            except OSError:
+                pass
+
+        self.misses += 1
+
+        # Not cached, see if it's time it was
+        self.plays[key] = self.plays.get(key, 0) + 1
+        if self.plays[key] >= self.min_plays and key not in self.transcodes:
+            self.transcodes[key] = asyncio.get_event_loop().create_task(self.__transcode(key, source_type, info))
+
+        return None
+
+    def get_statistics(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "transcoding": len(self.transcodes),
+            "transcoded": self.transcoded,
+            "evictions": self.evictions
+        }
+
+    async def __transcode(self, key, source_type, info):
+        path = self.get_path(key)
+        temporary_path = path + ".tmp"
+        ffmpeg_options = source_type.FFMPEG_OPTIONS
+        args = shlex.split(ffmpeg_options.get('before_options', ''))
+        args.extend(('-i', info['url'], '-vn', '-map_metadata', '-1', '-af', 'volume=' + str(self.volume), '-c:a', 'libopus', '-ar', '48000', '-ac', '2', '-b:a', str(self.bitrate) + 'k', '-f', 'opus', '-loglevel', 'warning', '-y', temporary_path))
+
+        try:
+            async with self.transcode_slots:
+                os.makedirs(self.directory, exist_ok=True)
+                process = await asyncio.create_subprocess_exec(ffmpeg_options.get('executable', 'ffmpeg'), *args, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+                _, error = await process.communicate()
+                if process.returncode != 0:
+                    raise OSError("ffmpeg exited with " + str(process.returncode) + ": " + error.decode("utf-8", "replace").strip())
+
+            # Only complete files ever appear under the cache name
+            os.replace(temporary_path, path)
+            self.transcoded += 1
+            self.plays.pop(key, None)
+            await self.evict_over_capacity()
+
+        except Exception as e:
+            print("Could not add " + str(info.get('title')) + " to the opus cache due to: " + str(e))
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        finally:
+            del self.transcodes[key]
+
+    async def evict_over_capacity(self):
+        evicted = await asyncio.get_event_loop().run_in_executor(None, evict_least_recently_used, self.directory, self.max_bytes)
+        self.evictions += evicted
+
+
+def evict_least_recently_used(directory, max_bytes):
+    entries = list()
+    total = 0
+    for name in os.listdir(directory):
+        if not name.endswith(CACHE_EXTENSION):
+            continue
+
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+
+        entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total += stat.st_size
+
+    evicted = 0
+    for modification_time, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            continue
+
+        total -= size
+        evicted += 1
+
+    return evicted
+
+
+opus_cache = None
+
+
+def configure_opus_cache(directory, max_bytes=None, min_plays=None, volume=None):
+    global opus_cache
+    opus_cache = OpusCache(directory)
+    if max_bytes is not None:
+        opus_cache.max_bytes = max_bytes
+    if min_plays is not None:
+        opus_cache.min_plays = min_plays
+    if volume is not None:
+        opus_cache.volume = volume
+
+    return opus_cache
+
+
+def get_opus_cache():
+    return opus_cache
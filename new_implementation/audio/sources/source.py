@@ -36,6 +36,10 @@ class Source(discord.PCMVolumeTransformer):
     async def create_source(cls, ctx: commands.Context, search: str, *, loop: asyncio.BaseEventLoop = None):
         pass
 
+    @classmethod
+    async def from_info(cls, ctx: commands.Context, info: dict):
+        pass
+
     @staticmethod
     def parse_duration(duration: int):
         minutes, seconds = divmod(duration, 60)
@@ -1,11 +1,15 @@
 import asyncio
 import functools
+import time
 
 import discord
 import youtube_dl
 from discord.ext import commands
 
-from modules.harpers.sources.source import Source, SourceError
+from new_implementation.audio.extraction import get_extraction_executor
+from new_implementation.audio.sources.source import Source, SourceError
+from new_implementation.audio.sources.metadata_cache import get_metadata_cache, get_stream_expiry, STREAM_TTL
+from new_implementation.utils import utils
 
 # song downloader setup
 # Silence useless bug reports messages
@@ -45,19 +49,78 @@ class YTDLSource(Source):
 
     def __init__(self, ctx: commands.Context, source: discord.FFmpegPCMAudio, *, data: dict, volume: float = 0.5):
         super().__init__(ctx=ctx, source=source, data=data, volume=volume)
+        self.guild_id = utils.get_guild_id_from_context(ctx)
 
     def __str__(self):
         return '**{0.title}** by **{0.uploader}**'.format(self)
 
     async def recreate(self):
+        # Played again on repeat long enough after it was looked up for the stream url to have expired
+        if YTDLSource.is_stream_expired(self.data):
+            self.data = await YTDLSource.refresh_info(self.data['webpage_url'], self.guild_id)
+            self.stream_url = self.data.get('url')
+
         self.original = discord.FFmpegPCMAudio(self.data['url'], **YTDLSource.FFMPEG_OPTIONS)
 
     @classmethod
     async def create_source(cls, ctx: commands.Context, search: str, *, loop: asyncio.BaseEventLoop = None):
-        loop = loop or asyncio.get_event_loop()
+        info = await cls.fetch_info(search, loop=loop, guild_id=utils.get_guild_id_from_context(ctx))
+        return await cls.from_info(ctx, info)
+
+    @classmethod
+    async def from_info(cls, ctx: commands.Context, info: dict):
+        """
+        Opens the stream for a track that has already been looked up. The stream url is only looked up again if it has
+        expired since.
+        """
+        if cls.is_stream_expired(info):
+            info = await cls.refresh_info(info['webpage_url'], utils.get_guild_id_from_context(ctx))
+
+        return cls(ctx, discord.FFmpegPCMAudio(info['url'], **cls.FFMPEG_OPTIONS), data=info)
+
+    @staticmethod
+    def is_stream_expired(info: dict):
+        metadata_cache = get_metadata_cache()
+        stream_ttl = metadata_cache.stream_ttl if metadata_cache is not None else STREAM_TTL
+        return time.time() >= get_stream_expiry(info, info.get('resolved_at', 0), stream_ttl)
+
+    @classmethod
+    async def fetch_info(cls, search: str, *, loop: asyncio.BaseEventLoop = None, guild_id=None):
+        """
+        Looks up the track info (including the stream url) for the search without opening the stream. Lookups are
+        queued on the extraction executor under the guild that asked for them.
+        """
+        metadata_cache = get_metadata_cache()
+
+        # Repeat searches (and urls we have played before) don't need searching for again
+        webpage_url = await metadata_cache.get_webpage_url(search) if metadata_cache is not None else None
+        if webpage_url is None:
+            webpage_url = await cls.search(search, guild_id)
+            if metadata_cache is not None:
+                metadata_cache.put_search(search, webpage_url)
+
+        # Only the stream url is short lived, the rest of the info is reused until it expires
+        info = await metadata_cache.get_track_info(webpage_url) if metadata_cache is not None else None
+        if info is None:
+            info = await cls.refresh_info(webpage_url, guild_id)
+
+        return info
 
+    @classmethod
+    async def refresh_info(cls, webpage_url: str, guild_id=None):
+        info = await cls.resolve(webpage_url, guild_id)
+        info['resolved_at'] = time.time()
+
+        metadata_cache = get_metadata_cache()
+        if metadata_cache is not None:
+            metadata_cache.put_track(webpage_url, info)
+
+        return info
+
+    @classmethod
+    async def search(cls, search: str, guild_id=None):
         partial = functools.partial(cls.ytdl.extract_info, search, download=False, process=False)
-        data = await loop.run_in_executor(None, partial)
+        data = await get_extraction_executor().run(guild_id, partial)
 
         if data is None:
             raise YTDLError('Couldn\'t find anything that matches `{}`'.format(search))
@@ -74,9 +137,12 @@ class YTDLSource(Source):
             if process_info is None:
                 raise YTDLError('Couldn\'t find anything that matches `{}`'.format(search))
 
-        webpage_url = process_info['webpage_url']
+        return process_info['webpage_url']
+
+    @classmethod
+    async def resolve(cls, webpage_url: str, guild_id=None):
         partial = functools.partial(cls.ytdl.extract_info, webpage_url, download=False)
-        processed_info = await loop.run_in_executor(None, partial)
+        processed_info = await get_extraction_executor().run(guild_id, partial)
 
         if processed_info is None:
             raise YTDLError('Couldn\'t fetch `{}`'.format(webpage_url))
@@ -91,4 +157,4 @@ class YTDLSource(Source):
                 except IndexError:
                     raise YTDLError('Couldn\'t retrieve any matches for `{}`'.format(webpage_url))
 
-        return cls(ctx, discord.FFmpegPCMAudio(info['url'], **cls.FFMPEG_OPTIONS), data=info)
+        return info
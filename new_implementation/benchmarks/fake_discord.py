@@ -0,0 +1,162 @@
+import itertools
+
+"""
+
+Just enough of discord's guild, member, channel and context objects for commands to be driven without a gateway
+connection. Everything sent is counted rather than delivered.
+
+"""
+
+identifiers = itertools.count(1000)
+
+
+class FakePermissions:
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.id = next(identifiers)
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMessageable:
+    def __init__(self):
+        self.sent = 0
+        self.sent_characters = 0
+
+    async def send(self, content=None, embed=None):
+        self.sent += 1
+        self.sent_characters += len(content) if content else 0
+
+
+class FakeMember(FakeMessageable):
+    def __init__(self, name, roles=None, administrator=False):
+        super().__init__()
+        self.id = next(identifiers)
+        self.name = name
+        self.display_name = name
+        self.mention = "<@" + str(self.id) + ">"
+        self.roles = roles if roles is not None else list()
+        self.guild_permissions = FakePermissions(administrator)
+        self.voice = None
+        self.bot = False
+
+
+class FakeCategory:
+    def __init__(self, guild, name):
+        self.id = next(identifiers)
+        self.guild = guild
+        self.name = name
+
+
+class FakeTextChannel(FakeMessageable):
+    def __init__(self, guild, name, category=None):
+        super().__init__()
+        self.id = next(identifiers)
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.mention = "<#" + str(self.id) + ">"
+
+    async def edit(self, name=None, **kwargs):
+        if name is not None:
+            self.name = name
+
+    async def set_permissions(self, target, **kwargs):
+        return
+
+
+class FakeGuild:
+    def __init__(self, name):
+        self.id = next(identifiers)
+        self.name = name
+        self.default_role = FakeRole("@everyone")
+        self.roles = [self.default_role, FakeRole("@admin"), FakeRole("GameMaster"), FakeRole("Bard")]
+        self.members = list()
+        self.categories = list()
+        self.text_channels = list()
+        self.voice_channels = list()
+        self.voice_client = None
+
+    def get_role(self, name):
+        for role in self.roles:
+            if role.name == name:
+                return role
+        return None
+
+    def get_channel(self, channel_id):
+        for channel in self.text_channels:
+            if channel.id == channel_id:
+                return channel
+        return None
+
+    def get_member(self, member_id):
+        for member in self.members:
+            if member.id == member_id:
+                return member
+        return None
+
+    def add_member(self, name, role_names=(), administrator=False):
+        member = FakeMember(name, roles=[self.default_role] + [self.get_role(role_name) for role_name in role_names], administrator=administrator)
+        self.members.append(member)
+        return member
+
+    async def create_category(self, name, **kwargs):
+        category = FakeCategory(self, name)
+        self.categories.append(category)
+        return category
+
+    async def create_text_channel(self, name, category=None, **kwargs):
+        channel = FakeTextChannel(self, name, category=category)
+        self.text_channels.append(channel)
+        return channel
+
+
+class FakeCommand:
+    def __init__(self, command):
+        self.command = command
+        self.name = command.name
+        self.qualified_name = command.qualified_name
+
+    def __getattr__(self, item):
+        return getattr(self.command, item)
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+
+class FakeContext:
+    """
+    Stands in for commands.Context. The command being run is swapped in by the harness for every invocation.
+    """
+
+    def __init__(self, bot, guild, author, channel):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+        self.message = None
+        self.prefix = "!"
+        self.command = None
+        self.invoked_with = None
+        self.command_failed = False
+        self.voice_client = guild.voice_client if guild is not None else None
+
+    async def send(self, content=None, embed=None):
+        return await self.channel.send(content, embed=embed)
+
+    def typing(self):
+        return FakeTyping()
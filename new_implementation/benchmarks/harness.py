@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+from new_implementation.benchmarks.fake_discord import FakeCommand, FakeContext, FakeGuild
+from new_implementation.core.resource_handler import ResourcePack
+from new_implementation.core.resource_pack_index import RESOURCE_PACK_DESCRIPTOR
+from new_implementation.data.games import GameData
+from new_implementation.modules.calendar.calendar import CalendarCog
+from new_implementation.modules.calendar.calendar_data import CalendarHolderData, CalendarResourcePack
+from new_implementation.modules.calendar.waterdeep_calendar import WaterdeepCalendarData
+from new_implementation.modules.music.music import MusicCog
+from new_implementation.runtimes.bot_runtime.dndiscord_bot import DNDiscordBot
+from new_implementation.utils import utils
+from new_implementation.utils.message_scheduler import configure_message_scheduler
+from shared import serialization
+from shared.io_executor import get_io_executor
+
+"""
+
+Drives the bot's cogs through fake guilds, members and channels, with all data kept in a temporary bot_data
+directory, and reports throughput and latency for each command as json so runs can be compared.
+
+    python -m new_implementation.benchmarks.harness --guilds 1000 --increments 50 --output results.json
+    python -m new_implementation.benchmarks.harness --guilds 1000 --baseline results.json
+
+"""
+
+CALENDAR_PACK_ID = "application:calendars:waterdeep"
+CALENDAR_NICKNAME = "main"
+
+
+def get_percentile(ordered, percentile):
+    if not ordered:
+        return 0.0
+
+    index = min(len(ordered) - 1, int(percentile * len(ordered)))
+    return ordered[index]
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = list()
+        self.errors = 0
+
+    def record(self, elapsed, failed=False):
+        self.samples.append(elapsed)
+        if failed:
+            self.errors += 1
+
+    def get_results(self, wall_time):
+        ordered = sorted(self.samples)
+        return {
+            "ops": len(ordered),
+            "errors": self.errors,
+            "ops_per_sec": len(ordered) / wall_time if wall_time > 0 else 0.0,
+            "mean_ms": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+            "p50_ms": get_percentile(ordered, 0.5) * 1000,
+            "p99_ms": get_percentile(ordered, 0.99) * 1000,
+            "max_ms": ordered[-1] * 1000 if ordered else 0.0
+        }
+
+
+class GuildFixture:
+    def __init__(self, guild, game_master_context, player_context, game_name):
+        self.guild = guild
+        self.game_master_context = game_master_context
+        self.player_context = player_context
+        self.game_name = game_name
+
+
+class BenchmarkHarness:
+    def __init__(self, guild_count, concurrency=50):
+        self.guild_count = guild_count
+        self.concurrency = concurrency
+        self.directory = None
+        self.previous_directory = None
+        self.bot = None
+        self.cogs = dict()
+        self.fixtures = list()
+        self.recorders = dict()
+        self.first_errors = dict()
+
+    async def start(self):
+        # Everything the bot writes goes into a throw away directory
+        self.directory = tempfile.mkdtemp(prefix="dndiscord-benchmark-")
+        self.previous_directory = os.getcwd()
+        os.chdir(self.directory)
+
+        self.bot = DNDiscordBot({"discord_token": "benchmark", "log_file": False})
+        self.cogs["core"] = self.bot.get_cog("CoreCog")
+        self.cogs["calendar"] = CalendarCog(self.bot)
+        self.cogs["music"] = MusicCog(self.bot)
+
+        # Nothing is really sent, so there is nothing to rate limit
+        configure_message_scheduler(rate=1e9, burst=1e9)
+        self.__install_calendar_pack()
+
+        # Fixtures are created in parallel as well, it is a lot of small writes
+        self.fixtures = await self.run_concurrently([self.__create_fixture(index) for index in range(self.guild_count)])
+
+    async def stop(self):
+        try:
+            await self.bot.get_event_bus().join()
+            await self.bot.flush_caches()
+            await get_io_executor().flush()
+            await self.bot.get_resource_handler().close()
+        finally:
+            os.chdir(self.previous_directory)
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    async def run_concurrently(self, coroutines):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*[bounded(coroutine) for coroutine in coroutines])
+
+    async def run_scenario(self, scenario, *args):
+        self.recorders = dict()
+        start = time.perf_counter()
+        await scenario(self, *args)
+        await self.bot.get_event_bus().join()
+        wall_time = time.perf_counter() - start
+
+        operations = {name: recorder.get_results(wall_time) for name, recorder in self.recorders.items()}
+        total_ops = sum(results["ops"] for results in operations.values())
+        return {
+            "seconds": wall_time,
+            "ops": total_ops,
+            "ops_per_sec": total_ops / wall_time if wall_time > 0 else 0.0,
+            "errors": sum(results["errors"] for results in operations.values()),
+            "operations": operations
+        }
+
+    def get_recorder(self, name):
+        recorder = self.recorders.get(name)
+        if recorder is None:
+            recorder = LatencyRecorder()
+            self.recorders[name] = recorder
+        return recorder
+
+    async def invoke(self, ctx, cog_name, command_name, *args, **kwargs):
+        """
+        Runs a command the way discord would, cog hooks included, and records how long it took.
+        """
+        cog = self.cogs[cog_name]
+        command = self.__get_command(cog, command_name)
+        ctx.command = FakeCommand(command)
+        ctx.invoked_with = command.name
+        ctx.command_failed = False
+
+        failed = False
+        start = time.perf_counter()
+        try:
+            await cog.cog_before_invoke(ctx)
+            try:
+                await command.callback(cog, ctx, *args, **kwargs)
+            except Exception:
+                ctx.command_failed = True
+                raise
+            finally:
+                await cog.cog_after_invoke(ctx)
+
+        except Exception:
+            failed = True
+            self.__remember_error(command_name)
+
+        self.get_recorder(command_name).record(time.perf_counter() - start, failed)
+
+    async def measure(self, name, coroutine):
+        # For work that isn't a command
+        failed = False
+        start = time.perf_counter()
+        try:
+            await coroutine
+        except Exception:
+            failed = True
+            self.__remember_error(name)
+
+        self.get_recorder(name).record(time.perf_counter() - start, failed)
+
+    def __remember_error(self, name):
+        if name not in self.first_errors:
+            self.first_errors[name] = traceback.format_exc()
+
+    @staticmethod
+    def __get_command(cog, command_name):
+        for command in cog.get_commands():
+            if command.name == command_name:
+                return command
+
+        raise KeyError("No command called: " + command_name)
+
+    def __install_calendar_pack(self):
+        path = self.bot.get_resource_handler().get_resource_pack_path(CALENDAR_PACK_ID)
+        os.makedirs(path, exist_ok=True)
+
+        calendar_module = WaterdeepCalendarData.__module__
+        files = {
+            RESOURCE_PACK_DESCRIPTOR: ResourcePack(["calendar_format.json"]),
+            "calendar_format.json": CalendarResourcePack(calendar_module, calendar_module)
+        }
+        for name, payload in files.items():
+            data = serialization.dumps(payload)
+            with open(os.path.join(path, name), "wb") as data_file:
+                data_file.write(data if isinstance(data, bytes) else data.encode("utf-8"))
+
+    async def __create_fixture(self, index):
+        guild = FakeGuild("Benchmark guild " + str(index))
+        game_master = guild.add_member("Game master " + str(index), role_names=["GameMaster"])
+        player = guild.add_member("Player " + str(index))
+        channel = await guild.create_text_channel("general")
+        game_master_context = FakeContext(self.bot, guild, game_master, channel)
+        player_context = FakeContext(self.bot, guild, player, channel)
+
+        # A game with a calendar, set up directly rather than through game:create as that mostly exercises channel creation
+        game_name = "campaign"
+        calendar_holder = CalendarHolderData()
+        calendar_holder.add_calendar(CALENDAR_NICKNAME, WaterdeepCalendarData(CALENDAR_PACK_ID))
+        game = GameData(utils.get_guild_id_from_context(game_master_context), game_name, utils.get_user_id_from_context(game_master_context), game_master.name, players=[utils.get_user_id_from_context(player_context)])
+        game.set_module_data(CalendarCog.module_data_key, calendar_holder)
+        await self.bot.save_game(game_master_context, game)
+
+        guild_data = await self.bot.get_guild_data_for_context(game_master_context)
+        guild_data.add_game(game_name)
+        await self.bot.save_guild_data_for_context(game_master_context)
+        for ctx in (game_master_context, player_context):
+            user_data = await self.bot.get_user_data_for_context(ctx)
+            user_data.add_game(game_name)
+            await self.bot.save_user_data_for_context(ctx)
+
+        return GuildFixture(guild, game_master_context, player_context, game_name)
+
+
+async def scenario_game_sessions(harness, increments):
+    # Each guild starts its game, passes a number of days and finishes
+    async def session(fixture):
+        ctx = fixture.game_master_context
+        await harness.invoke(ctx, "core", "game:run", game_name=fixture.game_name)
+        for _ in range(increments):
+            await harness.invoke(ctx, "calendar", "calendar:increment", nickname=CALENDAR_NICKNAME)
+        await harness.invoke(ctx, "core", "game:end")
+
+    await harness.run_concurrently([session(fixture) for fixture in harness.fixtures])
+
+
+async def scenario_calendar_reads(harness, reads):
+    # Players reading the calendar of a running game
+    async def session(fixture):
+        await harness.invoke(fixture.game_master_context, "core", "game:run", game_name=fixture.game_name)
+        for _ in range(reads):
+            await harness.invoke(fixture.player_context, "calendar", "calendar:current", nickname=CALENDAR_NICKNAME)
+            await harness.invoke(fixture.player_context, "calendar", "calendar:party_today", nickname=CALENDAR_NICKNAME)
+        await harness.invoke(fixture.game_master_context, "core", "game:end")
+
+    await harness.run_concurrently([session(fixture) for fixture in harness.fixtures])
+
+
+async def scenario_permission_checks(harness, checks):
+    permissions_handler = harness.bot.get_permission_handler()
+
+    async def session(fixture):
+        for _ in range(checks):
+            await harness.measure("check_guild_permissions_for_user", permissions_handler.check_guild_permissions_for_user(fixture.player_context, "benchmark"))
+            await harness.measure("check_inactive_game_permissions_for_user", permissions_handler.check_inactive_game_permissions_for_user(fixture.player_context, fixture.game_name, "benchmark"))
+
+    await harness.run_concurrently([session(fixture) for fixture in harness.fixtures])
+
+
+async def scenario_audio_commands(harness, repeats):
+    # Nothing is connected to voice, so this is the command and permission overhead of the audio player
+    async def session(fixture):
+        for _ in range(repeats):
+            await harness.invoke(fixture.game_master_context, "music", "music_player:playlist")
+            await harness.invoke(fixture.game_master_context, "music", "music_player:currently_playing")
+
+    await harness.run_concurrently([session(fixture) for fixture in harness.fixtures])
+
+
+async def scenario_business_views(harness, repeats):
+    # The business simulator still lives in the original bot, its status views are what its commands spend their time on
+    try:
+        from modules.business_simulator.business_controller import BusinessController
+        from modules.business_simulator.business_command_view_builder import build_status_view_players, build_purchaseable_view_players
+        from modules.business_simulator.data.data_packs_generators.default_data_pack import create_default_data_pack
+    except ImportError as e:
+        print("Skipping the business simulator views: " + str(e), file=sys.stderr)
+        return
+
+    business = BusinessController(name="benchmark")
+    await business.set_data_pack(create_default_data_pack(harness.directory))
+
+    async def status_view(ctx):
+        for message in await build_status_view_players(business, None, ctx):
+            await ctx.send(message)
+
+    async def purchaseable_view(ctx):
+        for message in await build_purchaseable_view_players(business, None, ctx):
+            await ctx.send(message)
+
+    async def session(fixture):
+        for _ in range(repeats):
+            await harness.measure("business:status", status_view(fixture.player_context))
+            await harness.measure("business:purchaseables", purchaseable_view(fixture.player_context))
+
+    await harness.run_concurrently([session(fixture) for fixture in harness.fixtures])
+
+
+def compare(results, baseline):
+    # Relative change of each operation against the same operation in the baseline
+    comparison = dict()
+    for scenario_name, scenario in results["scenarios"].items():
+        baseline_scenario = baseline.get("scenarios", dict()).get(scenario_name)
+        if baseline_scenario is None:
+            continue
+
+        for operation_name, operation in scenario["operations"].items():
+            baseline_operation = baseline_scenario["operations"].get(operation_name)
+            if baseline_operation is None:
+                continue
+
+            changes = dict()
+            for metric in ("ops_per_sec", "p50_ms", "p99_ms"):
+                if baseline_operation[metric]:
+                    changes[metric] = (operation[metric] - baseline_operation[metric]) / baseline_operation[metric]
+            comparison[scenario_name + "/" + operation_name] = changes
+
+    return comparison
+
+
+async def run(args):
+    scenarios = {
+        "game_sessions": (scenario_game_sessions, args.increments),
+        "calendar_reads": (scenario_calendar_reads, args.reads),
+        "permission_checks": (scenario_permission_checks, args.checks),
+        "audio_commands": (scenario_audio_commands, args.repeats),
+        "business_views": (scenario_business_views, args.repeats)
+    }
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios.keys())
+
+    harness = BenchmarkHarness(args.guilds, concurrency=args.concurrency)
+    setup_start = time.perf_counter()
+    await harness.start()
+    setup_time = time.perf_counter() - setup_start
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "guilds": args.guilds,
+            "concurrency": args.concurrency,
+            "data_format": serialization.get_default_serializer().name,
+            "setup_seconds": setup_time
+        },
+        "scenarios": dict()
+    }
+
+    try:
+        for name in selected:
+            scenario, scenario_argument = scenarios[name]
+            results["scenarios"][name] = await harness.run_scenario(scenario, scenario_argument)
+
+        results["command_metrics"] = harness.bot.get_command_metrics().get_snapshot()
+        results["caches"] = harness.bot.get_cache_statistics()
+        results["first_errors"] = harness.first_errors
+
+    finally:
+        await harness.stop()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", dest="guilds", type=int, default=1000)
+    parser.add_argument("--concurrency", dest="concurrency", type=int, default=50)
+    parser.add_argument("--increments", dest="increments", type=int, default=50)
+    parser.add_argument("--reads", dest="reads", type=int, default=20)
+    parser.add_argument("--checks", dest="checks", type=int, default=20)
+    parser.add_argument("--repeats", dest="repeats", type=int, default=5)
+    parser.add_argument("--scenarios", dest="scenarios", type=str, default="", help="Comma separated scenarios to run, all of them by default")
+    parser.add_argument("--output", dest="output", type=str, default="", help="Where to write the json results, stdout by default")
+    parser.add_argument("--baseline", dest="baseline", type=str, default="", help="Results of a previous run to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            results["comparison"] = compare(results, json.load(baseline_file))
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
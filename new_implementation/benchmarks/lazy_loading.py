@@ -0,0 +1,79 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from new_implementation.modules.calendar.calendar_data import CalendarData, CalendarHolderData
+from shared import serialization
+
+"""
+
+Compares eager and lazy loading of a calendar module with a large number of reminders.
+
+    python -m new_implementation.benchmarks.lazy_loading --reminders 10000 --format json
+
+"""
+
+
+def build_payload(reminder_count):
+    calendar = CalendarData("waterdeep")
+    for index in range(reminder_count):
+        calendar.add_reminder(str(index % 7), "party" if index % 3 else "private", index, "Reminder number " + str(index), index % 5)
+
+    holder = CalendarHolderData()
+    holder.add_calendar("main", calendar)
+    return holder
+
+
+def run_case(data, lazy, touch, repeats):
+    serialization.set_lazy_loading(lazy)
+
+    # Timing
+    timings = list()
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        touch(serialization.loads(data))
+        timings.append(time.perf_counter() - start)
+
+    # Memory, measured separately as tracing slows everything down
+    gc.collect()
+    tracemalloc.start()
+    result = serialization.loads(data)
+    touch(result)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    timings.sort()
+    return timings[len(timings) // 2], current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reminders", dest="reminders", type=int, default=10000)
+    parser.add_argument("--repeats", dest="repeats", type=int, default=10)
+    parser.add_argument("--format", dest="format", type=str, default="json", choices=list(serialization.serializers.keys()))
+    args = parser.parse_args()
+
+    data = serialization.get_serializer(args.format).dumps(build_payload(args.reminders))
+
+    # What the command touches once the module is loaded
+    touches = {
+        "load only": lambda holder: holder.get_calendars(),
+        "read calendar": lambda holder: holder.get_calendars()["main"].get_ticks_passed(),
+        "scan reminders": lambda holder: sum(reminder.get_absolute_tick_date() for reminder in holder.get_calendars()["main"].get_reminders())
+    }
+
+    print("Payload: " + str(args.reminders) + " reminders, " + str(len(data)) + " bytes of " + args.format)
+    print("{:<16}{:<8}{:>14}{:>16}{:>16}".format("case", "mode", "median (ms)", "retained (KiB)", "peak (KiB)"))
+    for name, touch in touches.items():
+        for lazy in (False, True):
+            median, current, peak = run_case(data, lazy, touch, args.repeats)
+            print("{:<16}{:<8}{:>14.2f}{:>16.1f}{:>16.1f}".format(name, "lazy" if lazy else "eager", median * 1000, current / 1024, peak / 1024))
+
+    serialization.set_lazy_loading(False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import gc
+import time
+
+from shared.long_message import LongMessage
+
+"""
+
+Times building and chunking very long messages (i.e. a large inventory or reminder listing).
+
+    python -m new_implementation.benchmarks.long_message --lines 100000
+
+"""
+
+
+def build_message(line_count, line_length, split_every):
+    long_message = LongMessage()
+    for index in range(line_count):
+        if split_every and index % split_every == 0:
+            long_message.add(None)
+        long_message.add(("Line " + str(index) + " ").ljust(line_length, "."))
+
+    return long_message
+
+
+def run_case(line_count, line_length, split_every, repeats):
+    timings = list()
+    chunks = None
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        chunks = list(build_message(line_count, line_length, split_every))
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    return timings[len(timings) // 2], len(chunks), max(len(chunk) for chunk in chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", dest="lines", type=int, default=100000)
+    parser.add_argument("--repeats", dest="repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    # Typical listings, listings split into sections and lines that don't fit into a single message
+    cases = {
+        "short lines": (40, 0),
+        "sectioned": (40, 25),
+        "long lines": (120, 0),
+        "oversized lines": (5000, 0)
+    }
+
+    print("{:<18}{:>10}{:>14}{:>14}{:>12}".format("case", "chunks", "longest", "median (ms)", "lines/s"))
+    for name, (line_length, split_every) in cases.items():
+        line_count = args.lines if line_length < 2000 else args.lines // 100
+        median, chunk_count, longest = run_case(line_count, line_length, split_every, args.repeats)
+        print("{:<18}{:>10}{:>14}{:>14.2f}{:>12.0f}".format(name, chunk_count, longest, median * 1000, line_count / median))
+
+
+if __name__ == "__main__":
+    main()
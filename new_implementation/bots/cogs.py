@@ -1,9 +1,12 @@
+import logging
 import sys
+import time
 import traceback
 
 from discord.ext import commands
 from discord.ext.commands import Cog
 
+from new_implementation.utils.file_log import log_command
 from new_implementation.utils.message import log, send_message
 
 
@@ -22,12 +25,23 @@ class DnDiscordCog(Cog):
 
         return True
 
+    async def cog_before_invoke(self, ctx: commands.Context):
+        ctx.invoked_at = time.perf_counter()
+        self.engine.get_command_metrics().begin_command(ctx.command.qualified_name)
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        # Also called for failed commands, which are logged by cog_command_error
+        if not ctx.command_failed:
+            log_command(self.engine, ctx, "Command completed")
+        self.engine.get_command_metrics().end_command(failed=ctx.command_failed)
+
     async def cog_command_error(self, ctx: commands.Context, error: commands.CommandError):
         # Ensure our console gets all the info
         print('Ignoring exception in command {}:'.format(ctx.command), file=sys.stderr)
         traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
 
-        # TODO: log to file
+        # Log to file
+        log_command(self.engine, ctx, "Command failed", level=logging.ERROR, error=getattr(error, "original", error))
 
         # TODO: Conditional filtering to the logs
 
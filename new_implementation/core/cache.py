@@ -0,0 +1,188 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class CacheEntry:
+    __slots__ = ("value", "last_access", "dirty")
+
+    def __init__(self, value):
+        self.value = value
+        self.last_access = time.monotonic()
+        self.dirty = False
+
+
+class ResourceCache:
+    """
+    A bounded, least recently used cache with time based expiry.
+
+    Entries can be marked dirty, dirty entries are handed to the flusher (an async callable taking the key and value)
+    before they are dropped. Entries that have been touched within min_idle seconds are never evicted, as a command
+    could still be holding onto and mutating them.
+    """
+
+    def __init__(self, name, flusher, max_size=1000, ttl=3600, min_idle=60):
+        self.name = name
+        self.flusher = flusher
+        self.max_size = max_size
+        self.ttl = ttl
+        self.min_idle = min_idle
+        self.entries = OrderedDict()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+
+    def get_name(self):
+        return self.name
+
+    def configure(self, max_size=None, ttl=None, min_idle=None):
+        if max_size is not None:
+            self.max_size = max_size
+        if ttl is not None:
+            self.ttl = ttl
+        if min_idle is not None:
+            self.min_idle = min_idle
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry.last_access = time.monotonic()
+        self.entries.move_to_end(key)
+        return entry.value
+
+    def peek(self, key):
+        entry = self.entries.get(key)
+        return entry.value if entry is not None else None
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    async def put(self, key, value):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = CacheEntry(value)
+            self.entries[key] = entry
+        else:
+            entry.value = value
+            entry.last_access = time.monotonic()
+            self.entries.move_to_end(key)
+
+        # Make room if we have overgrown
+        if len(self.entries) > self.max_size:
+            await self.evict_over_capacity()
+
+    def mark_dirty(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+
+        entry.dirty = True
+        return True
+
+    def is_dirty(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry.dirty
+
+    async def flush(self, key):
+        entry = self.entries.get(key)
+        if entry is None or not entry.dirty:
+            return
+
+        # Clear first so anything that dirties the entry mid flush is picked up next time
+        entry.dirty = False
+        try:
+            await self.flusher(key, entry.value)
+        except Exception:
+            entry.dirty = True
+            raise
+
+        self.flushes += 1
+
+    async def flush_all(self):
+        for key in [key for key, entry in self.entries.items() if entry.dirty]:
+            await self.flush(key)
+
+    async def evict(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+
+        # Never lose a write, the entry is only dropped if nothing touched it while we were flushing
+        await self.flush(key)
+        if self.entries.get(key) is not entry or entry.dirty:
+            return False
+
+        del self.entries[key]
+        self.evictions += 1
+        return True
+
+    async def evict_over_capacity(self):
+        now = time.monotonic()
+        for key in list(self.entries.keys()):
+            if len(self.entries) <= self.max_size:
+                return
+
+            # Everything after this point has been used even more recently
+            entry = self.entries.get(key)
+            if entry is not None and now - entry.last_access < self.min_idle:
+                return
+
+            await self.evict(key)
+
+    async def evict_expired(self):
+        now = time.monotonic()
+        for key in list(self.entries.keys()):
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+
+            # Entries are ordered by access so the first fresh entry ends the sweep
+            if now - entry.last_access < self.ttl:
+                return
+
+            await self.evict(key)
+
+    async def purge(self, batch_size=50):
+        """
+        Evict everything that isn't in active use, yielding to the event loop between batches so that commands are
+        never held up by a purge.
+        """
+        evicted = 0
+        now = time.monotonic()
+        keys = list(self.entries.keys())
+        for index in range(0, len(keys), batch_size):
+            for key in keys[index:index + batch_size]:
+                entry = self.entries.get(key)
+                if entry is None or now - entry.last_access < self.min_idle:
+                    continue
+
+                if await self.evict(key):
+                    evicted += 1
+
+            await asyncio.sleep(0)
+
+        return evicted
+
+    def get_statistics(self):
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "dirty": sum(1 for entry in self.entries.values() if entry.dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "flushes": self.flushes
+        }
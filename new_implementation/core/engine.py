@@ -1,15 +1,28 @@
+import asyncio
+
+from new_implementation.core.events import EventBus
+from new_implementation.core.instrumentation import CommandMetrics
 from new_implementation.core.permissions_handler import PermissionsHandler
 from new_implementation.core.resource_handler import ResourceHandler
+from new_implementation.core.resource_pack_cache import ResourcePackCache
+from new_implementation.utils.guild_log import GuildLog
 
 
 class Engine:
     def __init__(self, engine_name):
         self.engine_name = engine_name
         self.memory_mutex = False  # Definitely not threadsafe?
-        self.listeners = dict()
+        self.purge_lock = asyncio.Lock()
+        self.event_bus = EventBus()
+        self.caches = list()
 
         self.resource_handler = ResourceHandler(self)
         self.permissions_handler = PermissionsHandler(self)
+        self.register_cache(self.permissions_handler.get_decision_cache())
+        self.resource_pack_cache = ResourcePackCache(self)
+        self.guild_log = GuildLog(self)
+        self.command_metrics = CommandMetrics()
+        self.loop_profiler = None
 
     def get_engine_name(self):
         return self.engine_name
@@ -17,27 +30,96 @@ class Engine:
     def get_resource_handler(self):
         return self.resource_handler
 
+    def set_resource_handler(self, resource_handler):
+        self.resource_handler = resource_handler
+
     def get_permission_handler(self):
         return self.permissions_handler
 
-    def register_event_class(self, clazz):
-        if clazz not in self.listeners:
-            self.listeners[clazz] = list()
+    def get_resource_pack_cache(self):
+        return self.resource_pack_cache
 
-    def register_event_class_listener(self, clazz, listener):
-        if clazz not in self.listeners:
-            return False
+    def get_command_metrics(self):
+        return self.command_metrics
+
+    def get_loop_profiler(self):
+        return self.loop_profiler
+
+    def get_guild_log(self):
+        return self.guild_log
 
-        self.listeners[clazz].append(listener)
+    def get_event_bus(self):
+        return self.event_bus
+
+    def register_event_class(self, clazz):
+        self.event_bus.register_event_class(clazz)
+
+    def register_event_class_listener(self, clazz, listener, priority=0, timeout=None):
+        return self.event_bus.subscribe(clazz, listener, priority=priority, timeout=timeout)
 
     def get_event_class_listeners(self, clazz):
-        return self.listeners[clazz]
+        return self.event_bus.get_listeners(clazz)
+
+    async def dispatch_event(self, clazz, event, *args, **kwargs):
+        return await self.event_bus.dispatch(clazz, event, *args, **kwargs)
+
+    def post_event(self, clazz, event, *args, **kwargs):
+        return self.event_bus.post(clazz, event, *args, **kwargs)
+
+    def register_cache(self, cache):
+        self.caches.append(cache)
+        return cache
+
+    def get_caches(self):
+        return self.caches
+
+    def get_cache_statistics(self):
+        return [cache.get_statistics() for cache in self.caches]
 
     def is_memory_mutex_locked(self):
         return self.memory_mutex
 
     async def purge_memory(self):
-        self.memory_mutex = True
-        self.memory_mutex = False
+        # Purges are incremental and flush before evicting, so commands carry on as normal while one runs
+        if self.purge_lock.locked():
+            return False
+
+        async with self.purge_lock:
+            for cache in self.caches:
+                await cache.purge()
+
+        return True
+
+    async def flush_caches(self):
+        for cache in self.caches:
+            await cache.flush_all()
+
+    async def run_periodic_cache_flush(self, interval=30):
+        # Written back data would otherwise only reach the disk when it is evicted, which can take up to the ttl
+        while True:
+            await asyncio.sleep(interval)
+            for cache in self.caches:
+                try:
+                    await cache.flush_all()
+                except Exception as e:
+                    print("Cache flush failed for: " + cache.get_name() + " due to: " + str(e))
+
+    async def shutdown(self):
+        """
+        Writes out everything still held in memory. Called once the engine has stopped taking commands.
+        """
+        await self.event_bus.join()
+        self.event_bus.stop()
+        await self.flush_caches()
+        await self.resource_handler.close()
+
+    async def run_periodic_cache_eviction(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            for cache in self.caches:
+                try:
+                    await cache.evict_expired()
+                except Exception as e:
+                    print("Cache eviction failed for: " + cache.get_name() + " due to: " + str(e))
 
 
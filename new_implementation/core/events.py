@@ -0,0 +1,164 @@
+import asyncio
+import traceback
+
+
+class Subscription:
+    __slots__ = ("listener", "priority", "timeout")
+
+    def __init__(self, listener, priority, timeout):
+        self.listener = listener
+        self.priority = priority
+        self.timeout = timeout
+
+
+class EventBus:
+    """
+    Dispatches events to the listeners registered against an event class (i.e. GameStateListener).
+
+    Listeners are called in priority order, highest first. Listeners sharing a priority don't depend on each other so
+    they are run concurrently. Every listener call is bounded by a timeout and a listener failing or timing out never
+    stops the others from being informed. Events that nobody needs to wait on can be posted, these are queued and
+    dispatched in order by a background task so the caller can carry on straight away.
+    """
+
+    def __init__(self, default_timeout=30, max_queue_size=1000):
+        self.default_timeout = default_timeout
+        self.max_queue_size = max_queue_size
+        self.subscriptions = dict()
+        self.queue = None
+        self.drain_task = None
+
+        # Statistics
+        self.dispatched = 0
+        self.posted = 0
+        self.dropped = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def configure(self, default_timeout=None, max_queue_size=None):
+        if default_timeout is not None:
+            self.default_timeout = default_timeout
+        if max_queue_size is not None:
+            self.max_queue_size = max_queue_size
+
+    def register_event_class(self, clazz):
+        if clazz not in self.subscriptions:
+            self.subscriptions[clazz] = list()
+
+    def subscribe(self, clazz, listener, priority=0, timeout=None):
+        if clazz not in self.subscriptions:
+            return False
+
+        # Kept sorted by priority, registration order is preserved within a priority
+        subscriptions = self.subscriptions[clazz]
+        subscriptions.append(Subscription(listener, priority, timeout))
+        subscriptions.sort(key=lambda subscription: -subscription.priority)
+        return True
+
+    def unsubscribe(self, clazz, listener):
+        subscriptions = self.subscriptions.get(clazz)
+        if subscriptions is None:
+            return False
+
+        self.subscriptions[clazz] = [subscription for subscription in subscriptions if subscription.listener is not listener]
+        return len(self.subscriptions[clazz]) != len(subscriptions)
+
+    def get_listeners(self, clazz):
+        return [subscription.listener for subscription in self.subscriptions.get(clazz, list())]
+
+    async def dispatch(self, clazz, event, *args, **kwargs):
+        """
+        Calls the event method on every listener of the class and waits for them all. Returns the number of listeners
+        that failed or timed out.
+        """
+        self.dispatched += 1
+        failed = 0
+
+        # Group into priorities, each group is only started once the one before has finished
+        group = list()
+        for subscription in list(self.subscriptions.get(clazz, list())):
+            if group and group[0].priority != subscription.priority:
+                failed += await self.__dispatch_group(group, event, args, kwargs)
+                group = list()
+            group.append(subscription)
+        if group:
+            failed += await self.__dispatch_group(group, event, args, kwargs)
+
+        return failed
+
+    def post(self, clazz, event, *args, **kwargs):
+        """
+        Queues the event to be dispatched in the background. Returns False if the queue is full and the event was
+        dropped.
+        """
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        if self.drain_task is None or self.drain_task.done():
+            self.drain_task = asyncio.get_event_loop().create_task(self.__drain())
+
+        if self.queue.qsize() >= self.max_queue_size:
+            self.dropped += 1
+            print("Event queue is full, dropping: " + clazz.__name__ + "." + event)
+            return False
+
+        self.posted += 1
+        self.queue.put_nowait((clazz, event, args, kwargs))
+        return True
+
+    async def join(self):
+        # Waits for everything posted so far to have been dispatched
+        if self.queue is not None and self.drain_task is not None and not self.drain_task.done():
+            await self.queue.join()
+
+    def stop(self):
+        if self.drain_task is not None:
+            self.drain_task.cancel()
+            self.drain_task = None
+
+    def get_statistics(self):
+        return {
+            "event_classes": len(self.subscriptions),
+            "listeners": sum(len(subscriptions) for subscriptions in self.subscriptions.values()),
+            "dispatched": self.dispatched,
+            "posted": self.posted,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "timeouts": self.timeouts
+        }
+
+    async def __drain(self):
+        while True:
+            clazz, event, args, kwargs = await self.queue.get()
+            try:
+                await self.dispatch(clazz, event, *args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.queue.task_done()
+
+    async def __dispatch_group(self, group, event, args, kwargs):
+        outcomes = await asyncio.gather(*[self.__call(subscription, event, args, kwargs) for subscription in group])
+        return outcomes.count(False)
+
+    async def __call(self, subscription, event, args, kwargs):
+        # Listeners only need to implement the events they care about
+        method = getattr(subscription.listener, event, None)
+        if method is None:
+            return True
+
+        timeout = subscription.timeout if subscription.timeout is not None else self.default_timeout
+        try:
+            await asyncio.wait_for(method(*args, **kwargs), timeout=timeout)
+            return True
+
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print("Listener: " + type(subscription.listener).__name__ + " timed out handling: " + event)
+
+        except Exception:
+            self.failures += 1
+            print("Listener: " + type(subscription.listener).__name__ + " failed handling: " + event)
+            traceback.print_exc()
+
+        return False
@@ -0,0 +1,212 @@
+import bisect
+import contextvars
+import functools
+import time
+
+PHASE_TOTAL = "total"
+PHASE_PERMISSIONS = "permissions"
+PHASE_STORAGE = "storage"
+PHASE_SEND = "send"
+PHASES = (PHASE_TOTAL, PHASE_PERMISSIONS, PHASE_STORAGE, PHASE_SEND)
+
+# Phases timed whilst the command runs, sends are timed by the message scheduler when the message actually goes out
+COMMAND_PHASES = (PHASE_PERMISSIONS, PHASE_STORAGE)
+
+# Upper bounds of the histogram buckets in seconds, growing by 50% from 50us to a little over a minute
+BUCKET_BOUNDS = [0.00005 * 1.5 ** index for index in range(36)]
+
+# The timings of the command being run in the current task, if any
+current_command = contextvars.ContextVar("current_command", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total", "maximum")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, value):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def get_percentile(self, percentile):
+        # The upper bound of the bucket the percentile falls in, never more than the largest value seen
+        if self.count == 0:
+            return 0.0
+
+        target = percentile * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= target and bucket:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.maximum
+                return min(bound, self.maximum)
+
+        return self.maximum
+
+    def get_snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.get_percentile(0.5) * 1000,
+            "p99_ms": self.get_percentile(0.99) * 1000,
+            "max_ms": self.maximum * 1000
+        }
+
+
+class CommandTimings:
+    """
+    Time spent in each phase by a single command invocation. Nested timers for the same phase (i.e. a permission
+    check calling another) are only counted once.
+    """
+
+    __slots__ = ("command", "metrics", "started", "phases", "active")
+
+    def __init__(self, command, metrics=None):
+        self.command = command
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.phases = dict()
+        self.active = set()
+
+    def add(self, phase, elapsed):
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+
+
+class CommandStatistics:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.histograms = {phase: Histogram() for phase in PHASES}
+
+    def record(self, timings, elapsed, failed):
+        self.count += 1
+        if failed:
+            self.errors += 1
+
+        self.histograms[PHASE_TOTAL].record(elapsed)
+        for phase in COMMAND_PHASES:
+            self.histograms[phase].record(timings.phases.get(phase, 0.0))
+
+    def record_send(self, elapsed):
+        self.histograms[PHASE_SEND].record(elapsed)
+
+
+class CommandMetrics:
+    """
+    Per command counts, error rates and latency histograms, overall and broken down into permission checks and
+    storage. Messages are sent after the command has usually finished, so the send histogram holds one entry per
+    message a command queued, timed around the request to discord.
+    """
+
+    def __init__(self):
+        self.commands = dict()
+        self.started = time.monotonic()
+
+    def begin_command(self, command):
+        timings = CommandTimings(command, metrics=self)
+        current_command.set(timings)
+        return timings
+
+    def end_command(self, failed=False):
+        timings = current_command.get()
+        if timings is None:
+            return None
+
+        current_command.set(None)
+        elapsed = time.perf_counter() - timings.started
+        self.__get_statistics(timings.command).record(timings, elapsed, failed)
+        return elapsed
+
+    def record_send(self, timings, elapsed):
+        self.__get_statistics(timings.command).record_send(elapsed)
+
+    def __get_statistics(self, command):
+        statistics = self.commands.get(command)
+        if statistics is None:
+            statistics = CommandStatistics()
+            self.commands[command] = statistics
+        return statistics
+
+    def reset(self):
+        self.commands = dict()
+        self.started = time.monotonic()
+
+    def get_snapshot(self):
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        snapshot = dict()
+        for command, statistics in self.commands.items():
+            snapshot[command] = {
+                "count": statistics.count,
+                "errors": statistics.errors,
+                "error_rate": statistics.errors / statistics.count if statistics.count else 0.0,
+                "per_minute": statistics.count / uptime * 60,
+                "phases": {phase: histogram.get_snapshot() for phase, histogram in statistics.histograms.items()}
+            }
+
+        return snapshot
+
+    def get_slowest(self, limit=10, phase=PHASE_TOTAL, percentile="p99_ms"):
+        snapshot = self.get_snapshot()
+        ordered = sorted(snapshot.items(), key=lambda item: item[1]["phases"][phase][percentile], reverse=True)
+        return ordered[:limit]
+
+
+class PhaseTimer:
+    __slots__ = ("phase", "timings", "started")
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.timings = None
+        self.started = None
+
+    def __enter__(self):
+        timings = current_command.get()
+        if timings is not None and self.phase not in timings.active:
+            timings.active.add(self.phase)
+            self.timings = timings
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self.timings is not None:
+            self.timings.add(self.phase, time.perf_counter() - self.started)
+            self.timings.active.discard(self.phase)
+            self.timings = None
+        return False
+
+
+def record_send(timings, elapsed):
+    """
+    Adds a message sent on behalf of a command to its send timings.
+    """
+    if timings is not None and timings.metrics is not None:
+        timings.metrics.record_send(timings, elapsed)
+
+
+def time_phase(phase):
+    """
+    Context manager adding the time spent within it to the phase of the command currently being run.
+    """
+    return PhaseTimer(phase)
+
+
+def timed(phase):
+    """
+    Decorator for coroutines adding the time spent in them to the phase of the command currently being run.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with PhaseTimer(phase):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
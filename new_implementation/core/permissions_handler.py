@@ -1,4 +1,7 @@
 import enum
+from collections import OrderedDict
+
+from new_implementation.core.instrumentation import PHASE_PERMISSIONS, timed
 
 
 class PermissionContext(enum.IntEnum):
@@ -14,11 +17,128 @@ class PermissionLevel(enum.IntEnum):
     ADMINISTRATOR = 4
 
 
+class PermissionDecisionCache:
+    """
+    Memoized permission decisions. Keys carry the guild's generation, so invalidating a guild is just a matter of
+    bumping its generation, the orphaned decisions simply age out of the (bounded) cache.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.decisions = OrderedDict()
+        self.generations = dict()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_name(self):
+        return "permission_decisions"
+
+    def configure(self, max_size=None):
+        if max_size is not None:
+            self.max_size = max_size
+
+    def get_generation(self, guild_id):
+        return self.generations.get(guild_id, 0)
+
+    def get(self, key):
+        decision = self.decisions.get(key)
+        if decision is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.decisions.move_to_end(key)
+        return decision
+
+    def put(self, key, decision):
+        self.decisions[key] = decision
+        self.decisions.move_to_end(key)
+        while len(self.decisions) > self.max_size:
+            self.decisions.popitem(last=False)
+
+    def invalidate_guild(self, guild_id):
+        self.generations[guild_id] = self.get_generation(guild_id) + 1
+        self.invalidations += 1
+
+    # The engine treats this like any other registered cache, there is nothing to write back
+    async def flush_all(self):
+        return
+
+    async def evict_expired(self):
+        return
+
+    async def purge(self):
+        evicted = len(self.decisions)
+        self.decisions.clear()
+        return evicted
+
+    def get_statistics(self):
+        lookups = self.hits + self.misses
+        return {
+            "name": self.get_name(),
+            "size": len(self.decisions),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+
 class PermissionsHandler:
     def __init__(self, application):
         self.application = application
+        self.decision_cache = PermissionDecisionCache()
 
+    def get_decision_cache(self):
+        return self.decision_cache
+
+    def invalidate_guild(self, guild_id):
+        self.decision_cache.invalidate_guild(guild_id)
+
+    @timed(PHASE_PERMISSIONS)
     async def check_inactive_game_permissions_for_user(self, ctx, game_name, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
+        key = self.__build_decision_key("inactive_game", ctx, game_name, permission_name, permissions_level, elevated_roles)
+        return await self.__decide(key, self.__check_inactive_game_permissions_for_user, ctx, game_name, permission_name, permissions_level, elevated_roles)
+
+    @timed(PHASE_PERMISSIONS)
+    async def check_active_game_permissions_for_user(self, ctx, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
+        game = self.application.get_active_game_for_context(ctx)
+        key = self.__build_decision_key("active_game", ctx, game.get_name() if game else None, permission_name, permissions_level, elevated_roles)
+        return await self.__decide(key, self.__check_active_game_permissions_for_user, ctx, permission_name, permissions_level, elevated_roles)
+
+    @timed(PHASE_PERMISSIONS)
+    async def check_guild_permissions_for_user(self, ctx, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
+        key = self.__build_decision_key("guild", ctx, None, permission_name, permissions_level, elevated_roles)
+        return await self.__decide(key, self.__check_guild_permissions_for_user, ctx, permission_name, permissions_level, elevated_roles)
+
+    def __build_decision_key(self, check_type, ctx, game_name, permission_name, permissions_level, elevated_roles):
+        guild_id = str(ctx.guild.id)
+        author = ctx.author
+
+        # Everything about the user that feeds into a decision. The role ids are kept as a set rather than a hash of
+        # one, so two different sets of roles can never share a decision
+        role_ids = frozenset(role.id for role in author.roles)
+        if not elevated_roles:
+            elevated_roles = list()
+        elif not isinstance(elevated_roles, list):
+            elevated_roles = [elevated_roles]
+        elevated_role_key = tuple(getattr(role, "id", role) for role in elevated_roles)
+
+        return check_type, guild_id, self.decision_cache.get_generation(guild_id), game_name, str(author.id), permission_name, int(permissions_level), elevated_role_key, role_ids, author.guild_permissions.administrator
+
+    async def __decide(self, key, check, *args):
+        decision = self.decision_cache.get(key)
+        if decision is None:
+            decision = await check(*args)
+            self.decision_cache.put(key, decision)
+
+        return decision
+
+    async def __check_inactive_game_permissions_for_user(self, ctx, game_name, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
         # Get the requested game - the game check takes precedence over the admin check as usually commands that call this will not function without a game
         game = await self.application.get_game(ctx, game_name)
         if not game:
@@ -50,20 +170,20 @@ class PermissionsHandler:
 
         # This permissions level allows any member of the party to run the command
         if permissions_level <= PermissionLevel.PARTY:
-            if game.is_adventurer(ctx.author.id):
+            if game.is_player(str(ctx.author.id)):
                 return True, ""
 
         # This permissions level only allows for the gm or elevated roles
         if permissions_level <= PermissionLevel.GAME_MASTER:
 
             # Check if the user is the gm of the game
-            if game.is_gm(ctx.author.id):
+            if game.is_gm(str(ctx.author.id)):
                 return True, ""
 
         # If the permissions level == 3 or if it was an unregistered permission and the user is not an admin
         return False, "You do not have permission to do this."
 
-    async def check_active_game_permissions_for_user(self, ctx, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
+    async def __check_active_game_permissions_for_user(self, ctx, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
         # Get the requested game - the game check takes precedence over the admin check as usually commands that call this will not function without a game
         game = self.application.get_active_game_for_context(ctx)
         if not game:
@@ -95,20 +215,20 @@ class PermissionsHandler:
 
         # This permissions level allows any member of the party to run the command
         if permissions_level <= PermissionLevel.PARTY:
-            if game.is_adventurer(ctx.author.id):
+            if game.is_player(str(ctx.author.id)):
                 return True, ""
 
         # This permissions level only allows for the gm or elevated roles
         if permissions_level <= PermissionLevel.GAME_MASTER:
 
             # Check if the user is the gm of the game
-            if game.is_gm(ctx.author.id):
+            if game.is_gm(str(ctx.author.id)):
                 return True, ""
 
         # If the permissions level == 3 or if it was an unregistered permission and the user is not an admin
         return False, "You do not have permission to do that."
 
-    async def check_guild_permissions_for_user(self, ctx, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
+    async def __check_guild_permissions_for_user(self, ctx, permission_name, permissions_level=PermissionLevel.ADMINISTRATOR, elevated_roles=None):
         # If the user is an administrator we ALWAYS allow
         if ctx.author.guild_permissions.administrator:
             return True, ""
@@ -140,9 +260,12 @@ class PermissionsHandler:
     async def set_guild_permissions_for_context(self, ctx, permissions_name, permissions_level):
         guild_data = await self.application.get_guild_data_for_context(ctx)
         guild_data.set_permissions_level(permissions_name, permissions_level)
-        return await self.__save_guild_data(ctx, guild_data)
+        self.invalidate_guild(str(ctx.guild.id))
+        return await self.application.save_guild_data_for_context(ctx)
 
     async def set_game_permissions_for_context(self, ctx, permissions_name, permissions_level):
         game = self.application.get_active_game_for_context(ctx)
         if game:
-            game.set_permissions_level(permissions_name, permissions_level)
+            game.set_permission_level(permissions_name, permissions_level)
+            self.invalidate_guild(str(ctx.guild.id))
+            await self.application.save_game(ctx, game)
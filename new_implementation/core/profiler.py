@@ -0,0 +1,244 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+"""
+
+Debug mode event loop profiling. A background thread samples the event loop thread's stack with
+sys._current_frames and keeps the samples as folded stacks (one "frame;frame;frame count" line per stack), which
+is the input format of flamegraph.pl, speedscope and friends. A heartbeat scheduled on the loop tells the same thread
+when the loop has stopped turning over, time spent blocked is attributed to whichever cog and command was running.
+
+"""
+
+# Stacks ending in one of these are the event loop waiting for something to do
+IDLE_FUNCTIONS = {("selectors.py", "select"), ("selectors.py", "poll"), ("selectors.py", "control")}
+
+# Root frame for samples not taken underneath a cog
+UNATTRIBUTED = "loop"
+
+
+def get_frame_name(code):
+    return os.path.basename(code.co_filename) + ":" + getattr(code, "co_qualname", code.co_name)
+
+
+def format_folded(stacks):
+    return "".join(stack + " " + str(count) + "\n" for stack, count in sorted(stacks.items()))
+
+
+def write_folded(path, stacks):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as folded_file:
+        folded_file.write(format_folded(stacks))
+
+    return path
+
+
+class Stall:
+    __slots__ = ("started", "duration", "stacks", "labels")
+
+    def __init__(self, started):
+        self.started = started
+        self.duration = 0.0
+        self.stacks = collections.Counter()
+        self.labels = collections.Counter()
+
+    def get_label(self):
+        return self.labels.most_common(1)[0][0] if self.labels else UNATTRIBUTED
+
+
+class LoopProfiler:
+    """
+    Sampling profiler and slow callback detector for the event loop.
+
+    Every sample_interval seconds the loop thread's stack is folded and counted. The loop bumps a heartbeat every
+    heartbeat_interval seconds, if that has not happened for stall_threshold seconds the loop is considered blocked
+    and the samples are also put against the stall. Stalls longer than dump_threshold seconds have their stacks
+    written to the output directory as soon as the loop recovers.
+    """
+
+    def __init__(self, bots, sample_interval=0.01, heartbeat_interval=0.02, stall_threshold=0.1, dump_threshold=1.0, output_directory=None, max_stalls=100):
+        self.bots = bots
+        self.sample_interval = sample_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stall_threshold = stall_threshold
+        self.dump_threshold = dump_threshold
+        self.output_directory = output_directory if output_directory is not None else os.path.join(os.getcwd(), "profiles")
+        self.max_stalls = max_stalls
+
+        self.loop = None
+        self.loop_thread_id = None
+        self.thread = None
+        self.running = False
+        self.last_heartbeat = 0.0
+        self.labels = dict()
+
+        # Guards everything the sampler thread writes to, which the loop thread reads from
+        self.lock = threading.Lock()
+        self.stacks = collections.Counter()
+        self.blocked = collections.Counter()
+        self.stalls = collections.deque(maxlen=max_stalls)
+        self.stall = None
+        self.samples = 0
+        self.idle_samples = 0
+        self.dumps = 0
+
+    def start(self, loop):
+        """
+        Starts profiling the given loop. Must be called from the thread running the loop.
+        """
+        if self.running:
+            return
+
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.refresh_labels()
+        self.running = True
+        self.last_heartbeat = time.monotonic()
+        self.loop.call_soon(self.__heartbeat)
+        self.thread = threading.Thread(target=self.__sample_forever, name="dndiscord-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def is_running(self):
+        return self.running
+
+    def refresh_labels(self):
+        # Map the code of every command callback and listener to the cog and command it belongs to
+        labels = dict()
+        for bot in self.bots:
+            for cog_name, cog in bot.cogs.items():
+                for command in cog.walk_commands():
+                    labels[command.callback.__code__] = cog_name + ":" + command.qualified_name
+                for listener_name, listener in cog.get_listeners():
+                    labels[listener.__code__] = cog_name + ":" + listener_name
+
+        self.labels = labels
+
+    def reset(self):
+        with self.lock:
+            self.stacks = collections.Counter()
+            self.blocked = collections.Counter()
+            self.stalls.clear()
+            self.samples = 0
+            self.idle_samples = 0
+
+    def get_folded_stacks(self):
+        with self.lock:
+            return collections.Counter(self.stacks)
+
+    def get_stalls(self):
+        with self.lock:
+            return list(self.stalls)
+
+    def get_blocked_time(self, limit=10):
+        # Seconds the loop has been blocked for, by cog and command
+        with self.lock:
+            return self.blocked.most_common(limit)
+
+    def get_statistics(self):
+        with self.lock:
+            return {
+                "samples": self.samples,
+                "idle_samples": self.idle_samples,
+                "stacks": len(self.stacks),
+                "stalls": len(self.stalls),
+                "longest_stall": max((stall.duration for stall in self.stalls), default=0.0),
+                "dumps": self.dumps
+            }
+
+    def dump(self, path=None):
+        """
+        Writes all of the samples taken so far to disk as folded stacks. Blocks, so run it in an executor from the loop.
+        """
+        if path is None:
+            path = os.path.join(self.output_directory, "profile-" + time.strftime("%Y%m%d-%H%M%S") + ".folded")
+
+        path = write_folded(path, self.get_folded_stacks())
+        with self.lock:
+            self.dumps += 1
+        return path
+
+    def __heartbeat(self):
+        self.last_heartbeat = time.monotonic()
+        if self.running:
+            self.loop.call_later(self.heartbeat_interval, self.__heartbeat)
+
+    def __sample_forever(self):
+        while self.running:
+            time.sleep(self.sample_interval)
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+
+            stack, label, idle = self.__fold(frame)
+            del frame
+
+            now = time.monotonic()
+            stalled_for = now - self.last_heartbeat
+            with self.lock:
+                self.samples += 1
+                if idle:
+                    self.idle_samples += 1
+                else:
+                    self.stacks[stack] += 1
+
+                # The loop is still blocked
+                if stalled_for >= self.stall_threshold:
+                    if self.stall is None:
+                        self.stall = Stall(self.last_heartbeat)
+                    self.stall.duration = stalled_for
+                    self.blocked[label] += self.sample_interval
+                    if not idle:
+                        self.stall.stacks[stack] += 1
+                        self.stall.labels[label] += 1
+                    continue
+
+                # The loop has recovered
+                stall = self.stall
+                self.stall = None
+                if stall is not None:
+                    self.stalls.append(stall)
+
+            if stall is not None:
+                self.__report_stall(stall)
+
+    def __fold(self, frame):
+        names = list()
+        label = UNATTRIBUTED
+        idle = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FUNCTIONS
+        while frame is not None:
+            code = frame.f_code
+            names.append(get_frame_name(code))
+
+            # The outermost cog frame wins, a command may well call into another cog's listeners
+            if code in self.labels:
+                label = self.labels[code]
+            frame = frame.f_back
+
+        names.append(label)
+        names.reverse()
+        return ";".join(names), label, idle
+
+    def __report_stall(self, stall):
+        print("Event loop blocked for " + "{:.3f}".format(stall.duration) + "s in " + stall.get_label(), file=sys.stderr)
+        if stall.duration < self.dump_threshold or not stall.stacks:
+            return
+
+        path = os.path.join(self.output_directory, "stall-" + time.strftime("%Y%m%d-%H%M%S", time.localtime(time.time() - (time.monotonic() - stall.started))) + "-" + "{:.0f}ms".format(stall.duration * 1000) + ".folded")
+        try:
+            write_folded(path, stall.stacks)
+            with self.lock:
+                self.dumps += 1
+        except OSError as exception:
+            print("Could not write stall stacks to: " + path + " due to: " + str(exception), file=sys.stderr)
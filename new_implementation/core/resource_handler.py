@@ -1,9 +1,21 @@
+import asyncio
 import os
 
 from enum import Enum
 
-from new_implementation.data.data import DataAccessObject, SerializationModifier
+from new_implementation.core.resource_pack_index import RESOURCE_PACK_DESCRIPTOR, ResourcePackIndex
+from new_implementation.data.data import DataAccessObject, ModuleDataHolder, SerializationModifier, serializable
+from new_implementation.data.persistence import PersistenceLayer
 from new_implementation.utils import utils
+from shared.io_executor import get_io_executor
+
+
+MODULE_SHARD_EXTENSION = ".json"
+
+
+def get_engine_context(engine_name):
+    # Each engine keeps its data in <engine name>_data in the working directory
+    return os.path.join(os.getcwd(), engine_name + "_data")
 
 
 class ResourceLocation(Enum):
@@ -13,6 +25,7 @@ class ResourceLocation(Enum):
     GAME = 3
 
 
+@serializable
 class ResourcePack(SerializationModifier):
     def __init__(self, files_to_load):
         super().__init__()
@@ -36,7 +49,19 @@ class ResourcePack(SerializationModifier):
 class ResourceHandler:
     def __init__(self, engine):
         self.engine = engine
-        self.engine_context = os.path.join(os.getcwd(), self.engine.get_engine_name() + "_data")  # get the current path
+        self.engine_context = get_engine_context(self.engine.get_engine_name())
+        self.persistence = PersistenceLayer()
+        self.resource_pack_index = ResourcePackIndex(self.engine_context)
+        self.resource_pack_paths = dict()
+
+    def get_engine_context(self):
+        return self.engine_context
+
+    def get_persistence_layer(self):
+        return self.persistence
+
+    def get_resource_pack_index(self):
+        return self.resource_pack_index
 
     async def list_resource_packs_in_locations(self, locations, invocation_context, search_context, type_parent):
         resources = list()
@@ -46,67 +71,74 @@ class ResourceHandler:
         # Look in our default application context
         if ResourceLocation.APPLICATION in locations:
             search_path = os.path.join(self.engine_context, search_context)
-            results = os.listdir(search_path)
-            for result in results:
-                if await self.is_resource_pack(os.path.join(search_path, result)):
-                    resources.append(search_context + ":" + result)
+            await self.__add_indexed_resource_packs(resources, search_path, search_context + ":")
 
         # Look in the guild context
         if ResourceLocation.GUILD in locations:
             search_path = os.path.join(self.engine_context, "guilds", guild_id, search_context)
-            results = os.listdir(search_path)
-            for result in results:
-                if await self.is_resource_pack(os.path.join(search_path, result)):
-                    resources.append("guild:" + guild_id + ":" + search_context + ":" + result)
+            await self.__add_indexed_resource_packs(resources, search_path, "guild:" + guild_id + ":" + search_context + ":")
 
         # Look in the users context
         if ResourceLocation.USER in locations:
             search_path = os.path.join(self.engine_context, "users", user_id, search_context)
-            results = os.listdir(search_path)
-            for result in results:
-                if await self.is_resource_pack(os.path.join(search_path, result)):
-                    resources.append("user:" + user_id + ":" + search_context + ":" + result)
+            await self.__add_indexed_resource_packs(resources, search_path, "user:" + user_id + ":" + search_context + ":")
 
         # Look in the games context
         if ResourceLocation.GAME in locations:
 
             # Check if we are running a game
-            game = self.engine.get_game_for_context(invocation_context)
+            game = self.engine.get_active_game_for_context(invocation_context)
             if game is not None:
                 game_id = game.get_name()
                 search_path = os.path.join(self.engine_context, "guilds", guild_id, "games", game_id, search_context)
-                results = os.listdir(search_path)
-                for result in results:
-                    if await self.is_resource_pack(os.path.join(search_path, result)):
-                        resources.append("guild:" + guild_id + ":game:" + game_id + ":" + search_context + ":" + result)
+                await self.__add_indexed_resource_packs(resources, search_path, "guild:" + guild_id + ":game:" + game_id + ":" + search_context + ":")
 
         return resources
 
+    async def __add_indexed_resource_packs(self, resources, search_path, identifier_prefix):
+        for pack_name in await self.resource_pack_index.list_packs(search_path):
+            identifier = identifier_prefix + pack_name
+
+            # Remember where this pack lives so loading it never has to work it out again
+            self.resource_pack_paths[identifier] = os.path.join(search_path, pack_name)
+            resources.append(identifier)
+
     async def is_resource_pack(self, path):
         if not os.path.isdir(path):
             return False
 
-        if os.path.isfile(os.path.join(path, "resource_pack.json")):
+        if os.path.isfile(os.path.join(path, RESOURCE_PACK_DESCRIPTOR)):
             return True
 
+    def get_resource_pack_path(self, resource_pack_identifier):
+        path = self.resource_pack_paths.get(resource_pack_identifier)
+        if path is None:
+            path = self.convert_id_to_path(resource_pack_identifier)
+            self.resource_pack_paths[resource_pack_identifier] = path
+
+        return path
+
     async def load_resource_pack(self, resource_pack_identifier):
-        path = self.convert_id_to_path(resource_pack_identifier)
+        """
+        Loads a fresh copy of a resource pack, most callers want the shared copy from the engine's resource pack cache.
+        """
+        path = self.get_resource_pack_path(resource_pack_identifier)
 
         # Resource pack descriptor
         generic_dao = DataAccessObject()
-        await generic_dao.load(os.path.join(path, "resource_pack.json"))
+        await generic_dao.load(os.path.join(path, RESOURCE_PACK_DESCRIPTOR))
 
         # Validate in a totally non-pythonic manner that it is what we expect
         resource_pack = generic_dao.get_payload()
         if not isinstance(resource_pack, ResourcePack):
             return None
 
-        # We now want to chain load any dependencies
+        # We now want to chain load any dependencies, all at once
         data_to_load = resource_pack.get_data_to_load()
-        for data in data_to_load:
-            generic_dao = DataAccessObject()
-            await generic_dao.load(os.path.join(path, data))
-            resource_pack.add_dataset(data, generic_dao.get_payload())
+        dataset_daos = [DataAccessObject() for _ in data_to_load]
+        await asyncio.gather(*[dataset_dao.load(os.path.join(path, data)) for dataset_dao, data in zip(dataset_daos, data_to_load)])
+        for data, dataset_dao in zip(data_to_load, dataset_daos):
+            resource_pack.add_dataset(data, dataset_dao.get_payload())
 
         return resource_pack
 
@@ -136,35 +168,121 @@ class ResourceHandler:
 
     async def load_resource_from_guild_resources(self, guild_id, file_name, dao):
         load_path = os.path.join(self.engine_context, "guilds", guild_id, file_name)
-        await dao.load(load_path)
+        await self.persistence.load(load_path, dao)
         return dao
 
     async def save_resource_in_guild_resources(self, guild_id, file_name, dao):
         save_path = os.path.join(self.engine_context, "guilds", guild_id, file_name)
-        await dao.save(save_path)
+        await self.persistence.save(save_path, dao)
         return dao
 
     async def load_resource_from_user_resources(self, user_id, file_name, dao):
         save_path = os.path.join(self.engine_context, "users", user_id, file_name)
-        await dao.load(save_path)
+        await self.persistence.load(save_path, dao)
         return dao
 
     async def save_resource_in_user_resources(self, user_id, file_name, dao):
         save_path = os.path.join(self.engine_context, "users", user_id, file_name)
-        await dao.save(save_path)
+        await self.persistence.save(save_path, dao)
         return dao
 
     async def load_resource_from_game_resources(self, guild_id, file_name, dao):
         save_path = os.path.join(self.engine_context, "guilds", guild_id, "games", file_name)
-        await dao.load(save_path)
+        await self.persistence.load(save_path, dao)
+        game = dao.get_payload()
+        if isinstance(game, ModuleDataHolder):
+            await load_module_shards(self.persistence, save_path, game)
+
         return dao
 
     async def save_resource_in_game_resources(self, guild_id, file_name, dao):
         save_path = os.path.join(self.engine_context, "guilds", guild_id, "games", file_name)
-        await dao.save(save_path)
+
+        # Only the modules that have changed are written, each to its own shard, ahead of the game itself
+        game = dao.get_payload()
+        if isinstance(game, ModuleDataHolder):
+            dirty_module_data = game.take_dirty_module_data()
+            try:
+                await asyncio.gather(*[self.__save_module_shard(save_path, key, module_data) for key, module_data in dirty_module_data.items()])
+            except Exception:
+                game.restore_dirty_module_keys(dirty_module_data.keys())
+                raise
+
+        await self.persistence.save(save_path, dao)
         return dao
 
     async def delete_resource_from_game_resources(self, guild_id, file_name):
         path = os.path.join(self.engine_context, "guilds", guild_id, "games", file_name)
-        if os.path.exists(path):
-            os.remove(path)
+        for shard_path in (await list_module_shards(path)).values():
+            await self.persistence.delete(shard_path)
+        await self.persistence.delete(path)
+        await get_io_executor().run(remove_empty_directory, get_module_shard_directory(path))
+
+    async def __save_module_shard(self, game_path, key, module_data):
+        shard_path = os.path.join(get_module_shard_directory(game_path), key + MODULE_SHARD_EXTENSION)
+        if module_data is None:
+            await self.persistence.delete(shard_path)
+
+        else:
+            shard_dao = DataAccessObject()
+            shard_dao.set_payload(module_data)
+            await self.persistence.save(shard_path, shard_dao)
+
+    async def list_guilds(self):
+        guilds_path = os.path.join(self.engine_context, "guilds")
+        return sorted(await get_io_executor().run(list_directory, guilds_path))
+
+    async def list_games_in_guild(self, guild_id):
+        games_path = os.path.join(self.engine_context, "guilds", guild_id, "games")
+        file_names = await get_io_executor().run(list_directory, games_path)
+        return sorted(os.path.splitext(file_name)[0] for file_name in file_names if file_name.endswith(".json"))
+
+    async def list_games_for_user(self, user_id):
+        # There is no index in the file tree so every game has to be opened
+        games = list()
+        for guild_id in await self.list_guilds():
+            for game_name in await self.list_games_in_guild(guild_id):
+                dao = await self.load_resource_from_game_resources(guild_id, game_name + ".json", DataAccessObject())
+                game = dao.get_payload()
+                if game is not None and (game.is_gm(user_id) or game.is_player(user_id)):
+                    games.append((guild_id, game_name))
+
+        return games
+
+    async def close(self):
+        self.resource_pack_index.stop()
+        await get_io_executor().flush()
+
+
+def list_directory(path):
+    return os.listdir(path) if os.path.isdir(path) else list()
+
+
+def remove_empty_directory(path):
+    if os.path.isdir(path) and not os.listdir(path):
+        os.rmdir(path)
+
+
+def get_module_shard_directory(game_path):
+    # <game>.json keeps its module data in <game>.modules/<module key>.json
+    return os.path.splitext(game_path)[0] + ".modules"
+
+
+async def list_module_shards(game_path):
+    shard_directory = get_module_shard_directory(game_path)
+    shard_paths = dict()
+    for shard_file_name in await get_io_executor().run(list_directory, shard_directory):
+        key, extension = os.path.splitext(shard_file_name)
+        if extension == MODULE_SHARD_EXTENSION and not key.startswith("."):
+            shard_paths[key] = os.path.join(shard_directory, shard_file_name)
+
+    return shard_paths
+
+
+async def load_module_shards(persistence, game_path, game):
+    # Module data is read alongside the game but only turned into objects when a module asks for it
+    shard_paths = await list_module_shards(game_path)
+    trees = await asyncio.gather(*[persistence.load_raw(shard_path) for shard_path in shard_paths.values()])
+    for key, tree in zip(shard_paths.keys(), trees):
+        if tree is not None:
+            game.attach_unmaterialized_module_data(key, tree)
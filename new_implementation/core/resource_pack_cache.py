@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+
+from new_implementation.core.resource_handler import ResourcePack
+from new_implementation.core.resource_pack_index import RESOURCE_PACK_DESCRIPTOR, fingerprint_resource_pack
+from shared import serialization
+from shared.io_executor import get_io_executor
+from shared.serialization import ContextDependent
+
+
+def read_bytes(path):
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, "rb") as data_file:
+        return data_file.read()
+
+
+def parse_dataset(data, directory):
+    if data is None:
+        return None
+
+    dataset = serialization.loads(data)
+    if isinstance(dataset, ContextDependent):
+        dataset.set_file_location(directory)
+    return dataset
+
+
+class CachedResourcePack:
+    def __init__(self, content_hash, resource_pack):
+        self.content_hash = content_hash
+        self.resource_pack = resource_pack
+        self.identifiers = set()
+
+
+class ResourcePackCache:
+    """
+    Process wide cache of loaded resource packs.
+
+    Packs are keyed by the hash of their content, so the same pack copied into several guilds is only parsed once, and
+    identifiers map onto that hash for as long as the pack's files are unchanged. Packs are held by acquire and let go
+    of by release, a pack with no references left is kept around (up to max_idle of them) in case it is needed again.
+
+    Whilst the resource pack index is running it tells us when a loaded pack's files change, otherwise every lookup
+    checks the pack's files itself.
+    """
+
+    def __init__(self, engine, max_idle=32):
+        self.engine = engine
+        self.max_idle = max_idle
+        self.entries = dict()
+        self.identifiers = dict()
+        self.paths = dict()
+        self.changed = set()
+        self.references = dict()
+        self.idle = OrderedDict()
+        self.loading = dict()
+        self.resource_pack_index = None
+
+        # Statistics
+        self.hits = 0
+        self.loads = 0
+        self.shared_loads = 0
+        self.evictions = 0
+
+    def configure(self, max_idle=None):
+        if max_idle is not None:
+            self.max_idle = max_idle
+            self.__evict_idle()
+
+    async def get(self, identifier):
+        """
+        Returns the up to date resource pack for the identifier (or None if there isn't one) without taking a reference.
+        """
+        resource_handler = self.engine.get_resource_handler()
+        resource_pack_index = resource_handler.get_resource_pack_index()
+        if resource_pack_index is not self.resource_pack_index:
+            resource_pack_index.add_listener(self.__pack_changed)
+            self.resource_pack_index = resource_pack_index
+
+        path = resource_handler.get_resource_pack_path(identifier)
+        known = self.identifiers.get(identifier)
+        if known is not None and known[1] in self.entries and identifier not in self.changed:
+            # Without the index watching the pack for us we have to look at its files ourselves
+            if resource_pack_index.is_watching() or known[0] == await get_io_executor().run(fingerprint_resource_pack, path):
+                self.hits += 1
+                entry = self.entries[known[1]]
+                if entry.content_hash in self.idle:
+                    self.idle.move_to_end(entry.content_hash)
+                return entry.resource_pack
+
+        # Only one load per identifier at a time, anyone else asking waits on it
+        task = self.loading.get(identifier)
+        if task is None:
+            task = asyncio.get_event_loop().create_task(self.__load(identifier, path))
+            self.loading[identifier] = task
+            task.add_done_callback(lambda _: self.loading.pop(identifier, None))
+
+        return await asyncio.shield(task)
+
+    async def acquire(self, identifier):
+        resource_pack = await self.get(identifier)
+        if resource_pack is not None:
+            self.references[identifier] = self.references.get(identifier, 0) + 1
+            known = self.identifiers.get(identifier)
+            if known is not None and known[1] in self.entries:
+                self.__update_idle(self.entries[known[1]])
+
+        return resource_pack
+
+    def release(self, identifier):
+        count = self.references.get(identifier, 0) - 1
+        if count > 0:
+            self.references[identifier] = count
+            return
+
+        self.references.pop(identifier, None)
+        known = self.identifiers.get(identifier)
+        if known is not None and known[1] in self.entries:
+            self.__update_idle(self.entries[known[1]])
+
+    def get_statistics(self):
+        return {
+            "packs": len(self.entries),
+            "idle": len(self.idle),
+            "references": sum(self.references.values()),
+            "hits": self.hits,
+            "loads": self.loads,
+            "shared_loads": self.shared_loads,
+            "evictions": self.evictions
+        }
+
+    async def __load(self, identifier, path):
+        io_executor = get_io_executor()
+
+        # Anything that changes from here on is picked up by the next lookup
+        self.changed.discard(identifier)
+        fingerprint = await io_executor.run(fingerprint_resource_pack, path)
+        if fingerprint is None:
+            return None
+
+        # Resource pack descriptor
+        descriptor_data = await io_executor.run(read_bytes, os.path.join(path, RESOURCE_PACK_DESCRIPTOR))
+        if descriptor_data is None:
+            return None
+
+        # Validate in a totally non-pythonic manner that it is what we expect
+        resource_pack = await io_executor.run(parse_dataset, descriptor_data, path)
+        if not isinstance(resource_pack, ResourcePack):
+            return None
+
+        # Read every dataset at once and work out what we actually have
+        data_to_load = resource_pack.get_data_to_load()
+        datasets = await asyncio.gather(*[io_executor.run(read_bytes, os.path.join(path, data)) for data in data_to_load])
+        content_hash = hashlib.sha1(descriptor_data)
+        for data, dataset in zip(data_to_load, datasets):
+            content_hash.update(data.encode("utf-8"))
+            content_hash.update(dataset if dataset is not None else b"")
+        content_hash = content_hash.hexdigest()
+
+        # Only parse the datasets if no other identifier has already given us this exact pack
+        entry = self.entries.get(content_hash)
+        if entry is None:
+            parsed_datasets = await asyncio.gather(*[io_executor.run(parse_dataset, dataset, path) for dataset in datasets])
+            for data, parsed_dataset in zip(data_to_load, parsed_datasets):
+                resource_pack.add_dataset(data, parsed_dataset)
+
+            entry = CachedResourcePack(content_hash, resource_pack)
+            self.entries[content_hash] = entry
+            self.loads += 1
+        else:
+            self.shared_loads += 1
+
+        # Point the identifier at the new content, letting go of whatever it pointed at before
+        previous = self.identifiers.get(identifier)
+        self.identifiers[identifier] = (fingerprint, content_hash)
+        self.paths[identifier] = path
+        self.resource_pack_index.watch_pack(path, fingerprint)
+        entry.identifiers.add(identifier)
+        if previous is not None and previous[1] != content_hash and previous[1] in self.entries:
+            previous_entry = self.entries[previous[1]]
+            previous_entry.identifiers.discard(identifier)
+            self.__update_idle(previous_entry)
+
+        self.__update_idle(entry)
+        return entry.resource_pack
+
+    def __pack_changed(self, path):
+        for identifier, pack_path in self.paths.items():
+            if path == pack_path or path.startswith(pack_path + os.sep):
+                self.changed.add(identifier)
+
+    def __is_referenced(self, entry):
+        return any(self.references.get(identifier, 0) > 0 for identifier in entry.identifiers)
+
+    def __update_idle(self, entry):
+        if self.__is_referenced(entry):
+            self.idle.pop(entry.content_hash, None)
+            return
+
+        self.idle[entry.content_hash] = None
+        self.idle.move_to_end(entry.content_hash)
+        self.__evict_idle()
+
+    def __evict_idle(self):
+        while len(self.idle) > self.max_idle:
+            content_hash, _ = self.idle.popitem(last=False)
+            entry = self.entries.pop(content_hash, None)
+            if entry is None:
+                continue
+
+            for identifier in entry.identifiers:
+                known = self.identifiers.get(identifier)
+                if known is not None and known[1] == content_hash:
+                    del self.identifiers[identifier]
+                    self.changed.discard(identifier)
+                    path = self.paths.pop(identifier, None)
+                    if path is not None and path not in self.paths.values():
+                        self.resource_pack_index.unwatch_pack(path)
+            self.evictions += 1
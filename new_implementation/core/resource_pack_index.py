@@ -0,0 +1,282 @@
+import asyncio
+import os
+
+from shared.io_executor import get_io_executor
+
+# inotify_simple is optional - without it (or off linux) changes are picked up by polling directory mtimes
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+    inotify_flags = None
+
+RESOURCE_PACK_DESCRIPTOR = "resource_pack.json"
+
+
+def get_modification_time(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def fingerprint_resource_pack(path):
+    # Cheap check for changes - the name, size and modification time of every file in the pack
+    if not os.path.isdir(path):
+        return None
+
+    fingerprint = list()
+    for name in sorted(os.listdir(path)):
+        try:
+            stat = os.stat(os.path.join(path, name))
+        except OSError:
+            continue
+        fingerprint.append((name, stat.st_size, stat.st_mtime_ns))
+
+    return tuple(fingerprint)
+
+
+class IndexedDirectory:
+    """
+    The resource packs directly within a search directory, along with the modification times of the directory and each
+    of its sub directories (a sub directory becomes a pack when a descriptor is added to it) at the time of the scan.
+    """
+
+    def __init__(self, path, packs, modification_times):
+        self.path = path
+        self.packs = packs
+        self.modification_times = modification_times
+        self.stale = False
+
+    def exists(self):
+        return self.modification_times[self.path] is not None
+
+
+class ResourcePackIndex:
+    """
+    An index of search directory -> resource packs so listing packs doesn't touch the file system.
+
+    The index is seeded by walking the data directory once at startup, directories that were not seen then are scanned
+    the first time they are asked for. Changes are picked up through inotify where it is available and by polling
+    modification times otherwise, only the directories that changed are rescanned.
+
+    Packs passed to watch_pack are also watched for changes to their files, listeners are called with the path of
+    whatever changed.
+    """
+
+    def __init__(self, root, poll_interval=30):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.directories = dict()
+        self.packs = dict()
+        self.listeners = list()
+
+        self.inotify = None
+        self.watches = dict()
+        self.watch_paths = dict()
+        self.poll_task = None
+
+    def configure(self, poll_interval=None):
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+
+    def is_using_inotify(self):
+        return self.inotify is not None
+
+    def is_watching(self):
+        return self.poll_task is not None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def watch_pack(self, path, fingerprint):
+        self.packs[path] = fingerprint
+        self.__add_watch(path)
+
+    def unwatch_pack(self, path):
+        self.packs.pop(path, None)
+
+    async def start(self):
+        await self.build()
+
+        # Prefer change notifications, falling back to polling if they can't be set up
+        if INotify is not None and self.inotify is None:
+            try:
+                self.inotify = INotify()
+                asyncio.get_event_loop().add_reader(self.inotify.fileno(), self.__read_inotify_events)
+                for directory in list(self.directories.values()):
+                    self.__watch(directory)
+                for path in self.packs:
+                    self.__add_watch(path)
+
+            except OSError as e:
+                print("Could not watch resource packs for changes, falling back to polling: " + str(e))
+                self.__close_inotify()
+
+        if self.poll_task is None:
+            self.poll_task = asyncio.get_event_loop().create_task(self.__run_polling())
+
+    def stop(self):
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
+
+        self.__close_inotify()
+
+    async def build(self):
+        self.directories = await get_io_executor().run(self.__build)
+
+    async def list_packs(self, search_path):
+        directory = self.directories.get(search_path)
+        if directory is None or directory.stale:
+            directory = await self.rescan(search_path)
+
+        return directory.packs
+
+    async def rescan(self, search_path):
+        directory = await get_io_executor().run(self.__scan, search_path)
+        self.directories[search_path] = directory
+        self.__watch(directory)
+        return directory
+
+    async def poll(self):
+        # With inotify running we only need to look out for directories that didn't exist when they were scanned
+        directories = [directory for directory in self.directories.values() if not directory.stale and (self.inotify is None or not directory.exists())]
+        changed = await get_io_executor().run(self.__find_changed, directories)
+        for directory in changed:
+            await self.rescan(directory.path)
+
+        # Changes to files within packs don't show up in directory modification times
+        changed_packs = list()
+        if self.inotify is None and self.packs:
+            changed_packs = await get_io_executor().run(self.__find_changed_packs, dict(self.packs))
+            for path, fingerprint in changed_packs:
+                if path in self.packs:
+                    self.packs[path] = fingerprint
+                self.__notify(path)
+
+        return len(changed) + len(changed_packs)
+
+    async def __run_polling(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                print("Resource pack polling failed: " + str(e))
+
+    def __build(self):
+        directories = dict()
+        for path, directory_names, file_names in os.walk(self.root):
+            if RESOURCE_PACK_DESCRIPTOR in file_names:
+                search_path = os.path.dirname(path)
+                if search_path not in directories:
+                    directories[search_path] = self.__scan(search_path)
+
+        return directories
+
+    @staticmethod
+    def __scan(search_path):
+        modification_times = {search_path: get_modification_time(search_path)}
+        packs = list()
+        if modification_times[search_path] is not None:
+            for name in sorted(os.listdir(search_path)):
+                path = os.path.join(search_path, name)
+                if not os.path.isdir(path):
+                    continue
+
+                modification_times[path] = get_modification_time(path)
+                if os.path.isfile(os.path.join(path, RESOURCE_PACK_DESCRIPTOR)):
+                    packs.append(name)
+
+        return IndexedDirectory(search_path, packs, modification_times)
+
+    @staticmethod
+    def __find_changed(directories):
+        changed = list()
+        for directory in directories:
+            for path, modification_time in directory.modification_times.items():
+                if get_modification_time(path) != modification_time:
+                    changed.append(directory)
+                    break
+
+        return changed
+
+    @staticmethod
+    def __find_changed_packs(packs):
+        changed = list()
+        for path, fingerprint in packs.items():
+            current = fingerprint_resource_pack(path)
+            if current != fingerprint:
+                changed.append((path, current))
+
+        return changed
+
+    def __notify(self, path):
+        for listener in self.listeners:
+            try:
+                listener(path)
+            except Exception as e:
+                print("Resource pack change listener failed for: " + path + " due to: " + str(e))
+
+    def __add_watch(self, path):
+        if self.inotify is None:
+            return None
+
+        # Every watch sees file writes as well, so a directory watched both as a pack and as part of a scan keeps both
+        mask = inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO | inotify_flags.DELETE_SELF | inotify_flags.MOVE_SELF | inotify_flags.CLOSE_WRITE
+        try:
+            watch_descriptor = self.inotify.add_watch(path, mask)
+        except OSError:
+            return None
+
+        self.watch_paths[watch_descriptor] = path
+        return watch_descriptor
+
+    def __watch(self, directory):
+        if self.inotify is None:
+            return
+
+        for path, modification_time in directory.modification_times.items():
+            if modification_time is None:
+                continue
+
+            watch_descriptor = self.__add_watch(path)
+            if watch_descriptor is None:
+                directory.stale = True
+                continue
+
+            self.watches.setdefault(watch_descriptor, set()).add(directory.path)
+
+    def __read_inotify_events(self):
+        for event in self.inotify.read(timeout=0):
+            # A file being written changes a pack's contents, but not which packs there are
+            if event.mask & ~inotify_flags.CLOSE_WRITE:
+                search_paths = self.watches.get(event.wd, set())
+                for search_path in search_paths:
+                    directory = self.directories.get(search_path)
+                    if directory is not None:
+                        directory.stale = True
+
+            watch_path = self.watch_paths.get(event.wd)
+            if watch_path is not None:
+                self.__notify(os.path.join(watch_path, event.name) if event.name else watch_path)
+
+            # The kernel has dropped the watch (i.e. the directory was deleted)
+            if event.mask & inotify_flags.IGNORED:
+                self.watches.pop(event.wd, None)
+                self.watch_paths.pop(event.wd, None)
+
+    def __close_inotify(self):
+        if self.inotify is None:
+            return
+
+        try:
+            asyncio.get_event_loop().remove_reader(self.inotify.fileno())
+        except (RuntimeError, ValueError):
+            pass
+
+        self.inotify.close()
+        self.inotify = None
+        self.watches = dict()
+        self.watch_paths = dict()
@@ -0,0 +1,138 @@
+import asyncio
+import os
+
+from new_implementation.core.resource_handler import ResourceHandler, load_module_shards
+from new_implementation.data.data import DataAccessObject, ModuleDataHolder
+from new_implementation.data.persistence import PersistenceLayer
+from new_implementation.data.sqlite_storage import SQLiteStorage
+
+DEFAULT_DATABASE_NAME = "dndiscord.sqlite3"
+
+
+def get_default_database_path(engine_context):
+    return os.path.join(engine_context, DEFAULT_DATABASE_NAME)
+
+
+def strip_extension(file_name):
+    # Game files are addressed by <game name>.json, the database only needs the game name
+    return os.path.splitext(file_name)[0]
+
+
+class SQLiteResourceHandler(ResourceHandler):
+    """
+    A resource handler that keeps guild, user and game data in SQLite rather than as individual files. Resource packs
+    are still read from the file system.
+    """
+
+    def __init__(self, engine, database_path=None):
+        super().__init__(engine)
+        if database_path is None:
+            database_path = get_default_database_path(self.engine_context)
+        self.storage = SQLiteStorage(database_path)
+
+    def get_storage(self):
+        return self.storage
+
+    async def load_resource_from_guild_resources(self, guild_id, file_name, dao):
+        dao.set_payload(await self.storage.load_guild_resource(guild_id, file_name))
+        return dao
+
+    async def save_resource_in_guild_resources(self, guild_id, file_name, dao):
+        await self.storage.save_guild_resource(guild_id, file_name, dao.get_payload())
+        return dao
+
+    async def load_resource_from_user_resources(self, user_id, file_name, dao):
+        dao.set_payload(await self.storage.load_user_resource(user_id, file_name))
+        return dao
+
+    async def save_resource_in_user_resources(self, user_id, file_name, dao):
+        await self.storage.save_user_resource(user_id, file_name, dao.get_payload())
+        return dao
+
+    async def load_resource_from_game_resources(self, guild_id, file_name, dao):
+        dao.set_payload(await self.storage.load_game(guild_id, strip_extension(file_name)))
+        return dao
+
+    async def save_resource_in_game_resources(self, guild_id, file_name, dao):
+        await self.storage.save_game(guild_id, strip_extension(file_name), dao.get_payload())
+        return dao
+
+    async def delete_resource_from_game_resources(self, guild_id, file_name):
+        await self.storage.delete_game(guild_id, strip_extension(file_name))
+
+    async def list_guilds(self):
+        return await self.storage.list_guilds()
+
+    async def list_games_in_guild(self, guild_id):
+        return await self.storage.list_games_in_guild(guild_id)
+
+    async def list_games_for_user(self, user_id):
+        return await self.storage.list_games_for_user(user_id)
+
+    async def close(self):
+        await super().close()
+        await self.storage.close()
+
+
+async def migrate_json_tree(engine_context, database_path=None):
+    """
+    One shot import of an existing <engine>_data file tree into a SQLite database. Journals are replayed as the files
+    are read, existing rows with the same keys are overwritten and the file tree itself is left untouched.
+    """
+    if database_path is None:
+        database_path = get_default_database_path(engine_context)
+
+    persistence = PersistenceLayer()
+    storage = SQLiteStorage(database_path)
+    counts = {"guilds": 0, "users": 0, "games": 0}
+    saves = list()
+
+    # Reads a data file, skipping anything that isn't one (journals, temporaries, resource pack folders)
+    async def read(path):
+        if not os.path.isfile(path) or path.endswith(PersistenceLayer.JOURNAL_SUFFIX) or os.path.basename(path).startswith("."):
+            return None
+
+        return (await persistence.load(path, DataAccessObject())).get_payload()
+
+    # Saves are queued up and released together so they are committed in large transactions
+    async def queue(count_key, save):
+        counts[count_key] += 1
+        saves.append(save)
+        if len(saves) >= 500:
+            await asyncio.gather(*saves)
+            saves.clear()
+
+    try:
+        guilds_path = os.path.join(engine_context, "guilds")
+        for guild_id in sorted(os.listdir(guilds_path)) if os.path.isdir(guilds_path) else list():
+            guild_path = os.path.join(guilds_path, guild_id)
+            for file_name in sorted(os.listdir(guild_path)):
+                payload = await read(os.path.join(guild_path, file_name))
+                if payload is not None:
+                    await queue("guilds", storage.save_guild_resource(guild_id, file_name, payload))
+
+            games_path = os.path.join(guild_path, "games")
+            for file_name in sorted(os.listdir(games_path)) if os.path.isdir(games_path) else list():
+                payload = await read(os.path.join(games_path, file_name))
+                if isinstance(payload, ModuleDataHolder):
+                    await load_module_shards(persistence, os.path.join(games_path, file_name), payload)
+                    for key in payload.get_module_data_keys():
+                        payload.mark_module_data_dirty(key)
+
+                if payload is not None:
+                    await queue("games", storage.save_game(guild_id, strip_extension(file_name), payload))
+
+        users_path = os.path.join(engine_context, "users")
+        for user_id in sorted(os.listdir(users_path)) if os.path.isdir(users_path) else list():
+            user_path = os.path.join(users_path, user_id)
+            for file_name in sorted(os.listdir(user_path)):
+                payload = await read(os.path.join(user_path, file_name))
+                if payload is not None:
+                    await queue("users", storage.save_user_resource(user_id, file_name, payload))
+
+        await asyncio.gather(*saves)
+
+    finally:
+        await storage.close()
+
+    return counts
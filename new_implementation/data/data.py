@@ -1,17 +1,23 @@
 import os
-import json
-from collections import OrderedDict
 
 from discord import Role
 
+from new_implementation.data.persistence import write_bytes_atomically
+from shared import serialization
+from shared.io_executor import get_io_executor
+from shared.serialization import SerializationModifier, ContextDependent, convert_to_dict, dict_to_obj, serializable
 
+
+@serializable
 class PermissionData:
     def __init__(self, minimum_execute_level=-1, allowed_roles=None):
         self.minimum_execute_level = minimum_execute_level
 
+        # Allowed roles are kept by name, games are stored apart from the guild's role interner so can't hold masks
+        # against it. The mask is built from the names when the permission is checked
         if allowed_roles is None:
-            allowed_roles = set()
-        self.allowed_roles = allowed_roles
+            allowed_roles = list()
+        self.allowed_roles = list(allowed_roles)
 
     def get_minimum_execution_level(self):
         return self.minimum_execute_level
@@ -22,11 +28,16 @@ class PermissionData:
     def get_allowed_roles(self):
         return self.allowed_roles
 
+    def get_allowed_role_mask(self, role_interner):
+        return role_interner.get_mask_for_names(self.allowed_roles)
+
     def add_allowed_role(self, role: Role):
-        self.allowed_roles.append(role.name)
+        if role.name not in self.allowed_roles:
+            self.allowed_roles.append(role.name)
 
     def remove_allowed_role(self, role: Role):
-        self.allowed_roles.remove(role.name)
+        if role.name in self.allowed_roles:
+            self.allowed_roles.remove(role.name)
 
 
 class PermissionHolder:
@@ -45,6 +56,13 @@ class PermissionHolder:
 
         return PermissionData()
 
+    def get_or_create_permissions_for(self, id):
+        # Use when the permissions are about to be changed, so the change is actually kept
+        if id not in self.permissions:
+            self.permissions[id] = PermissionData()
+
+        return self.permissions[id]
+
     def get_default_permissions_for(self, id):
         if id in self.permissions:
             return self.permissions[id]
@@ -52,96 +70,70 @@ class PermissionHolder:
         return PermissionData()
 
 
-class ModuleDataHolder:
+class ModuleDataHolder(SerializationModifier):
+    """
+    Holds per module state. Module data is never serialized with its holder, the storage layer persists each module
+    separately and only rewrites the modules that have been marked as dirty since the last save.
+
+    Reading a module doesn't mark it, so module data that is changed in place must be flagged with
+    mark_module_data_dirty for the change to be saved.
+    """
+
     def __init__(self, module_data=None):
+        super().__init__()
+        self.add_item_to_be_ignored("module_data")
+        self.add_item_to_be_ignored("unmaterialized_module_data")
+        self.add_item_to_be_ignored("dirty_module_keys")
+
         if module_data is None:
             module_data = dict()
         self.module_data = module_data
 
+        # Raw module data attached by the storage layer, only turned into objects when first asked for
+        self.unmaterialized_module_data = dict()
+
+        # Anything provided up front (i.e. older files with inline module data) has never been stored separately
+        self.dirty_module_keys = set(module_data.keys())
+
     def get_module_data(self, key):
+        if key in self.unmaterialized_module_data:
+            self.module_data[key] = serialization.rebuild(self.unmaterialized_module_data.pop(key))
+
         if key in self.module_data:
             return self.module_data[key]
         return None
 
     def set_module_data(self, key, module_data):
+        self.unmaterialized_module_data.pop(key, None)
         self.module_data[key] = module_data
+        self.dirty_module_keys.add(key)
 
+    def remove_module_data(self, key):
+        self.unmaterialized_module_data.pop(key, None)
+        self.module_data.pop(key, None)
+        self.dirty_module_keys.add(key)
 
-class SerializationModifier:
-    def __init__(self):
-        self.ignored_items = list()
-
-    def add_item_to_be_ignored(self, item):
-        self.ignored_items.append(item)
+    def get_module_data_keys(self):
+        return set(self.module_data.keys()) | set(self.unmaterialized_module_data.keys())
 
-    def get_dict_items_that_should_not_be_serialized(self):
-        return self.ignored_items
+    def mark_module_data_dirty(self, key):
+        self.dirty_module_keys.add(key)
 
+    def attach_unmaterialized_module_data(self, key, tree):
+        if key not in self.module_data:
+            self.unmaterialized_module_data[key] = tree
 
-class ContextDependent(SerializationModifier):
-    def __init__(self):
-        super().__init__()
-        self.current_path = None
-        self.add_item_to_be_ignored("current_path")
+    def take_dirty_module_data(self):
+        """
+        Returns the modules changed since the last call as key -> module data, None meaning the module was removed.
+        """
+        dirty_module_data = {key: self.get_module_data(key) for key in list(self.dirty_module_keys)}
+        self.dirty_module_keys = set()
+        return dirty_module_data
 
-    def set_file_location(self, path):
-        self.current_path = path
-
-
-def convert_to_dict(obj):
-    """
-    A function takes in a custom object and returns a dictionary representation of the object.
-    This dict representation includes meta data such as the object's module and class names.
-    """
-
-    #  Populate the dictionary with object meta data
-    obj_dict = OrderedDict()
-    obj_dict.update({
-        "__class__": obj.__class__.__name__,
-        "__module__": obj.__module__
-    })
-
-    #  Populate the dictionary with object properties
-    obj_dict.update(obj.__dict__)
-
-    # Do not serialize out anything we shouldn't
-    if isinstance(obj, SerializationModifier):
-        ignored_items = obj.get_dict_items_that_should_not_be_serialized()
-
-        # Loop through any provided items to remove them
-        for ignored_item in ignored_items:
-            del obj_dict[ignored_item]
-
-    return obj_dict
-
-
-def dict_to_obj(our_dict):
-    """
-    Function that takes in a dict and returns a custom object associated with the dict.
-    This function makes use of the "__module__" and "__class__" metadata in the dictionary
-    to know which object type to create.
-    """
-    if "__class__" in our_dict:
-        # Pop ensures we remove metadata from the dict to leave only the instance arguments
-        class_name = our_dict.pop("__class__")
-
-        # Get the module name from the dict and import it
-        module_name = our_dict.pop("__module__")
-
-        # We use the built in __import__ function since the module name is not yet known at runtime
-        components = module_name.split(".")
-        module = __import__(components[0])
-        for comp in components[1:]:
-            module = getattr(module, comp)
-
-        # Get the class from the module
-        class_ = getattr(module, class_name)
-
-        # Use dictionary unpacking to initialize the object
-        obj = class_(**our_dict)
-    else:
-        obj = our_dict
-    return obj
+    def restore_dirty_module_keys(self, keys):
+        # Used when a save fails so the changes go out with the next one
+        self.dirty_module_keys.update(keys)
 
 
 class DataAccessObject:
@@ -157,29 +149,26 @@ class DataAccessObject:
 
     async def load(self, path):
         self.path = path
-        self.payload = load(self.path)
+        self.payload = await get_io_executor().read(self.path, load)
 
     async def save(self, path):
         self.path = path
-        save(self.payload, self.path)
+        await get_io_executor().write(self.path, self.payload, serialization.dumps, write_bytes_atomically, snapshot=serialization.snapshot)
 
 
-def save(obj, file):
-    directory = os.path.dirname(file)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    data = json.dumps(obj, default=convert_to_dict, indent=4)
-    with open(file, "w") as json_file:
-        json_file.write(data)
+def save(obj, file, serializer=None):
+    write_bytes_atomically(file, serialization.dumps(obj, serializer=serializer))
 
 
 def load(file):
     if not os.path.isfile(file):
         return None
 
-    with open(file, "r") as json_file:
-        obj = json.load(json_file, object_hook=dict_to_obj)
-        if isinstance(obj, ContextDependent):
-            obj.set_file_location(os.path.dirname(file))
+    # The format is detected from the content so older json files remain readable whatever the current default is
+    with open(file, "rb") as data_file:
+        obj = serialization.loads(data_file.read())
 
-        return obj
+    if isinstance(obj, ContextDependent):
+        obj.set_file_location(os.path.dirname(file))
+
+    return obj
@@ -1,9 +1,11 @@
 from new_implementation.data.data import ModuleDataHolder, PermissionHolder
+from shared.serialization import serializable
 
 
+@serializable
 class GameData(ModuleDataHolder, PermissionHolder):
-    def __init__(self, guild_id, game_name, game_master_id, game_master_name, game_channel="", gm_channel="", players=None, permissions=None):
-        super().__init__()
+    def __init__(self, guild_id, game_name, game_master_id, game_master_name, game_channel="", gm_channel="", players=None, permissions=None, module_data=None):
+        super().__init__(module_data=module_data)
 
         self.guild_id = guild_id
         self.game_name = game_name
@@ -68,7 +70,7 @@ class GameData(ModuleDataHolder, PermissionHolder):
         return None
 
     def get_permission_level(self, permission_name):
-        if permission_name is self.permissions:
+        if permission_name in self.permissions:
             return self.permissions[permission_name]
         else:
             return -1
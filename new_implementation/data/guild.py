@@ -1,10 +1,13 @@
 from discord import Role
 
 from new_implementation.data.data import PermissionHolder
+from new_implementation.data.roles import RoleInterner
+from shared.serialization import serializable
 
 
+@serializable
 class GuildData(PermissionHolder):
-    def __init__(self, guild_id, log_channel_name="dndiscord-logging", game_category_prefix="[DnDiscord] ", game_channel_prefix="dndiscord-", game_channel_suffix="", game_gm_channel_prefix="dndiscord-", game_gm_channel_suffix="-gm", administrator_roles=None, games=None, permissions=None):
+    def __init__(self, guild_id, log_channel_name="dndiscord-logging", game_category_prefix="[DnDiscord] ", game_channel_prefix="dndiscord-", game_channel_suffix="", game_gm_channel_prefix="dndiscord-", game_gm_channel_suffix="-gm", administrator_role_mask=0, role_interner=None, games=None, permissions=None, administrator_roles=None):
         self.guild_id = guild_id
         self.log_channel_name = log_channel_name
         self.game_category_prefix = game_category_prefix
@@ -13,9 +16,12 @@ class GuildData(PermissionHolder):
         self.game_gm_channel_prefix = game_gm_channel_prefix
         self.game_gm_channel_suffix = game_gm_channel_suffix
 
-        if not administrator_roles:
-            administrator_roles = list()
-        self.administrator_roles = administrator_roles
+        if role_interner is None:
+            role_interner = RoleInterner()
+        self.role_interner = role_interner
+
+        # Older files list the administrator role names rather than a mask
+        self.administrator_role_mask = administrator_role_mask | self.role_interner.get_mask_for_names(administrator_roles)
 
         if not games:
             games = list()
@@ -25,14 +31,20 @@ class GuildData(PermissionHolder):
             permissions = dict()
         self.permissions = permissions
 
+    def get_role_interner(self):
+        return self.role_interner
+
+    def get_administrator_role_mask(self):
+        return self.administrator_role_mask
+
     def get_administrator_roles(self):
-        return self.administrator_roles
+        return self.role_interner.get_names_for_mask(self.administrator_role_mask)
 
     def add_administrative_role(self, role: Role):
-        self.administrator_roles.append(role.name)
+        self.administrator_role_mask |= 1 << self.role_interner.intern(role.name)
 
     def remove_administrative_role(self, role: Role):
-        self.administrator_roles.remove(role.name)
+        self.administrator_role_mask &= ~(1 << self.role_interner.intern(role.name))
 
     def get_log_channel_name(self):
         return self.log_channel_name
@@ -68,7 +80,7 @@ class GuildData(PermissionHolder):
         self.games.remove(game)
 
     def get_permission_level(self, permission_name):
-        if permission_name is self.permissions:
+        if permission_name in self.permissions:
             return self.permissions[permission_name]
         else:
             return -1
@@ -0,0 +1,438 @@
+import asyncio
+import contextlib
+import enum
+import json
+import os
+import tempfile
+import threading
+import zlib
+
+from shared import serialization
+from shared.io_executor import get_io_executor
+from shared.serialization import ContextDependent, convert_to_dict
+
+# File locking between processes, only one of these will be available depending on the platform
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+class FsyncPolicy(enum.IntEnum):
+    NEVER = 0
+    FILE = 1
+    FILE_AND_DIRECTORY = 2
+
+
+def write_bytes_atomically(path, data, fsync_policy=FsyncPolicy.NEVER):
+    """
+    Write data to a temporary file next to path and rename it over the top, so readers (and crashes) only ever see
+    the old or the new content, never a partially written file.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    file_descriptor, temporary_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=directory or None)
+    try:
+        with os.fdopen(file_descriptor, "wb") as temporary_file:
+            temporary_file.write(data)
+            temporary_file.flush()
+            if fsync_policy >= FsyncPolicy.FILE:
+                os.fsync(temporary_file.fileno())
+
+        os.replace(temporary_path, path)
+
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    # Persist the rename itself. Directories cannot be opened for syncing on windows so it is skipped there
+    if fsync_policy >= FsyncPolicy.FILE_AND_DIRECTORY and os.name != "nt":
+        directory_descriptor = os.open(directory or ".", os.O_RDONLY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
+
+
+def truncate_file(path, length):
+    with open(path, "r+b") as truncated_file:
+        truncated_file.truncate(length)
+
+
+def checksum(data):
+    return zlib.crc32(data)
+
+
+def get_file_identity(path):
+    # Atomic writes replace the file, so a changed inode (or size or modification time) means someone else wrote it
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class ProcessLocks:
+    """
+    Exclusive locks on paths shared between processes, i.e. shards writing to the same data directory. Paths are
+    striped across a fixed number of lock files so the directory doesn't fill up with one lock file per data file.
+    Every acquisition opens the lock file afresh so threads within a process also exclude each other.
+    """
+
+    def __init__(self, directory, stripes=256):
+        self.directory = directory
+        self.stripes = stripes
+        os.makedirs(directory, exist_ok=True)
+
+    def get_lock_path(self, path):
+        return os.path.join(self.directory, str(zlib.crc32(os.path.normcase(os.path.abspath(path)).encode("utf-8")) % self.stripes) + ".lock")
+
+    @contextlib.contextmanager
+    def hold(self, path):
+        lock_file = open(self.get_lock_path(path), "a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                lock_file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK only retries for around ten seconds before giving up
+                        continue
+
+            yield
+
+        finally:
+            # Closing the file releases the lock
+            lock_file.close()
+
+
+def encode_field(value):
+    # Journal entries are always compact json, whatever format the base file is in
+    return json.dumps(value, default=convert_to_dict, separators=(",", ":")).encode("utf-8")
+
+
+class FileState:
+    """
+    What we know about the file at a path since we last read or wrote it. The base checksum ties journal entries to
+    the exact base file they were written against and the field checksums let us spot which fields have changed.
+    """
+
+    def __init__(self, base_checksum, field_checksums, journal_entries=0, base_identity=None):
+        self.base_checksum = base_checksum
+        self.field_checksums = field_checksums
+        self.journal_entries = journal_entries
+        self.base_identity = base_identity
+
+
+class FullWrite:
+    def __init__(self, data, field_checksums):
+        self.data = data
+        self.field_checksums = field_checksums
+
+
+class JournalAppend:
+    def __init__(self, changed_fields, field_checksums, payload):
+        self.changed_fields = changed_fields
+        self.field_checksums = field_checksums
+        self.payload = payload
+
+
+class PersistenceLayer:
+    """
+    Crash safe storage of data access object payloads.
+
+    Every full write goes through a temporary file and a rename. When journaling is enabled, saving an object whose
+    top level fields mostly haven't changed appends just the changed fields to <path>.journal instead of rewriting the
+    whole file. Loading replays the journal on top of the base file and compaction folds the journal back into it.
+
+    When the data directory is shared with other processes a lock directory must be configured. Every access then
+    also holds a file lock, and journal appends check that the base file is still the one they were computed against.
+    """
+
+    JOURNAL_SUFFIX = ".journal"
+
+    def __init__(self, journal_enabled=False, fsync_policy=FsyncPolicy.FILE, compaction_threshold=64):
+        self.journal_enabled = journal_enabled
+        self.fsync_policy = fsync_policy
+        self.compaction_threshold = compaction_threshold
+
+        self.states = dict()
+        self.path_locks = dict()
+        self.path_locks_lock = threading.Lock()
+        self.process_locks = None
+
+    def configure(self, journal_enabled=None, fsync_policy=None, compaction_threshold=None, lock_directory=None):
+        if journal_enabled is not None:
+            self.journal_enabled = journal_enabled
+        if fsync_policy is not None:
+            self.fsync_policy = fsync_policy
+        if compaction_threshold is not None:
+            self.compaction_threshold = compaction_threshold
+        if lock_directory is not None:
+            self.process_locks = ProcessLocks(lock_directory)
+
+    def is_shared(self):
+        return self.process_locks is not None
+
+    async def load(self, path, dao):
+        dao.path = path
+        dao.set_payload(await get_io_executor().read(path, self.__read))
+        return dao
+
+    async def load_raw(self, path):
+        """
+        Load the plain dict and list tree stored at path (journal included) without rebuilding any objects.
+        """
+        return await get_io_executor().read(path, self.__read_raw)
+
+    async def save(self, path, dao):
+        dao.path = path
+        await get_io_executor().write(path, dao.get_payload(), lambda payload: self.__encode(path, payload), self.__apply, snapshot=serialization.snapshot)
+        return dao
+
+    async def delete(self, path):
+        await get_io_executor().wait_for_pending_write(path)
+        await get_io_executor().run(self.__delete, path)
+
+    async def compact(self, path):
+        # Let any queued save land first, the path lock then keeps us apart from anything queued after
+        await get_io_executor().wait_for_pending_write(path)
+        await get_io_executor().run(self.__compact, path)
+
+    async def compact_all(self):
+        for path, state in list(self.states.items()):
+            if state.journal_entries > 0:
+                await self.compact(path)
+
+    async def run_periodic_compaction(self, interval=300):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.compact_all()
+            except Exception as e:
+                print("Journal compaction failed: " + str(e))
+
+    def __get_path_lock(self, path):
+        with self.path_locks_lock:
+            lock = self.path_locks.get(path)
+            if lock is None:
+                lock = threading.Lock()
+                self.path_locks[path] = lock
+            return lock
+
+    @contextlib.contextmanager
+    def __lock(self, path):
+        with self.__get_path_lock(path):
+            if self.process_locks is None:
+                yield
+            else:
+                with self.process_locks.hold(path):
+                    yield
+
+    def __encode(self, path, payload):
+        # Called in the executor with a snapshot of the payload
+        # Anything that isn't a custom object (e.g. a plain dict) is always written in full
+        if not self.journal_enabled or not isinstance(payload, dict) or "__class__" not in payload:
+            data = serialization.dumps(payload)
+
+            # Nothing to do if the file already holds exactly this, which we can only know if nobody else writes to it
+            state = self.states.get(path)
+            if self.process_locks is None and state is not None and state.journal_entries == 0 and state.base_checksum == checksum(data):
+                return None
+
+            return FullWrite(data, None)
+
+        encoded_fields = {key: encode_field(value) for key, value in payload.items()}
+        field_checksums = {key: checksum(value) for key, value in encoded_fields.items()}
+
+        # We need a known base with the same shape to journal against and a journal that isn't overdue for compaction
+        state = self.states.get(path)
+        if state is None or state.field_checksums is None or state.field_checksums.keys() != field_checksums.keys() or state.journal_entries >= self.compaction_threshold:
+            return FullWrite(serialization.dumps(payload), field_checksums)
+
+        # Journal only the changed fields
+        changed = [key for key, value in field_checksums.items() if state.field_checksums[key] != value]
+        if not changed:
+            return None
+
+        return JournalAppend(b",".join(json.dumps(key).encode("utf-8") + b":" + encoded_fields[key] for key in changed), field_checksums, payload)
+
+    def __apply(self, path, operation):
+        if operation is None:
+            return
+
+        with self.__lock(path):
+            if isinstance(operation, JournalAppend):
+                # The base is only stamped under the path lock so a concurrent compaction can't leave us pointing at a stale base
+                state = self.states[path]
+
+                # Another process has rewritten the base since we last saw it, our changes have to go on top of theirs
+                if self.process_locks is not None and not self.__is_base_current(path, state):
+                    self.__rebase(path, operation)
+                    return
+
+                line = b'{"base":' + str(state.base_checksum).encode("utf-8") + b',"set":{' + operation.changed_fields + b"}}\n"
+                journal_path = path + PersistenceLayer.JOURNAL_SUFFIX
+                with open(journal_path, "ab") as journal_file:
+                    length = journal_file.tell()
+                    try:
+                        journal_file.write(line)
+                        journal_file.flush()
+                        if self.fsync_policy >= FsyncPolicy.FILE:
+                            os.fsync(journal_file.fileno())
+
+                    # Don't leave part of the entry behind for later appends to follow
+                    except BaseException:
+                        journal_file.truncate(length)
+                        raise
+
+                state.field_checksums = operation.field_checksums
+                state.journal_entries += 1
+
+            else:
+                write_bytes_atomically(path, operation.data, self.fsync_policy)
+                self.__remove_journal(path)
+                self.states[path] = FileState(checksum(operation.data), operation.field_checksums, base_identity=self.__get_identity(path))
+
+    def __is_base_current(self, path, state):
+        return os.path.isfile(path) and state.base_identity == get_file_identity(path)
+
+    def __rebase(self, path, operation):
+        # Only called with the path locked
+        if os.path.isfile(path):
+            with open(path, "rb") as data_file:
+                data = data_file.read()
+
+            serializer = serialization.detect_serializer(data)
+            tree = serializer.loads_raw(data)
+            self.__replay_journal(path + PersistenceLayer.JOURNAL_SUFFIX, checksum(data), tree)
+            tree.update(json.loads(b"{" + operation.changed_fields + b"}"))
+            data = serializer.dumps(tree)
+
+        # The base has been deleted from under us, so all we can do is write out everything we have
+        else:
+            data = serialization.dumps(operation.payload)
+
+        write_bytes_atomically(path, data, self.fsync_policy)
+        self.__remove_journal(path)
+        self.states[path] = FileState(checksum(data), operation.field_checksums, base_identity=get_file_identity(path))
+
+    def __get_identity(self, path):
+        # Only needed to spot other processes' writes
+        return get_file_identity(path) if self.process_locks is not None else None
+
+    def __read(self, path):
+        return self.__read_file(path, True)
+
+    def __read_raw(self, path):
+        return self.__read_file(path, False)
+
+    def __read_file(self, path, materialize):
+        with self.__lock(path):
+            if not os.path.isfile(path):
+                self.states.pop(path, None)
+                return None
+
+            with open(path, "rb") as data_file:
+                data = data_file.read()
+
+            # Fast path, nothing to replay
+            journal_path = path + PersistenceLayer.JOURNAL_SUFFIX
+            if not self.journal_enabled and not os.path.isfile(journal_path):
+                obj = serialization.loads(data) if materialize else serialization.loads_raw(data)
+                self.states[path] = FileState(checksum(data), None, base_identity=self.__get_identity(path))
+
+            else:
+                tree = serialization.loads_raw(data)
+                base_checksum = checksum(data)
+                journal_entries = self.__replay_journal(journal_path, base_checksum, tree)
+
+                # Field checksums of what we just read let the next save journal straight away
+                field_checksums = None
+                if isinstance(tree, dict) and "__class__" in tree:
+                    field_checksums = {key: checksum(encode_field(value)) for key, value in tree.items()}
+
+                self.states[path] = FileState(base_checksum, field_checksums, journal_entries, self.__get_identity(path))
+                obj = serialization.rebuild(tree) if materialize else tree
+
+        if isinstance(obj, ContextDependent):
+            obj.set_file_location(os.path.dirname(path))
+
+        return obj
+
+    def __replay_journal(self, journal_path, base_checksum, tree):
+        if not os.path.isfile(journal_path):
+            return 0
+
+        journal_entries = 0
+        good_length = 0
+        torn = False
+        with open(journal_path, "rb") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+
+                # A torn final line from a crash mid append - everything before it is still good
+                except ValueError:
+                    torn = True
+                    break
+
+                good_length += len(line)
+
+                # Entries written against an older base have already been folded into the current one
+                if entry["base"] != base_checksum:
+                    continue
+
+                tree.update(entry["set"])
+                journal_entries += 1
+
+        # Cut the torn line off, otherwise every later append would sit behind it and never be replayed
+        if torn:
+            truncate_file(journal_path, good_length)
+
+        return journal_entries
+
+    def __compact(self, path):
+        with self.__lock(path):
+            journal_path = path + PersistenceLayer.JOURNAL_SUFFIX
+            if not os.path.isfile(journal_path) or not os.path.isfile(path):
+                return
+
+            with open(path, "rb") as data_file:
+                data = data_file.read()
+
+            # Fold the journal in at the raw level, there is no need to rebuild the objects to do this
+            serializer = serialization.detect_serializer(data)
+            tree = serializer.loads_raw(data)
+            self.__replay_journal(journal_path, checksum(data), tree)
+            compacted = serializer.dumps(tree)
+            write_bytes_atomically(path, compacted, self.fsync_policy)
+            self.__remove_journal(path)
+
+            state = self.states.get(path)
+            if state is not None:
+                state.base_checksum = checksum(compacted)
+                state.journal_entries = 0
+                state.base_identity = self.__get_identity(path)
+
+    def __delete(self, path):
+        with self.__lock(path):
+            if os.path.exists(path):
+                os.remove(path)
+            self.__remove_journal(path)
+            self.states.pop(path, None)
+
+    @staticmethod
+    def __remove_journal(path):
+        journal_path = path + PersistenceLayer.JOURNAL_SUFFIX
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
@@ -0,0 +1,55 @@
+from shared.serialization import SerializationModifier, serializable
+
+
+@serializable
+class RoleInterner(SerializationModifier):
+    """
+    Interns role names into small per guild integers so that sets of roles can be held as bitmasks, role n being bit n.
+    Bits are handed out in order and never reused so anything persisted against them stays valid.
+    """
+
+    def __init__(self, role_bits=None):
+        super().__init__()
+        self.add_item_to_be_ignored("name_set_masks")
+
+        if role_bits is None:
+            role_bits = dict()
+        self.role_bits = role_bits
+
+        # Interning only ever adds bits, so a mask computed for a set of names is valid forever
+        self.name_set_masks = dict()
+
+    def intern(self, name):
+        bit = self.role_bits.get(name)
+        if bit is None:
+            bit = len(self.role_bits)
+            self.role_bits[name] = bit
+
+        return bit
+
+    def get_mask_for_names(self, names):
+        if not names:
+            return 0
+
+        key = frozenset(names)
+        mask = self.name_set_masks.get(key)
+        if mask is None:
+            mask = 0
+            for name in key:
+                mask |= 1 << self.intern(name)
+            self.name_set_masks[key] = mask
+
+        return mask
+
+    def get_mask_for_roles(self, roles):
+        # Roles we have never interned can't be part of any mask we hold, so they are skipped rather than interned
+        mask = 0
+        for role in roles:
+            bit = self.role_bits.get(role.name)
+            if bit is not None:
+                mask |= 1 << bit
+
+        return mask
+
+    def get_names_for_mask(self, mask):
+        return [name for name, bit in self.role_bits.items() if mask >> bit & 1]
@@ -0,0 +1,274 @@
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from new_implementation.core.instrumentation import PHASE_STORAGE, time_phase
+from new_implementation.data.data import ModuleDataHolder
+from shared import serialization
+from shared.serialization import convert_to_dict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (user_id, name)
+);
+CREATE TABLE IF NOT EXISTS games (
+    guild_id TEXT NOT NULL,
+    game_name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (guild_id, game_name)
+);
+CREATE TABLE IF NOT EXISTS module_data (
+    guild_id TEXT NOT NULL,
+    game_name TEXT NOT NULL,
+    module_key TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (guild_id, game_name, module_key)
+);
+CREATE TABLE IF NOT EXISTS user_games (
+    user_id TEXT NOT NULL,
+    guild_id TEXT NOT NULL,
+    game_name TEXT NOT NULL,
+    PRIMARY KEY (user_id, guild_id, game_name)
+);
+CREATE INDEX IF NOT EXISTS user_games_by_game ON user_games (guild_id, game_name);
+"""
+
+
+class PendingStatements:
+    def __init__(self, statements, future):
+        self.statements = statements
+        self.future = future
+
+
+class SQLiteStorage:
+    """
+    Guild, user and game data held in a single embedded SQLite database running in WAL mode.
+
+    All database access happens on one dedicated thread. Saves are encoded on the event loop straight away (so the
+    stored state is the state at the time of the call) and queued. Queued saves for the same row are coalesced and
+    everything queued while a transaction is running is committed together in the next one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dndiscord-sqlite")
+        self.connection = None
+        self.pending_writes = dict()
+        self.in_flight_writes = dict()
+        self.flush_task = None
+
+    def get_path(self):
+        return self.path
+
+    async def load_guild_resource(self, guild_id, name):
+        return await self.__read(("guilds", guild_id, name), "SELECT data FROM guilds WHERE guild_id = ? AND name = ?", (guild_id, name))
+
+    async def save_guild_resource(self, guild_id, name, payload):
+        statements = [("INSERT OR REPLACE INTO guilds (guild_id, name, data) VALUES (?, ?, ?)", (guild_id, name, serialization.dumps(payload)))]
+        await self.__write(("guilds", guild_id, name), statements)
+
+    async def load_user_resource(self, user_id, name):
+        return await self.__read(("users", user_id, name), "SELECT data FROM users WHERE user_id = ? AND name = ?", (user_id, name))
+
+    async def save_user_resource(self, user_id, name, payload):
+        statements = [("INSERT OR REPLACE INTO users (user_id, name, data) VALUES (?, ?, ?)", (user_id, name, serialization.dumps(payload)))]
+        await self.__write(("users", user_id, name), statements)
+
+    async def load_game(self, guild_id, game_name):
+        # Module rows are written under their own keys so wait for the lot
+        await self.flush()
+        return await self.__run(self.__load_game, guild_id, game_name)
+
+    async def save_game(self, guild_id, game_name, payload):
+        writes = [self.__write(("games", guild_id, game_name), self.__encode_game(guild_id, game_name, payload))]
+
+        # Only the modules that have changed are written, each as its own row so they coalesce independently
+        if isinstance(payload, ModuleDataHolder):
+            dirty_module_data = payload.take_dirty_module_data()
+            for module_key, module_data in dirty_module_data.items():
+                writes.append(self.__write(("module_data", guild_id, game_name, module_key), self.__encode_module_data(guild_id, game_name, module_key, module_data)))
+
+            try:
+                await asyncio.gather(*writes)
+            except Exception:
+                payload.restore_dirty_module_keys(dirty_module_data.keys())
+                raise
+
+        else:
+            await asyncio.gather(*writes)
+
+    async def delete_game(self, guild_id, game_name):
+        # Queued module writes would otherwise be able to land after the delete in the same transaction
+        for key, pending in self.pending_writes.items():
+            if key[0] == "module_data" and key[1] == guild_id and key[2] == game_name:
+                pending.statements = list()
+
+        await self.__write(("games", guild_id, game_name), [
+            ("DELETE FROM games WHERE guild_id = ? AND game_name = ?", (guild_id, game_name)),
+            ("DELETE FROM module_data WHERE guild_id = ? AND game_name = ?", (guild_id, game_name)),
+            ("DELETE FROM user_games WHERE guild_id = ? AND game_name = ?", (guild_id, game_name))
+        ])
+
+    async def list_guilds(self):
+        await self.flush()
+        return [row[0] for row in await self.__query("SELECT DISTINCT guild_id FROM guilds ORDER BY guild_id", ())]
+
+    async def list_games_in_guild(self, guild_id):
+        await self.flush()
+        return [row[0] for row in await self.__query("SELECT game_name FROM games WHERE guild_id = ? ORDER BY game_name", (guild_id,))]
+
+    async def list_games_for_user(self, user_id):
+        await self.flush()
+        return [(row[0], row[1]) for row in await self.__query("SELECT guild_id, game_name FROM user_games WHERE user_id = ? ORDER BY guild_id, game_name", (user_id,))]
+
+    async def flush(self):
+        if self.flush_task is not None:
+            await asyncio.shield(self.flush_task)
+
+    async def close(self):
+        await self.flush()
+        await self.__run(self.__disconnect)
+        self.executor.shutdown(wait=True)
+
+    @staticmethod
+    def __encode_game(guild_id, game_name, payload):
+        fields = convert_to_dict(payload)
+
+        # Index everyone taking part so "which games am I in" is a single lookup
+        members = list()
+        game_master_id = fields.get("game_master_id")
+        if game_master_id:
+            members.append(str(game_master_id))
+        for player in fields.get("players", None) or list():
+            if isinstance(player, str) and player not in members:
+                members.append(player)
+
+        statements = [
+            ("INSERT OR REPLACE INTO games (guild_id, game_name, data) VALUES (?, ?, ?)", (guild_id, game_name, serialization.dumps(fields))),
+            ("DELETE FROM user_games WHERE guild_id = ? AND game_name = ?", (guild_id, game_name))
+        ]
+        statements.extend(("INSERT INTO user_games (user_id, guild_id, game_name) VALUES (?, ?, ?)", (member, guild_id, game_name)) for member in members)
+        return statements
+
+    @staticmethod
+    def __encode_module_data(guild_id, game_name, module_key, module_data):
+        if module_data is None:
+            return [("DELETE FROM module_data WHERE guild_id = ? AND game_name = ? AND module_key = ?", (guild_id, game_name, module_key))]
+
+        return [("INSERT OR REPLACE INTO module_data (guild_id, game_name, module_key, data) VALUES (?, ?, ?, ?)", (guild_id, game_name, module_key, serialization.dumps(module_data)))]
+
+    async def __read(self, key, sql, parameters):
+        await self.__wait_for_write(key)
+        rows = await self.__query(sql, parameters)
+        if not rows:
+            return None
+
+        return serialization.loads(rows[0][0])
+
+    async def __query(self, sql, parameters):
+        return await self.__run(self.__execute_query, sql, parameters)
+
+    async def __run(self, function, *args):
+        loop = asyncio.get_event_loop()
+        with time_phase(PHASE_STORAGE):
+            return await loop.run_in_executor(self.executor, function, *args)
+
+    async def __wait_for_write(self, key):
+        # Reads always see our own writes, even those that are still queued
+        pending = self.pending_writes.get(key) or self.in_flight_writes.get(key)
+        if pending is not None:
+            await asyncio.wait([pending.future])
+
+    async def __write(self, key, statements):
+        # A newer write to the same row replaces the queued one, both callers wait on the same commit
+        pending = self.pending_writes.get(key)
+        if pending is None:
+            pending = PendingStatements(statements, asyncio.get_event_loop().create_future())
+            self.pending_writes[key] = pending
+        else:
+            pending.statements = statements
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.get_event_loop().create_task(self.__drain())
+
+        await asyncio.shield(pending.future)
+
+    async def __drain(self):
+        try:
+            while self.pending_writes:
+                self.in_flight_writes = self.pending_writes
+                self.pending_writes = dict()
+
+                batch = [statement for pending in self.in_flight_writes.values() for statement in pending.statements]
+                try:
+                    await self.__run(self.__execute_batch, batch)
+                except Exception as e:
+                    for pending in self.in_flight_writes.values():
+                        pending.future.set_exception(e)
+                else:
+                    for pending in self.in_flight_writes.values():
+                        pending.future.set_result(None)
+
+                self.in_flight_writes = dict()
+
+        finally:
+            self.flush_task = None
+
+    def __get_connection(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+
+            # Autocommit mode, transactions are managed explicitly in __execute_batch. Shards share the database so we
+            # wait a while for another process' write to finish rather than failing straight away
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self.connection = connection
+
+        return self.connection
+
+    def __disconnect(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __execute_query(self, sql, parameters):
+        return self.__get_connection().execute(sql, parameters).fetchall()
+
+    def __execute_batch(self, statements):
+        connection = self.__get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, parameters in statements:
+                connection.execute(sql, parameters)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        connection.execute("COMMIT")
+
+    def __load_game(self, guild_id, game_name):
+        connection = self.__get_connection()
+        row = connection.execute("SELECT data FROM games WHERE guild_id = ? AND game_name = ?", (guild_id, game_name)).fetchone()
+        if row is None:
+            return None
+
+        game = serialization.loads(row[0])
+        if isinstance(game, ModuleDataHolder):
+            for module_key, data in connection.execute("SELECT module_key, data FROM module_data WHERE guild_id = ? AND game_name = ?", (guild_id, game_name)):
+                game.attach_unmaterialized_module_data(module_key, serialization.loads_raw(data))
+
+        return game
@@ -1,3 +1,7 @@
+from shared.serialization import serializable
+
+
+@serializable
 class UserData:
     def __init__(self, user_id, games=None):
         self.user_id = user_id
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import argparse
 
@@ -5,15 +6,21 @@ from modules.business_simulator.data import business_data_pack
 from modules.business_simulator.gui.business_simulator_gui import BusinessSimulatorGUI
 
 # This is a small standalone executable that allows you to either generate a business data pack programmatically or through the GUI
+from new_implementation.core.resource_handler import get_engine_context
+from new_implementation.core.sqlite_resource_handler import migrate_json_tree
 from new_implementation.runtimes.bot_runtime.dndiscord_bot import DNDiscordBot
+from new_implementation.runtimes.sharded_runtime.supervisor import ShardSupervisor
 from new_implementation.data import data
 
 
 # Parse the runtime arguments
 parser = argparse.ArgumentParser()
-parser.add_argument("-r", "--runtime", dest="runtime", help="The runtime type of dndiscord. Valid options are: bot, pack_dump, pack_editor", type=str, default="bot", choices=['bot', 'pack_dump', 'pack_editor'])
+parser.add_argument("-r", "--runtime", dest="runtime", help="The runtime type of dndiscord. Valid options are: bot, sharded, pack_dump, pack_editor, migrate_sqlite", type=str, default="bot", choices=['bot', 'sharded', 'pack_dump', 'pack_editor', 'migrate_sqlite'])
 parser.add_argument("-c", "--config", dest="config", help="The location of the configuration file for the bot", type=str, default="./config.json")
 parser.add_argument("-f", "--file", dest="file", help="The location of the python file to load when attempting to dump a programmatically created data pack", type=str)
+parser.add_argument("-d", "--debug", dest="debug", help="Profile the event loop, reporting anything that blocks it and writing the stacks to disk", action="store_true")
+parser.add_argument("-s", "--shards", dest="shards", help="The number of shards (and worker processes) to run with the sharded runtime, defaults to the shard_count config or the number of cpus", type=int)
+parser.add_argument("--data", dest="data", help="The data directory to migrate into sqlite, defaults to the bot's own data directory", type=str)
 args = parser.parse_args()
 
 # Runtime as bot
@@ -27,7 +34,22 @@ if args.runtime == "bot":
             exit(1)
 
         dnd_bot = DNDiscordBot(config_data)
-        dnd_bot.run()
+        dnd_bot.run(debug=args.debug)
+
+    else:
+        print("Please supply a valid configuration file.")
+
+# Runtime as a supervisor of sharded bot processes
+elif args.runtime == "sharded":
+    if args.config and os.path.isfile(args.config):
+        config_data = data.load(args.config)
+        if "discord_token" not in config_data:
+            print("Invalid configuration file provided.")
+            exit(1)
+
+        shard_count = args.shards or (int(config_data["shard_count"]) if "shard_count" in config_data else os.cpu_count() or 1)
+        supervisor = ShardSupervisor(config_data, shard_count, debug=args.debug)
+        supervisor.run()
 
     else:
         print("Please supply a valid configuration file.")
@@ -43,3 +65,15 @@ elif args.runtime == "pack_dump":
 elif args.runtime == "pack_editor":
     business_gui = BusinessSimulatorGUI()
     business_gui.mainloop()
+
+# Import the existing file based bot data into a sqlite database
+elif args.runtime == "migrate_sqlite":
+    config_data = data.load(args.config) if args.config and os.path.isfile(args.config) else dict()
+    database_path = config_data["sqlite_path"] if "sqlite_path" in config_data else None
+    engine_context = args.data or get_engine_context(DNDiscordBot.ENGINE_NAME)
+    if not os.path.isdir(engine_context):
+        print("There is no data directory at: " + engine_context)
+        exit(1)
+
+    counts = asyncio.run(migrate_json_tree(engine_context, database_path))
+    print("Migrated " + str(counts["guilds"]) + " guild files, " + str(counts["users"]) + " user files and " + str(counts["games"]) + " games.")
@@ -16,13 +16,13 @@ class CalendarCog(DnDiscordCog, GameStateListener):
     def __init__(self, engine):
         super().__init__(engine)
 
-        self.calendar_resource_pack_cache = dict()
+        self.resource_pack_references = dict()
         self.engine.register_event_class(CalendarStateListener)
         self.engine.register_event_class_listener(GameStateListener, self)
 
     async def game_created(self, ctx, game):
         game.set_module_data(CalendarCog.module_data_key, CalendarHolderData())
-        self.engine.save_game(game)
+        await self.engine.save_game(ctx, game)
 
     async def game_started(self, ctx, game):
         calendar_holder = game.get_module_data(CalendarCog.module_data_key)
@@ -31,7 +31,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         if calendar_holder is None:
             calendar_holder = CalendarHolderData()
             game.set_module_data(CalendarCog.module_data_key, calendar_holder)
-            self.engine.save_game(ctx, game)
+            await self.engine.save_game(ctx, game)
             return
 
         # Get associated calendars and display reminders
@@ -41,7 +41,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             await self.__today(ctx, reminder_type="GM")
 
     async def game_about_to_end(self, ctx, game):
-        return
+        self.release_resource_packs_for_guild(utils.get_guild_id_from_context(ctx))
 
     async def game_deleting(self, ctx, game):
         return
@@ -56,25 +56,35 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         if calendar_holder is None:
             calendar_holder = CalendarHolderData()
             game.set_module_data(CalendarCog.module_data_key, calendar_holder)
-            self.engine.save_game(ctx, game)
+            await self.engine.save_game(ctx, game)
 
         return game, calendar_holder
 
     async def load_resource_pack_for_calendar(self, ctx, resource_pack_key):
-        if resource_pack_key not in self.calendar_resource_pack_cache:
-            resource_pack = await self.engine.get_resource_handler().load_resource_pack(ctx, resource_pack_key)
-            if resource_pack is None:
-                return "The resource pack was not found."
+        resource_pack_cache = self.engine.get_resource_pack_cache()
 
-            calendar_pack_data = resource_pack.get_dataset("calendar_format.json")
-            if not isinstance(calendar_pack_data, CalendarResourcePack):
-                return "The resource pack provided does not implement the correct parent class"
+        # The guild holds a reference on each pack it uses until its game ends so the pack stays loaded
+        references = self.resource_pack_references.setdefault(utils.get_guild_id_from_context(ctx), set())
+        if resource_pack_key in references:
+            resource_pack = await resource_pack_cache.get(resource_pack_key)
+        else:
+            resource_pack = await resource_pack_cache.acquire(resource_pack_key)
+            if resource_pack is not None:
+                references.add(resource_pack_key)
 
-            # Cache the calendar and let the user know it was added to our game
-            self.calendar_resource_pack_cache[resource_pack_key] = calendar_pack_data
+        if resource_pack is None:
+            return "The resource pack was not found."
 
-        else:
-            return self.calendar_resource_pack_cache[resource_pack_key]
+        calendar_pack_data = resource_pack.get_dataset("calendar_format.json")
+        if not isinstance(calendar_pack_data, CalendarResourcePack):
+            return "The resource pack provided does not implement the correct parent class"
+
+        return calendar_pack_data
+
+    def release_resource_packs_for_guild(self, guild_id):
+        resource_pack_cache = self.engine.get_resource_pack_cache()
+        for resource_pack_key in self.resource_pack_references.pop(guild_id, set()):
+            resource_pack_cache.release(resource_pack_key)
 
     @commands.command(name="calendar:list_available")
     async def list_available_command(self, ctx: commands.Context):
@@ -118,7 +128,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             return await send_message(ctx, reason)
 
         # List all calendars
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendars = calendar_holder.get_calendars()
         long_message = LongMessage()
         long_message.add("The following calendars are running in the game: " + game.get_name())
@@ -169,11 +179,12 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             return await send_message(ctx, "The custom CalendarData implementation in the selected resource pack is not valid.")
 
         # Add calendar data with the information for this calendar
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar_holder.add_calendar(nickname, calendar)
 
         # Save the data
-        self.engine.save_game(ctx, game)
+        game.mark_module_data_dirty(CalendarCog.module_data_key)
+        await self.engine.save_game(ctx, game)
         return await send_message(ctx, "Added a calendar called: " + nickname + " with archetype id: " + resource_pack_key + ". Self described as: " + calendar_handler.get_description())
 
     @commands.command(name="calendar:date_format")
@@ -194,13 +205,13 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             return await send_message(ctx, reason)
 
         # Get the calendar holder for this game
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "There is no calendar with that nickname associated with this game")
 
         # Load the resource pack
-        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar)
+        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar.get_archetype_id())
         if isinstance(calendar_resource_pack, str):
             return await send_message(ctx, calendar_resource_pack)
 
@@ -225,13 +236,13 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             return await send_message(ctx, reason)
 
         # Get the calendar holder for this game
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "There is no calendar with that nickname associated with this game")
 
         # Load the resource pack
-        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar)
+        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar.get_archetype_id())
         if isinstance(calendar_resource_pack, str):
             return await send_message(ctx, calendar_resource_pack)
 
@@ -256,19 +267,18 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             return await send_message(ctx, reason)
 
         # Get the calendar holder for this game
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "There is no calendar with that nickname associated with this game.")
 
         # Load the resource pack
-        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar)
+        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar.get_archetype_id())
         if isinstance(calendar_resource_pack, str):
             return await send_message(ctx, calendar_resource_pack)
 
         # Query the calendar for the current tick state and translate it to the current date in the context of the calendar
-        ticks = calendar.get_ticks_passed()
-        return await send_message(ctx, calendar_resource_pack.get_holder().generate_current_time(ticks))
+        return await send_message(ctx, await calendar_resource_pack.get_handler().generate_current_time(calendar))
 
     @commands.command(name="calendar:increment")
     async def tick_command(self, ctx: commands.Context, *, nickname: str):
@@ -284,24 +294,23 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             return await send_message(ctx, reason)
 
         # Get the calendar holder for this game
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "There is no calendar with that nickname associated with this game.")
 
         # Load the resource pack
-        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar)
+        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar.get_archetype_id())
         if isinstance(calendar_resource_pack, str):
             return await send_message(ctx, calendar_resource_pack)
         calendar_handler = calendar_resource_pack.get_handler()
 
         # Increment
-        calendar_handler.increment_ticks(calendar)
-        await send_message(ctx, calendar_handler.generate_current_time(calendar))
+        await calendar_handler.increment_ticks(calendar)
+        await send_message(ctx, await calendar_handler.generate_current_time(calendar))
 
         # Inform tick listeners
-        for listener in self.engine.get_event_class_listeners(CalendarStateListener):
-            await listener.tick_occured(ctx, game, nickname)
+        self.engine.post_event(CalendarStateListener, "tick_occured", ctx, game, nickname)
 
         # Display any reminders for today
         await self.__today(ctx, nickname=nickname, reminder_type="private")
@@ -314,6 +323,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
                 calendar.add_reminder(reminder.get_author_id(), reminder.get_reminder_type(), calendar.get_ticks_passed() + reminder.get_recurring(), reminder.get_description(), reminder.get_recurring())
 
         # Save the game
+        game.mark_module_data_dirty(CalendarCog.module_data_key)
         return await self.engine.save_game(ctx, game)
 
     @commands.command(name="calendar:add_party_reminder_in")
@@ -333,7 +343,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -362,7 +372,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -395,7 +405,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -424,7 +434,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -457,7 +467,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -486,7 +496,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -511,7 +521,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             return await send_message(ctx, "The final part of your arguments to this function should be a round number representing the number of calendar ticks to elapse before the reminder is triggered.")
 
         # Get the resource pack for translations of the reminder
-        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar)
+        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar.get_archetype_id())
         if isinstance(calendar_resource_pack, str):
             return await send_message(ctx, calendar_resource_pack)
         calendar_handler = calendar_resource_pack.get_handler()
@@ -519,6 +529,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         # Create and append a reminder
         author_id = utils.get_user_id_from_context(ctx)
         reminder = calendar.add_reminder(ticks, info, author_id, reminder_type, recurring)
+        game.mark_module_data_dirty(CalendarCog.module_data_key)
         await self.engine.save_game(ctx, game)
         return await send_message(ctx, "Added reminder: " + calendar_handler.translate_reminder(reminder, calendar))
 
@@ -539,7 +550,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -568,7 +579,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -601,7 +612,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -630,7 +641,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -663,7 +674,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -692,7 +703,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         parts = info.split(" ", 1)
         nickname = parts[0]
         info = info.replace(nickname, "").strip()
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -710,7 +721,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
 
     async def __add_reminder_on(self, ctx: commands.Context, game, calendar, info: str, reminder_type: str, recurring=0):
         # Get the resource pack for translations of the reminder
-        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar)
+        calendar_resource_pack = await self.load_resource_pack_for_calendar(ctx, calendar.get_archetype_id())
         if isinstance(calendar_resource_pack, str):
             return await send_message(ctx, calendar_resource_pack)
         calendar_handler = calendar_resource_pack.get_handler()
@@ -724,6 +735,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         # Create and append a reminder
         author_id = utils.get_user_id_from_context(ctx)
         reminder = calendar.add_reminder(ticks, info, author_id, reminder_type, recurring)
+        game.mark_module_data_dirty(CalendarCog.module_data_key)
         await self.engine.save_game(ctx, game)
         return await send_message(ctx, "Added reminder: " + calendar_handler.translate_reminder(reminder, calendar))
 
@@ -740,7 +752,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         # Attempt to identify the nickname of the targeted calendar
         parts = info.split(" ", 1)
         nickname = parts[0]
-        game, calendar_holder = self.get_game_and_calendar_data(ctx)
+        game, calendar_holder = await self.get_game_and_calendar_data(ctx)
         calendar = calendar_holder.get_calendar(nickname)
         if not calendar:
             return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -757,6 +769,8 @@ class CalendarCog(DnDiscordCog, GameStateListener):
 
         # Inform
         if outcome:
+            game.mark_module_data_dirty(CalendarCog.module_data_key)
+            await self.engine.save_game(ctx, game)
             return await send_message(ctx, "Removed reminder with description: " + info)
         else:
             return await send_message(ctx, "Could not find a reminder with the description: " + info)
@@ -811,7 +825,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             gm_permissions, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, "calendar:today:" + nickname, permissions_level=PermissionLevel.GAME_MASTER)
 
             # Get the specified calendar
-            game, calendar_holder = self.get_game_and_calendar_data(ctx)
+            game, calendar_holder = await self.get_game_and_calendar_data(ctx)
             calendar = calendar_holder.get_calendar(nickname)
             if not calendar:
                 return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -831,7 +845,12 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         # Loop through our calendars
         else:
             added_header = False
-            game, calendar_holder = self.get_game_and_calendar_data(ctx)
+
+            # The game may have ended before we got here, i.e. when called by the game_started listener
+            game_and_calendar = await self.get_game_and_calendar_data(ctx)
+            if game_and_calendar is None:
+                return
+            game, calendar_holder = game_and_calendar
             for nickname, calendar in calendar_holder.get_calendars().items():
                 # Check if the user is the gm (or an admin) for the game they want to activate. Note it will also fail if the game does not exist
                 party_permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, "calendar:today:" + nickname, permissions_level=PermissionLevel.GAME_MASTER)
@@ -919,7 +938,7 @@ class CalendarCog(DnDiscordCog, GameStateListener):
             gm_permissions, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, "calendar:today:" + nickname, permissions_level=PermissionLevel.GAME_MASTER)
 
             # Get the specified calendar
-            game, calendar_holder = self.get_game_and_calendar_data(ctx)
+            game, calendar_holder = await self.get_game_and_calendar_data(ctx)
             calendar = calendar_holder.get_calendar(nickname)
             if not calendar:
                 return await send_message(ctx, "The identified nickname:" + nickname + " was not a calendar associated with this guild's current game.")
@@ -940,7 +959,12 @@ class CalendarCog(DnDiscordCog, GameStateListener):
         # Loop through our calendars
         else:
             added_header = False
-            game, calendar_holder = self.get_game_and_calendar_data(ctx)
+
+            # The game may have ended before we got here, i.e. when called by the game_started listener
+            game_and_calendar = await self.get_game_and_calendar_data(ctx)
+            if game_and_calendar is None:
+                return
+            game, calendar_holder = game_and_calendar
             for nickname, calendar in calendar_holder.get_calendars().items():
                 # Check if the user is the gm (or an admin) for the game they want to activate. Note it will also fail if the game does not exist
                 permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, "calendar:list:" + nickname, permissions_level=PermissionLevel.PARTY)
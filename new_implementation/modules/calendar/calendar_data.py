@@ -1,7 +1,8 @@
-from new_implementation.data.data import SerializationModifier
+from new_implementation.data.data import SerializationModifier, serializable
 from new_implementation.utils import utils
 
 
+@serializable
 class Reminder:
     def __init__(self, absolute_tick_date, description, author_id, reminder_type, recurring=0):
         self.absolute_tick_date = absolute_tick_date
@@ -26,6 +27,7 @@ class Reminder:
         return self.recurring
 
 
+@serializable
 class CalendarData:
     def __init__(self, archetype_id, ticks_passed=0, reminders=None):
         self.archetype_id = archetype_id
@@ -102,6 +104,7 @@ class CalendarHandler:
         pass
 
 
+@serializable
 class CalendarResourcePack(SerializationModifier):
     def __init__(self, path_to_calendar_data, path_to_calendar_handler):
         super().__init__()
@@ -120,9 +123,12 @@ class CalendarResourcePack(SerializationModifier):
         return self.data(resource_pack_key)
 
 
+@serializable
 class CalendarHolderData:
-    def __init__(self):
-        self.calendars = dict()
+    def __init__(self, calendars=None):
+        if calendars is None:
+            calendars = dict()
+        self.calendars = calendars
 
     def add_calendar(self, key, calendar):
         self.calendars[key] = calendar
@@ -130,3 +136,6 @@ class CalendarHolderData:
     def get_calendars(self):
         return self.calendars
 
+    def get_calendar(self, key):
+        return self.calendars.get(key)
+
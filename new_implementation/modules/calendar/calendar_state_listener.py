@@ -1,3 +1,6 @@
 class CalendarStateListener:
     async def day_passed(self, ctx, game):
         pass
+
+    async def tick_occured(self, ctx, game, nickname):
+        pass
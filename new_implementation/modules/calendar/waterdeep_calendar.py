@@ -1,4 +1,5 @@
 from new_implementation.modules.calendar.calendar_data import CalendarHandler, CalendarData, Reminder
+from shared.serialization import serializable
 
 # TODO: Translation integration
 from new_implementation.utils import strings
@@ -21,17 +22,18 @@ demo waterdeep resource pack - note wont work because of the lack of class info!
 """
 
 
+@serializable
 class WaterdeepCalendarData(CalendarData):
-    def __init__(self, archetype_id, ticks_passed=0, reminders=None):
+    def __init__(self, archetype_id, ticks_passed=0, reminders=None, start_year=1440, start_month=1, start_day=1, current_year=1440, current_month=1, current_day=1):
         super().__init__(archetype_id=archetype_id, ticks_passed=ticks_passed, reminders=reminders)
 
-        self.start_year = 1440
-        self.start_month = 1
-        self.start_day = 1
+        self.start_year = start_year
+        self.start_month = start_month
+        self.start_day = start_day
 
-        self.current_year = 1440
-        self.current_month = 1
-        self.current_day = 1
+        self.current_year = current_year
+        self.current_month = current_month
+        self.current_day = current_day
 
     def copy(self):
         new_calendar = WaterdeepCalendarData(self.archetype_id, self.ticks_passed, self.reminders)
@@ -158,13 +160,13 @@ class WaterdeepCalendarHandler(CalendarHandler):
             translation_string += str(day) + "th of "
 
         # Month
-        translation_string += self.months[month][0]
+        translation_string += self.months[month - 1][0]
 
         # Year
         translation_string += " " + str(year)
 
         # Season
-        translation_string += self.months[month][2]
+        translation_string += self.months[month - 1][2]
 
         # If special day!
         for special_day in self.special_days:
@@ -187,7 +189,7 @@ class WaterdeepCalendarHandler(CalendarHandler):
 
     async def __get_max_day_count_for_month(self, year, month):
         # Normal month days
-        month_tuple = self.months[month]
+        month_tuple = self.months[month - 1]
         month_days = month_tuple[1]
 
         # Check year conditional modifiers
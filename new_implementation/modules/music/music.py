@@ -1,4 +1,11 @@
-from new_implementation.audio.audio import AudioCog
+from discord.ext import commands
+
+from new_implementation.audio.audio import AudioCog, AmbiancePlayer, Track, MAX_LAYERS, PLAYLIST_LAYER
+from new_implementation.audio.resolver import get_track_resolver
+from new_implementation.audio.sources.local_source import LocalSource
+from new_implementation.audio.sources.ytdl_source import YTDLSource
+from new_implementation.core.permissions_handler import PermissionLevel
+from new_implementation.utils.message import send_message, LongMessage
 
 
 class MusicCog(AudioCog):
@@ -7,5 +14,166 @@ class MusicCog(AudioCog):
 
 
 class AmbianceCog(AudioCog):
+    player_type = AmbiancePlayer
+
     def __init__(self, engine):
         super().__init__(engine, "ambiance_player", "ambiance player")
+
+    async def add_layer(self, ctx: commands.Context, name: str, info: str, volume: int, source_type):
+        # Check that we have an audio player and that the audio player has been summoned
+        audio_player = self.get_audio_player_for_context(ctx)
+        if not audio_player.voice_channel:
+            return await send_message(ctx, "Please summon the: " + self.audio_bot_type + " to a voice channel first.")
+
+        # Check the layer is one we can add
+        if name == PLAYLIST_LAYER:
+            return await send_message(ctx, "The layer name `" + PLAYLIST_LAYER + "` is used by the playlist, please pick another.")
+        if 0 > volume or volume > 100:
+            return await send_message(ctx, "The volume must be a number between 0 and 100.")
+        if name not in audio_player.layer_tracks and len(audio_player.layer_tracks) >= MAX_LAYERS:
+            return await send_message(ctx, "The " + self.audio_bot_type + " can't play more than " + str(MAX_LAYERS) + " layers at once.")
+
+        # The track is looked up in the background and starts playing (on repeat) as soon as it has been found
+        track = Track(ctx, info, source_type=source_type)
+        get_track_resolver().submit(track)
+        audio_player.add_layer(name, track, volume / 100)
+        return await send_message(ctx, "The layer `" + name + "` will start playing as soon as `" + info + "` has been found.")
+
+    @commands.command(name="ambiance_player:layer")
+    async def layer_command(self, ctx: commands.Context, name: str, volume: int, *, info: str):
+        """
+        Plays the provided track (searches against youtube) on repeat as a named layer, mixed with the playlist and any other layers. Replaces any layer with the same name.
+
+        :param ctx: The invocation context
+        :param name: The name of the layer
+        :param volume: The layer's volume, between 0 and 100
+        :param info: The link or keywords associated with the track
+        :return:
+        """
+        # Check if we the caller is a game master
+        permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER)
+        if not permission:
+
+            # Handle the special case where a game was not actually running - if that's the case check for a couple of special roles
+            if reason == "You cannot do this as there is no game running in your guild.":
+                permission, reason = await self.engine.get_permission_handler().check_guild_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER, elevated_roles=["Bard"])
+                if not permission:
+                    return await send_message(ctx, reason)
+
+            else:
+                return await send_message(ctx, reason)
+
+        return await self.add_layer(ctx, name, info, volume, YTDLSource)
+
+    @commands.command(name="ambiance_player:local_layer")
+    async def local_layer_command(self, ctx: commands.Context, name: str, volume: int, *, info: str):
+        """
+        Plays the best match for the provided keywords (or path) in the local music library on repeat as a named layer. Replaces any layer with the same name.
+
+        :param ctx: The invocation context
+        :param name: The name of the layer
+        :param volume: The layer's volume, between 0 and 100
+        :param info: The path within the library or keywords associated with the track
+        :return:
+        """
+        # Check if we the caller is a game master
+        permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER)
+        if not permission:
+
+            # Handle the special case where a game was not actually running - if that's the case check for a couple of special roles
+            if reason == "You cannot do this as there is no game running in your guild.":
+                permission, reason = await self.engine.get_permission_handler().check_guild_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER, elevated_roles=["Bard"])
+                if not permission:
+                    return await send_message(ctx, reason)
+
+            else:
+                return await send_message(ctx, reason)
+
+        return await self.add_layer(ctx, name, info, volume, LocalSource)
+
+    @commands.command(name="ambiance_player:layer_volume")
+    async def layer_volume_command(self, ctx: commands.Context, name: str, volume: int):
+        """
+        Adjusts the volume of one of the layers
+
+        :param ctx: The invocation context
+        :param name: The name of the layer
+        :param volume: a volume between 0 and 100
+        :return:
+        """
+        # Check if we the caller is a game master
+        permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER)
+        if not permission:
+
+            # Handle the special case where a game was not actually running - if that's the case check for a couple of special roles
+            if reason == "You cannot do this as there is no game running in your guild.":
+                permission, reason = await self.engine.get_permission_handler().check_guild_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER, elevated_roles=["Bard"])
+                if not permission:
+                    return await send_message(ctx, reason)
+
+            else:
+                return await send_message(ctx, reason)
+
+        # Check the volume is within expected bounds
+        if 0 > volume or volume > 100:
+            return await send_message(ctx, "The volume must be a number between 0 and 100.")
+
+        if not self.is_existing_audio_player(ctx) or not self.get_audio_player_for_context(ctx).set_layer_volume(name, volume / 100):
+            return await send_message(ctx, "There is no layer called `" + name + "` playing.")
+        return await send_message(ctx, "The layer `" + name + "`'s volume is set to: " + str(volume) + "%")
+
+    @commands.command(name="ambiance_player:remove_layer")
+    async def remove_layer_command(self, ctx: commands.Context, name: str):
+        """
+        Stops one of the layers
+
+        :param ctx: The invocation context
+        :param name: The name of the layer
+        :return:
+        """
+        # Check if we the caller is a game master
+        permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER)
+        if not permission:
+
+            # Handle the special case where a game was not actually running - if that's the case check for a couple of special roles
+            if reason == "You cannot do this as there is no game running in your guild.":
+                permission, reason = await self.engine.get_permission_handler().check_guild_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER, elevated_roles=["Bard"])
+                if not permission:
+                    return await send_message(ctx, reason)
+
+            else:
+                return await send_message(ctx, reason)
+
+        if not self.is_existing_audio_player(ctx) or not self.get_audio_player_for_context(ctx).remove_layer(name):
+            return await send_message(ctx, "There is no layer called `" + name + "` playing.")
+        return await send_message(ctx, "The layer `" + name + "` has been stopped.")
+
+    @commands.command(name="ambiance_player:layers")
+    async def layers_command(self, ctx: commands.Context):
+        """
+        Lists the layers being played
+
+        :param ctx: The invocation context
+        :return:
+        """
+        # Check if we the caller is a game master
+        permission, reason = await self.engine.get_permission_handler().check_active_game_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER)
+        if not permission:
+
+            # Handle the special case where a game was not actually running - if that's the case check for a couple of special roles
+            if reason == "You cannot do this as there is no game running in your guild.":
+                permission, reason = await self.engine.get_permission_handler().check_guild_permissions_for_user(ctx, self.command_prefix + ":layer", permissions_level=PermissionLevel.GAME_MASTER, elevated_roles=["Bard"])
+                if not permission:
+                    return await send_message(ctx, reason)
+
+            else:
+                return await send_message(ctx, reason)
+
+        layers = self.get_audio_player_for_context(ctx).get_layers() if self.is_existing_audio_player(ctx) else list()
+        if not layers:
+            return await send_message(ctx, "The " + self.audio_bot_type + " isn't playing any layers right now.")
+
+        long_message = LongMessage()
+        for name, track, volume in layers:
+            long_message.add(name + ": " + track.get_title() + " at " + str(round(volume * 100)) + "%")
+        return await send_message(ctx, long_message)
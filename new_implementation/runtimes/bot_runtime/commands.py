@@ -1,6 +1,6 @@
-import discord
 from discord.ext.commands import Command
 
+from new_implementation.core.instrumentation import PHASE_PERMISSIONS, timed
 from new_implementation.core.permissions_handler import PermissionContext, PermissionLevel
 from new_implementation.utils import utils
 
@@ -27,9 +27,9 @@ class DnDiscordCommand(Command):
         self.is_server_required = is_server_required
         if default_permitted_roles is None:
             default_permitted_roles = set()
-        self.default_permitted_roles = default_permitted_roles
+        self.default_permitted_roles = set(default_permitted_roles)
 
-    def set_default_minimum_level_to_execute(self, engine, invocation_context, level):
+    async def set_default_minimum_level_to_execute(self, engine, invocation_context, level):
         self.default_minimum_access_level_to_execute = level
 
         # Get the permission holder
@@ -38,8 +38,8 @@ class DnDiscordCommand(Command):
         default_permissions.set_minimum_execution_level(level)
         await engine.save_guild_data_for_context(invocation_context)
 
-    def add_default_role(self, engine, invocation_context, role):
-        self.default_permitted_roles.append(role.name)
+    async def add_default_role(self, engine, invocation_context, role):
+        self.default_permitted_roles.add(role.name)
 
         # Get the permission holder
         guild_data = await engine.get_guild_data_for_context(invocation_context)
@@ -47,8 +47,8 @@ class DnDiscordCommand(Command):
         default_permissions.add_allowed_role(role)
         await engine.save_guild_data_for_context(invocation_context)
 
-    def remove_default_role(self, engine, invocation_context, role):
-        self.default_permitted_roles.remove(role.name)
+    async def remove_default_role(self, engine, invocation_context, role):
+        self.default_permitted_roles.discard(role.name)
 
         # Get the permission holder
         guild_data = await engine.get_guild_data_for_context(invocation_context)
@@ -56,6 +56,7 @@ class DnDiscordCommand(Command):
         default_permissions.remove_allowed_role(role)
         await engine.save_guild_data_for_context(invocation_context)
 
+    @timed(PHASE_PERMISSIONS)
     async def check_can_run(self, engine, invocation_context, permission_holder_identifier: str = None, check_permission_holder_for_permissions=True):
         if engine.is_memory_mutex_locked():
             return False, "Please retry this command again later. The bot is currently undergoing a memory purge."
@@ -76,10 +77,10 @@ class DnDiscordCommand(Command):
             return True, ""
 
         # We can check for other types of admins, again these are always allowed
-        administrative_roles = guild_data.get_administrator_roles()
-        for administrative_role in administrative_roles:
-            if self.__check_role_by_name(engine, invocation_context, name=administrative_role):
-                return True, ""
+        role_interner = guild_data.get_role_interner()
+        author_role_mask = role_interner.get_mask_for_roles(invocation_context.author.roles)
+        if author_role_mask & guild_data.get_administrator_role_mask():
+            return True, ""
 
         # This flag prevents allows us to conditionally not check this information. Useful for function chaining from child implementations
         if check_permission_holder_for_permissions:
@@ -90,10 +91,8 @@ class DnDiscordCommand(Command):
 
             # Special roles are accepted only if this command's permission level < ADMIN
             if execution_permitted_level <= PermissionLevel.SPECIAL_ROLE:
-                allowed_roles = self.default_permitted_roles.union(permissions_data.get_allowed_roles())
-                for role in allowed_roles:
-                    if self.__check_role_by_name(engine, invocation_context, name=role):
-                        return True, ""
+                if author_role_mask & self.get_permitted_role_mask(role_interner, permissions_data):
+                    return True, ""
 
             # If anyone can run
             if execution_permitted_level == PermissionLevel.ANY:
@@ -101,45 +100,45 @@ class DnDiscordCommand(Command):
 
         return False, "You do not have permission to do this."
 
-    def change_permission_minimum_execution_level(self, engine, invocation_context, level, permission_holder_identifier=None):
+    def get_permitted_role_mask(self, role_interner, permissions_data):
+        return role_interner.get_mask_for_names(self.default_permitted_roles) | permissions_data.get_allowed_role_mask(role_interner)
+
+    async def change_permission_minimum_execution_level(self, engine, invocation_context, level, permission_holder_identifier=None):
         guild_data = await engine.get_guild_data_for_context(invocation_context)
-        permissions_data = guild_data.get_permissions_for(self.permission_id)
+        permissions_data = guild_data.get_or_create_permissions_for(self.permission_id)
         permissions_data.set_minimum_execution_level(level)
         await engine.save_guild_data_for_context(invocation_context)
         return True
 
-    def add_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
+    async def add_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
         guild_data = await engine.get_guild_data_for_context(invocation_context)
-        permissions_data = guild_data.get_permissions_for(self.permission_id)
+        permissions_data = guild_data.get_or_create_permissions_for(self.permission_id)
         permissions_data.add_allowed_role(role)
         await engine.save_guild_data_for_context(invocation_context)
         return True
 
-    def remove_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
+    async def remove_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
         guild_data = await engine.get_guild_data_for_context(invocation_context)
-        permissions_data = guild_data.get_permissions_for(self.permission_id)
+        permissions_data = guild_data.get_or_create_permissions_for(self.permission_id)
         permissions_data.remove_allowed_role(role)
         await engine.save_guild_data_for_context(invocation_context)
         return True
 
-    async def __check_role_by_name(self, engine, invocation_context, name):
-        role = discord.utils.get(invocation_context.guild.roles, name=name)
-        return role in invocation_context.author.roles
-
 
 class GameAwareCommand(DnDiscordCommand):
     def __init__(self, requires_active_game=False, **kwargs):
         super().__init__(**kwargs)
         self.requires_active_game = requires_active_game
 
+    @timed(PHASE_PERMISSIONS)
     async def check_can_run(self, engine, invocation_context, permission_holder_identifier: str = None, check_permission_holder_for_permissions=True):
         # First we run it in the parent context - this will tell us if the user can exectute this using guild logic
-        guild_specific_outcome, information = super().check_can_run(engine, invocation_context, permission_holder_identifier=permission_holder_identifier, check_permission_holder_for_permissions=False)
+        guild_specific_outcome, information = await super().check_can_run(engine, invocation_context, permission_holder_identifier=permission_holder_identifier, check_permission_holder_for_permissions=False)
         if guild_specific_outcome:
             return guild_specific_outcome, information
 
         # We need a game here
-        game_data = self.__get_game_data(engine, invocation_context, permission_holder_identifier)
+        game_data = await self.__get_game_data(engine, invocation_context, permission_holder_identifier)
         if not game_data:
             return False, "This supplied game pointer could not find a matching game, perhaps you omitted it from the command?"
 
@@ -156,59 +155,59 @@ class GameAwareCommand(DnDiscordCommand):
                 return True, ""
 
             # Check game master
-            if execution_permitted_level <= PermissionLevel.OWNER:
-                if game_data.is_owner(user_id):
+            if execution_permitted_level <= PermissionLevel.GAME_MASTER:
+                if game_data.is_gm(user_id):
                     return True, "You are the GM for this game."
 
             # Check party member
-            if execution_permitted_level <= PermissionLevel.MEMBER:
-                if game_data.is_member(user_id):
+            if execution_permitted_level <= PermissionLevel.PARTY:
+                if game_data.is_player(user_id):
                     return True, "You are a party member for this game."
 
             # Special roles are accepted only if this command's permission level < ADMIN
             if execution_permitted_level <= PermissionLevel.SPECIAL_ROLE:
-                allowed_roles = self.default_permitted_roles.union(permissions_data.get_allowed_roles())
-                for role in allowed_roles:
-                    if self.__check_role_by_name(engine, invocation_context, name=role):
-                        return True, ""
+                guild_data = await engine.get_guild_data_for_context(invocation_context)
+                role_interner = guild_data.get_role_interner()
+                if role_interner.get_mask_for_roles(invocation_context.author.roles) & self.get_permitted_role_mask(role_interner, permissions_data):
+                    return True, ""
 
         return False, "You do not have permission to do this."
 
-    def change_permission_minimum_execution_level(self, engine, invocation_context, level, permission_holder_identifier=None):
+    async def change_permission_minimum_execution_level(self, engine, invocation_context, level, permission_holder_identifier=None):
         # We need a game here
-        game_data = self.__get_game_data(engine, invocation_context, permission_holder_identifier)
+        game_data = await self.__get_game_data(engine, invocation_context, permission_holder_identifier)
         if not game_data:
             return False, "This supplied game pointer could not find a matching game, perhaps you omitted it from the command?"
 
         # Adjust the game specific permissions
-        permissions_data = game_data.get_permissions_for(self.permission_id)
+        permissions_data = game_data.get_or_create_permissions_for(self.permission_id)
         permissions_data.set_minimum_execution_level(level)
         await engine.save_game(invocation_context, game_data)
         return True
 
-    def add_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
+    async def add_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
         # We need a game here
-        game_data = self.__get_game_data(engine, invocation_context, permission_holder_identifier)
+        game_data = await self.__get_game_data(engine, invocation_context, permission_holder_identifier)
         if not game_data:
             return False, "This supplied game pointer could not find a matching game, perhaps you omitted it from the command?"
 
-        permissions_data = game_data.get_permissions_for(self.permission_id)
+        permissions_data = game_data.get_or_create_permissions_for(self.permission_id)
         permissions_data.add_allowed_role(role)
         await engine.save_game(invocation_context, game_data)
         return True
 
-    def remove_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
+    async def remove_permitted_role(self, engine, invocation_context, role, permission_holder_identifier=None):
         # We need a game here
-        game_data = self.__get_game_data(engine, invocation_context, permission_holder_identifier)
+        game_data = await self.__get_game_data(engine, invocation_context, permission_holder_identifier)
         if not game_data:
             return False, "This supplied game pointer could not find a matching game, perhaps you omitted it from the command?"
 
-        permissions_data = game_data.get_permissions_for(self.permission_id)
+        permissions_data = game_data.get_or_create_permissions_for(self.permission_id)
         permissions_data.remove_allowed_role(role)
         await engine.save_game(invocation_context, game_data)
         return True
 
-    def __get_game_data(self, engine, invocation_context, game_name):
+    async def __get_game_data(self, engine, invocation_context, game_name):
         # If we haven't gotten a pointr for the game, we can try to infer the current active game
         if not game_name:
             if self.requires_active_game:
@@ -1,9 +1,11 @@
+import asyncio
 import discord
 import typing
 
 from discord import Role
 from discord.ext import commands
 
+from new_implementation.audio.extraction import get_extraction_executor
 from new_implementation.runtimes.bot_runtime.commands import DnDiscordCommand
 from new_implementation.runtimes.bot_runtime.game_state_listener import GameStateListener
 from new_implementation.bots.cogs import DnDiscordCog
@@ -40,6 +42,80 @@ class CoreCog(DnDiscordCog):
             await log(self.engine, invocation_context, "Failed a memory purge - application may be unstable.")
             return await send_message(invocation_context, "Memory unsuccessfully purged.")
 
+    @commands.command(cls=DnDiscordCommand, name="metrics:slowest", hidden=True)
+    async def slowest_commands_command(self, invocation_context: commands.Context, limit: int = 10):
+        """
+        Lists the commands with the slowest 99th percentile response times since the bot started, along with where that time went.
+
+        :param limit: the number of commands to list
+        """
+        # Standard check for whether we can run this or not
+        outcome, message = await invocation_context.command.check_can_run(self.engine, invocation_context)
+        if not outcome:
+            await log(self.engine, invocation_context, "User: " + invocation_context.author.name + " failed to invoke a command due to: " + message)
+            return await send_message(invocation_context, message)
+
+        slowest = self.engine.get_command_metrics().get_slowest(limit=limit)
+        if not slowest:
+            return await send_message(invocation_context, "No commands have been timed yet.")
+
+        # One entry per command, phase timings are p50 / p99 in milliseconds
+        long_message = LongMessage()
+        for command_name, statistics in slowest:
+            phases = statistics["phases"]
+            long_message.add(command_name + ": " + str(statistics["count"]) + " calls, " + "{:.1%}".format(statistics["error_rate"]) + " errors, " + "{:.2f}".format(statistics["per_minute"]) + "/min")
+            long_message.add("    " + ", ".join(phase + " " + "{:.1f}/{:.1f}ms".format(timings["p50_ms"], timings["p99_ms"]) for phase, timings in phases.items()))
+        return await send_message(invocation_context, long_message)
+
+    @commands.command(cls=DnDiscordCommand, name="metrics:extraction", hidden=True)
+    async def extraction_metrics_command(self, invocation_context: commands.Context):
+        """
+        Shows how long track lookups have spent waiting for, and running on, the youtube-dl extraction pool.
+        """
+        # Standard check for whether we can run this or not
+        outcome, message = await invocation_context.command.check_can_run(self.engine, invocation_context)
+        if not outcome:
+            await log(self.engine, invocation_context, "User: " + invocation_context.author.name + " failed to invoke a command due to: " + message)
+            return await send_message(invocation_context, message)
+
+        statistics = get_extraction_executor().get_statistics()
+        long_message = LongMessage()
+        long_message.add(str(statistics["running"]) + "/" + str(statistics["workers"]) + " workers busy, " + str(statistics["queued"]) + " queued across " + str(statistics["guilds_waiting"]) + " guilds")
+        long_message.add(str(statistics["completed"]) + " completed, " + str(statistics["failed"]) + " failed, " + str(statistics["rejected"]) + " rejected, " + str(statistics["timed_out"]) + " timed out, " + str(statistics["cancelled"]) + " cancelled")
+
+        # Timings are p50 / p99 / max in milliseconds
+        for name in ("queue_wait", "extraction_time"):
+            timings = statistics[name]
+            long_message.add("    " + name + " " + "{:.1f}/{:.1f}/{:.1f}ms".format(timings["p50_ms"], timings["p99_ms"], timings["max_ms"]))
+        return await send_message(invocation_context, long_message)
+
+    @commands.command(cls=DnDiscordCommand, name="profiler:dump", hidden=True)
+    async def profiler_dump_command(self, invocation_context: commands.Context):
+        """
+        Writes the event loop samples taken so far to disk as folded stacks and lists where the loop has been blocked.
+        Only available when the bot is running in debug mode.
+        """
+        # Standard check for whether we can run this or not
+        outcome, message = await invocation_context.command.check_can_run(self.engine, invocation_context)
+        if not outcome:
+            await log(self.engine, invocation_context, "User: " + invocation_context.author.name + " failed to invoke a command due to: " + message)
+            return await send_message(invocation_context, message)
+
+        profiler = self.engine.get_loop_profiler()
+        if profiler is None:
+            return await send_message(invocation_context, "The bot is not running in debug mode.")
+
+        # Writing the file is blocking, so keep it off the loop we are profiling
+        path = await asyncio.get_event_loop().run_in_executor(None, profiler.dump)
+        statistics = profiler.get_statistics()
+
+        long_message = LongMessage()
+        long_message.add("Wrote " + str(statistics["stacks"]) + " stacks from " + str(statistics["samples"]) + " samples to: " + path)
+        long_message.add(str(statistics["stalls"]) + " stalls, the longest lasting " + "{:.3f}".format(statistics["longest_stall"]) + "s")
+        for label, seconds in profiler.get_blocked_time():
+            long_message.add("    " + label + ": blocked for " + "{:.3f}".format(seconds) + "s")
+        return await send_message(invocation_context, long_message)
+
     @commands.command(cls=DnDiscordCommand, name="minimum_access_level_to_execute_command", aliases=["set_command_access", "set_access"])
     async def set_minimum_access_level_to_execute_command_command(self, invocation_context: commands.Context, command_name: str, permission_level: int, permission_holder_identifier: typing.Optional[str] = None):
         """
@@ -465,8 +541,7 @@ class CoreCog(DnDiscordCog):
 
         # Register a new game
         game = GameData(utils.get_guild_id_from_context(ctx), game_name, utils.get_user_id_from_context(ctx), ctx.author.name)
-        for listener in self.engine.get_event_class_listeners(GameStateListener):
-            await listener.game.created(ctx, game)
+        await self.engine.dispatch_event(GameStateListener, "game_created", ctx, game)
 
         # Check if a channel exists for this name
         game_channel_name = guild.get_game_channel_prefix() + game_name + guild.get_game_channel_suffix()
@@ -496,10 +571,11 @@ class CoreCog(DnDiscordCog):
         game.set_game_channel(game_channel_name)
         game.set_gm_channel(game_gm_channel_name)
 
-        # Save the new data
+        # Save the new data, decisions made whilst the game didn't exist no longer hold
         await self.engine.save_guild_data_for_context(ctx)
         await self.engine.save_user_data_for_context(ctx)
         await self.engine.save_game(ctx, game)
+        self.engine.get_permission_handler().invalidate_guild(utils.get_guild_id_from_context(ctx))
 
         # Inform
         await send_message(ctx, "Create the game: " + game.get_name())
@@ -532,8 +608,10 @@ class CoreCog(DnDiscordCog):
 
         # Set the game as our active game
         self.engine.set_active_game_for_context(ctx, game)
-        for listener in self.engine.get_event_class_listeners(GameStateListener):
-            await listener.game_started(ctx, game)
+        await self.engine.save_session_for_context(ctx)
+
+        # Modules can take their time starting up (i.e. posting reminders), nothing here depends on them
+        self.engine.post_event(GameStateListener, "game_started", ctx, game)
 
         await send_message(ctx, game_name + " is now running.")
 
@@ -612,8 +690,7 @@ class CoreCog(DnDiscordCog):
         game = self.engine.get_active_game_for_context(ctx)
 
         # Inform our listeners
-        for listener in self.engine.get_event_class_listeners(GameStateListener):
-            await listener.game_about_to_end(ctx, game)
+        await self.engine.dispatch_event(GameStateListener, "game_about_to_end", ctx, game)
 
         # End this game
         await self.engine.end_active_game_for_context(ctx)
@@ -641,8 +718,7 @@ class CoreCog(DnDiscordCog):
         game = self.engine.get_active_game_for_context(ctx)
 
         # Inform our listeners
-        for listener in self.engine.get_event_class_listeners(GameStateListener):
-            await listener.game_deleting(ctx, game)
+        await self.engine.dispatch_event(GameStateListener, "game_deleting", ctx, game)
 
         # Go through the players and remove this game
         players = game.get_players()
@@ -725,6 +801,7 @@ class CoreCog(DnDiscordCog):
 
         # Create the player entry and update our records
         game.add_player(str(player.id))
+        self.engine.get_permission_handler().invalidate_guild(utils.get_guild_id_from_context(ctx))
         await self.engine.save_game(ctx, game)
 
         # Add this game to the player
@@ -770,6 +847,7 @@ class CoreCog(DnDiscordCog):
 
         # Remove and update
         game.remove_player(str(player.id))
+        self.engine.get_permission_handler().invalidate_guild(utils.get_guild_id_from_context(ctx))
         await self.engine.save_game(ctx, game)
 
         # Remove the game from the user
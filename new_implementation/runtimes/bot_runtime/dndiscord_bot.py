@@ -1,28 +1,58 @@
 import asyncio
+import functools
+import os
+import signal
 
 from new_implementation.bots.bots import EditMessageReceiveBot, SecondaryBot
 from new_implementation.runtimes.bot_runtime.core_cog import CoreCog
+from new_implementation.core.cache import ResourceCache
 from new_implementation.core.engine import Engine
+from new_implementation.core.instrumentation import PHASE_STORAGE, time_phase
+from new_implementation.core.profiler import LoopProfiler
+from new_implementation.core.sqlite_resource_handler import SQLiteResourceHandler
 from new_implementation.data.data import DataAccessObject
+from new_implementation.data.persistence import FsyncPolicy
 from new_implementation.data.guild import GuildData
 from new_implementation.data.user import UserData
 from new_implementation.modules.music.music import MusicCog
+from new_implementation.audio.extraction import configure_extraction_executor, get_extraction_executor
+from new_implementation.audio.library import configure_music_library
+from new_implementation.audio.resolver import get_track_resolver
+from new_implementation.audio.sources.metadata_cache import configure_metadata_cache
+from new_implementation.audio.sources.opus_cache import configure_opus_cache
 from new_implementation.utils import utils
+from new_implementation.utils.file_log import configure_file_log, get_file_log
+from new_implementation.utils.message_scheduler import configure_message_scheduler, get_message_scheduler
+from shared import serialization
+from shared.io_executor import configure_io_executor, get_io_executor, set_io_timer
 
 
 class DNDiscordBot(EditMessageReceiveBot, Engine):
+    ENGINE_NAME = "bot"
+    SESSION_FILE = "session.json"
+
     def __init__(self, config):
-        EditMessageReceiveBot.__init__(self, command_prefix="!", description="Core DnDiscord Bot")
-        Engine.__init__(self, "bot")
+        EditMessageReceiveBot.__init__(
+            self,
+            command_prefix="!",
+            description="Core DnDiscord Bot",
+            shard_id=config["shard_id"] if "shard_id" in config else None,
+            shard_count=config["shard_count"] if "shard_count" in config else None
+        )
+        Engine.__init__(self, DNDiscordBot.ENGINE_NAME)
 
         # Basic props
         self.config = config
         self.purge_mutex = False
         self.music_module = False
         self.ambiance_module = False
-        self.guild_cache = dict()
-        self.user_cache = dict()
+        self.cache_write_back = False
+        self.shared_storage = False
+        self.primary = True
+        self.guild_cache = self.register_cache(ResourceCache("guild", self.__flush_guild_data))
+        self.user_cache = self.register_cache(ResourceCache("user", self.__flush_user_data))
         self.active_sessions = dict()
+        self.music_library = None
 
         # Parse the configs
         self.__parse_config()
@@ -33,13 +63,43 @@ class DNDiscordBot(EditMessageReceiveBot, Engine):
         # Ancillary bots if required
         self.ancillary_bot = SecondaryBot(self, command_prefix="!", description="Ancillary DnDiscord Bot")
 
+        # Running apart from the shards, what they are playing is picked up from the shared storage before each command
+        if not self.primary:
+            self.ancillary_bot.before_invoke(self.load_session_for_context)
+
         # Optional Cogs
         if self.music_module:
             self.add_cog(MusicCog(self))
 
-    def run(self):
+    def run(self, debug=False):
+        """
+        Runs the bot until the process is stopped. When the config sets primary to False only the ancillary bot
+        connects, this is how the sharded runtime gives the ancillary bot a process of its own.
+        """
         loop = asyncio.get_event_loop()
-        loop.create_task(self.start(self.config["discord_token"]))
+
+        # Debug mode samples the event loop so we can see what is blocking it
+        if debug or self.debug:
+            self.loop_profiler = LoopProfiler(
+                [self, self.ancillary_bot],
+                sample_interval=self.profiler_sample_interval,
+                stall_threshold=self.profiler_stall_threshold,
+                dump_threshold=self.profiler_dump_threshold,
+                output_directory=self.profiler_output
+            )
+            self.loop_profiler.start(loop)
+
+        if self.primary:
+            loop.create_task(self.start(self.config["discord_token"]))
+            if self.shared_storage:
+                loop.create_task(self.clear_sessions())
+        loop.create_task(self.resource_handler.get_persistence_layer().run_periodic_compaction(self.journal_compaction_interval))
+        loop.create_task(self.run_periodic_cache_eviction(self.cache_eviction_interval))
+        if self.cache_write_back:
+            loop.create_task(self.run_periodic_cache_flush(self.cache_flush_interval))
+        loop.create_task(self.resource_handler.get_resource_pack_index().start())
+        if self.music_library is not None:
+            loop.create_task(self.music_library.start())
 
         # Setup our ancillary bot
         if "ancillary_token" in self.config:
@@ -47,15 +107,78 @@ class DNDiscordBot(EditMessageReceiveBot, Engine):
         else:
             self.ambiance_module = False
 
-        loop.run_forever()
+        # Stopped by ctrl+c or, as the sharded runtime's supervisor does, SIGTERM
+        try:
+            loop.add_signal_handler(signal.SIGTERM, loop.stop)
+        except NotImplementedError:
+            pass
+
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            loop.run_until_complete(self.shutdown())
+
+    async def shutdown(self):
+        """
+        Sends anything still waiting to go out, disconnects and then writes out anything that is still only held in memory.
+        """
+        # Buffered log lines are queued as messages, so the log goes first and the scheduler is drained after it
+        await self.get_guild_log().flush_all()
+        await get_message_scheduler().flush()
+
+        for bot in (self, self.ancillary_bot):
+            if not bot.is_closed():
+                await bot.close()
+
+        if self.loop_profiler is not None:
+            self.loop_profiler.stop()
+        if self.music_library is not None:
+            self.music_library.stop()
+        await get_track_resolver().stop()
+
+        await Engine.shutdown(self)
+
+        # Everything else still running is a periodic task
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        get_extraction_executor().shutdown()
+        get_io_executor().shutdown()
+        if get_file_log() is not None:
+            get_file_log().stop()
 
     def is_ambiance_enabled(self):
         return self.ambiance_module
 
+    # Role changes can change the outcome of permission checks for anyone in the guild
+    async def on_guild_role_update(self, before, after):
+        self.permissions_handler.invalidate_guild(str(after.guild.id))
+
+    async def on_guild_role_delete(self, role):
+        self.permissions_handler.invalidate_guild(str(role.guild.id))
+
+    async def on_member_update(self, before, after):
+        if before.roles != after.roles:
+            self.permissions_handler.invalidate_guild(str(after.guild.id))
+
+    # The log channel is cached, so we need to know if it goes away or changes
+    async def on_guild_channel_delete(self, channel):
+        self.guild_log.invalidate_channel(channel, deleted=True)
+
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name:
+            self.guild_log.invalidate_channel(after)
+
     async def get_guild_data_for_context(self, invocation_context):
         guild_id = utils.get_guild_id_from_context(invocation_context)
-        if guild_id in self.guild_cache:
-            guild_data = self.guild_cache[guild_id]
+
+        # Guilds belong to the shards, away from them their data is always read fresh from the storage layer
+        guild_data = self.guild_cache.get(guild_id) if self.primary else None
+        if guild_data is not None:
             return guild_data
 
         else:
@@ -67,18 +190,22 @@ class DNDiscordBot(EditMessageReceiveBot, Engine):
                 dao.set_payload(guild_data)
                 await self.resource_handler.save_resource_in_guild_resources(guild_id, "guild_data.json", dao)
 
-            self.guild_cache[guild_id] = guild_data
+            await self.guild_cache.put(guild_id, guild_data)
             return guild_data
 
     async def save_guild_data_for_context(self, invocation_context):
         guild_id = utils.get_guild_id_from_context(invocation_context)
-        guild_data = self.guild_cache[guild_id]
-        dao = DataAccessObject()
-        if guild_data is not None:
-            dao.set_payload(guild_data)
-        else:
-            dao.set_payload(GuildData(guild_id))
 
+        # With write back enabled the cache persists the data when it is flushed or evicted
+        if self.cache_write_back and self.guild_cache.mark_dirty(guild_id):
+            return
+
+        guild_data = self.guild_cache.peek(guild_id)
+        await self.__flush_guild_data(guild_id, guild_data if guild_data is not None else GuildData(guild_id))
+
+    async def __flush_guild_data(self, guild_id, guild_data):
+        dao = DataAccessObject()
+        dao.set_payload(guild_data)
         await self.resource_handler.save_resource_in_guild_resources(guild_id, "guild_data.json", dao)
 
     async def get_user_data_for_context(self, invocation_context):
@@ -86,8 +213,9 @@ class DNDiscordBot(EditMessageReceiveBot, Engine):
         return await self.get_user_data(invocation_context, user_id)
 
     async def get_user_data(self, invocation_context, user_id: str):
-        if user_id in self.user_cache:
-            user_data = self.user_cache[user_id]
+        # Users aren't pinned to a shard, so with shared storage their data is always read fresh from the storage layer
+        user_data = self.user_cache.get(user_id) if not self.shared_storage else None
+        if user_data is not None:
             return user_data
 
         else:
@@ -99,24 +227,29 @@ class DNDiscordBot(EditMessageReceiveBot, Engine):
                 dao.set_payload(user_data)
                 await self.resource_handler.save_resource_in_user_resources(user_id, "user_data.json", dao)
 
-            self.user_cache[user_id] = user_data
+            await self.user_cache.put(user_id, user_data)
             return user_data
 
     async def save_user_data_for_context(self, invocation_context):
         user_id = utils.get_user_id_from_context(invocation_context)
-        user_data = self.user_cache[user_id]
-        dao = DataAccessObject()
-        if user_data is not None:
-            dao.set_payload(user_data)
-        else:
-            dao.set_payload(UserData(user_id))
 
-        await self.resource_handler.save_resource_in_user_resources(user_id, "user_data.json", dao)
+        # With write back enabled the cache persists the data when it is flushed or evicted, other shards need to see it now
+        if self.cache_write_back and not self.shared_storage and self.user_cache.mark_dirty(user_id):
+            return
+
+        user_data = self.user_cache.peek(user_id)
+        await self.__flush_user_data(user_id, user_data if user_data is not None else UserData(user_id))
 
     async def save_user_data(self, invocation_context, user):
+        if self.cache_write_back and not self.shared_storage and self.user_cache.peek(user.get_user_id()) is user and self.user_cache.mark_dirty(user.get_user_id()):
+            return
+
+        await self.__flush_user_data(user.get_user_id(), user)
+
+    async def __flush_user_data(self, user_id, user_data):
         dao = DataAccessObject()
-        dao.set_payload(user)
-        await self.resource_handler.save_resource_in_user_resources(user.get_user_id(), "user_data.json", dao)
+        dao.set_payload(user_data)
+        await self.resource_handler.save_resource_in_user_resources(user_id, "user_data.json", dao)
 
     def get_active_game_for_context(self, invocation_context):
         guild_id = utils.get_guild_id_from_context(invocation_context)
@@ -124,11 +257,53 @@ class DNDiscordBot(EditMessageReceiveBot, Engine):
 
     def set_active_game_for_context(self, invocation_context, game):
         self.active_sessions[utils.get_guild_id_from_context(invocation_context)] = game
+        self.permissions_handler.invalidate_guild(utils.get_guild_id_from_context(invocation_context))
 
     async def end_active_game_for_context(self, ctx):
         game = self.active_sessions[utils.get_guild_id_from_context(ctx)]
         await self.save_game(ctx, game)
         del self.active_sessions[utils.get_guild_id_from_context(ctx)]
+        self.permissions_handler.invalidate_guild(utils.get_guild_id_from_context(ctx))
+        await self.save_session_for_context(ctx)
+
+    async def save_session_for_context(self, invocation_context):
+        # Only needed when the ancillary bot runs in a process of its own, which is only ever the case with shared storage
+        if not self.shared_storage:
+            return
+
+        game = self.get_active_game_for_context(invocation_context)
+        await self.__save_session(utils.get_guild_id_from_context(invocation_context), game.get_name() if game is not None else None)
+
+    async def load_session_for_context(self, invocation_context):
+        guild_id = utils.get_guild_id_from_context(invocation_context)
+        dao = await self.resource_handler.load_resource_from_guild_resources(guild_id, DNDiscordBot.SESSION_FILE, DataAccessObject())
+        session = dao.get_payload()
+
+        # The game itself is read fresh too, the shard running it saves it as it changes
+        game = await self.get_game(invocation_context, session["game"]) if session and session["game"] else None
+        if game is not None:
+            self.active_sessions[guild_id] = game
+        else:
+            self.active_sessions.pop(guild_id, None)
+
+        # Permissions could have been changed by the shard since our decisions were made
+        self.permissions_handler.invalidate_guild(guild_id)
+
+    async def clear_sessions(self):
+        # Any game recorded by an earlier run of this shard ended with it
+        for guild_id in await self.resource_handler.list_guilds():
+            if self.shard_count is not None and (int(guild_id) >> 22) % self.shard_count != self.shard_id:
+                continue
+
+            dao = await self.resource_handler.load_resource_from_guild_resources(guild_id, DNDiscordBot.SESSION_FILE, DataAccessObject())
+            session = dao.get_payload()
+            if session and session["game"] and guild_id not in self.active_sessions:
+                await self.__save_session(guild_id, None)
+
+    async def __save_session(self, guild_id, game_name):
+        dao = DataAccessObject()
+        dao.set_payload({"game": game_name})
+        await self.resource_handler.save_resource_in_guild_resources(guild_id, DNDiscordBot.SESSION_FILE, dao)
 
     async def get_game(self, invocation_context, game_name):
         guild_id = utils.get_guild_id_from_context(invocation_context)
@@ -144,8 +319,133 @@ class DNDiscordBot(EditMessageReceiveBot, Engine):
 
     async def delete_game(self, invocation_context, game):
         guild_id = utils.get_guild_id_from_context(invocation_context)
+        self.permissions_handler.invalidate_guild(guild_id)
         await self.resource_handler.delete_resource_from_game_resources(guild_id, game.get_name() + ".json")
 
     def __parse_config(self):
         self.music_module = bool(self.config["music_player"]) if "music_player" in self.config else False
-        self.ambiance_module = bool(self.config["ambiance_player"]) if "ambiance_player" in self.config else False
\ No newline at end of file
+        self.ambiance_module = bool(self.config["ambiance_player"]) if "ambiance_player" in self.config else False
+
+        # Event loop profiling, only when running in debug mode
+        self.debug = bool(self.config["debug"]) if "debug" in self.config else False
+        self.profiler_sample_interval = float(self.config["profiler_sample_interval"]) if "profiler_sample_interval" in self.config else 0.01
+        self.profiler_stall_threshold = float(self.config["profiler_stall_threshold"]) if "profiler_stall_threshold" in self.config else 0.1
+        self.profiler_dump_threshold = float(self.config["profiler_dump_threshold"]) if "profiler_dump_threshold" in self.config else 1.0
+        self.profiler_output = self.config["profiler_output"] if "profiler_output" in self.config else None
+
+        # The format new data files are written in, existing files are always read in whatever format they were saved with
+        if "data_format" in self.config:
+            serialization.set_default_serializer(self.config["data_format"])
+
+        # Only build the parts of loaded data that are actually used
+        if "lazy_loading" in self.config:
+            serialization.set_lazy_loading(bool(self.config["lazy_loading"]))
+
+        # Size of the thread pool used for blocking file access, time spent waiting on it counts as storage time
+        if "io_workers" in self.config:
+            configure_io_executor(int(self.config["io_workers"]))
+        set_io_timer(functools.partial(time_phase, PHASE_STORAGE))
+
+        # Storage shared with other processes, i.e. when running as one of several shards
+        self.shared_storage = bool(self.config["shared_storage"]) if "shared_storage" in self.config else False
+
+        # Whether we run the main bot, the sharded runtime runs the ancillary bot on its own in a separate process
+        self.primary = bool(self.config["primary"]) if "primary" in self.config else True
+
+        # Json lines log file, off unless asked for (true for the default path or the path to write to)
+        if "log_file" in self.config and self.config["log_file"]:
+            configure_file_log(
+                path=self.config["log_file"] if "log_file" in self.config and isinstance(self.config["log_file"], str) else None,
+                max_bytes=int(self.config["log_file_max_bytes"]) if "log_file_max_bytes" in self.config else None,
+                backup_count=int(self.config["log_file_backups"]) if "log_file_backups" in self.config else None
+            )
+
+        # Outbound message rate limiting, per channel
+        configure_message_scheduler(
+            rate=float(self.config["message_rate"]) if "message_rate" in self.config else None,
+            burst=int(self.config["message_burst"]) if "message_burst" in self.config else None
+        )
+
+        # Where guild, user and game data is kept, either as individual files (the default) or in a sqlite database
+        storage = self.config["storage"] if "storage" in self.config else "files"
+        if storage == "sqlite":
+            self.set_resource_handler(SQLiteResourceHandler(self, self.config["sqlite_path"] if "sqlite_path" in self.config else None))
+        elif storage != "files":
+            raise ValueError("Unknown storage type: " + str(storage) + ". Valid options are: files, sqlite")
+
+        # How often the resource pack index checks for changes when it can't be notified of them
+        if "resource_pack_poll_interval" in self.config:
+            self.resource_handler.get_resource_pack_index().configure(poll_interval=int(self.config["resource_pack_poll_interval"]))
+
+        # Crash safety of our guild, user and game files, and locking them against other processes when shared
+        self.resource_handler.get_persistence_layer().configure(
+            journal_enabled=bool(self.config["journal"]) if "journal" in self.config else None,
+            fsync_policy=FsyncPolicy[self.config["fsync_policy"].upper()] if "fsync_policy" in self.config else None,
+            compaction_threshold=int(self.config["journal_compaction_threshold"]) if "journal_compaction_threshold" in self.config else None,
+            lock_directory=os.path.join(self.resource_handler.get_engine_context(), ".locks") if self.shared_storage else None
+        )
+
+        # youtube-dl lookups get a thread pool of their own, shared fairly between guilds
+        configure_extraction_executor(
+            max_workers=int(self.config["extraction_workers"]) if "extraction_workers" in self.config else None,
+            max_queued_per_guild=int(self.config["extraction_queue_per_guild"]) if "extraction_queue_per_guild" in self.config else None,
+            max_queued=int(self.config["extraction_queue_size"]) if "extraction_queue_size" in self.config else None,
+            timeout=float(self.config["extraction_timeout"]) if "extraction_timeout" in self.config else None
+        )
+
+        # Local audio files, catalogued alongside the rest of our data
+        if "music_directory" in self.config:
+            self.music_library = configure_music_library(
+                self.config["music_directory"],
+                os.path.join(self.resource_handler.get_engine_context(), "music_library.json"),
+                self.resource_handler.get_persistence_layer(),
+                rescan_interval=int(self.config["music_library_rescan_interval"]) if "music_library_rescan_interval" in self.config else None
+            )
+
+        # Frequently played tracks transcoded to opus, off unless turned on
+        if "opus_cache" in self.config and self.config["opus_cache"]:
+            configure_opus_cache(
+                self.config["opus_cache"] if isinstance(self.config["opus_cache"], str) else os.path.join(self.resource_handler.get_engine_context(), "opus_cache"),
+                max_bytes=int(self.config["opus_cache_max_bytes"]) if "opus_cache_max_bytes" in self.config else None,
+                min_plays=int(self.config["opus_cache_min_plays"]) if "opus_cache_min_plays" in self.config else None,
+                volume=int(self.config["opus_cache_volume"]) / 100 if "opus_cache_volume" in self.config else None
+            )
+
+        # Track metadata looked up by youtube-dl, off unless turned on
+        if "ytdl_cache" in self.config and self.config["ytdl_cache"]:
+            configure_metadata_cache(
+                path=self.config["ytdl_cache"] if isinstance(self.config["ytdl_cache"], str) else os.path.join(self.resource_handler.get_engine_context(), "ytdl_metadata.json"),
+                stream_ttl=int(self.config["ytdl_stream_ttl"]) if "ytdl_stream_ttl" in self.config else None,
+                search_ttl=int(self.config["ytdl_search_ttl"]) if "ytdl_search_ttl" in self.config else None
+            )
+        self.journal_compaction_interval = int(self.config["journal_compaction_interval"]) if "journal_compaction_interval" in self.config else 300
+
+        # Event dispatch
+        self.event_bus.configure(
+            default_timeout=float(self.config["event_listener_timeout"]) if "event_listener_timeout" in self.config else None,
+            max_queue_size=int(self.config["event_queue_size"]) if "event_queue_size" in self.config else None
+        )
+
+        # Log channel batching
+        self.guild_log.configure(
+            flush_interval=float(self.config["log_flush_interval"]) if "log_flush_interval" in self.config else None,
+            max_lines=int(self.config["log_batch_size"]) if "log_batch_size" in self.config else None
+        )
+
+        # Permission decision cache
+        if "permission_cache_max_size" in self.config:
+            self.permissions_handler.get_decision_cache().configure(max_size=int(self.config["permission_cache_max_size"]))
+
+        # Guild and user data caches
+        self.cache_write_back = bool(self.config["cache_write_back"]) if "cache_write_back" in self.config else False
+
+        # Away from the shards, anything held back could overwrite what they have written since
+        if not self.primary:
+            self.cache_write_back = False
+        self.cache_eviction_interval = int(self.config["cache_eviction_interval"]) if "cache_eviction_interval" in self.config else 60
+        self.cache_flush_interval = int(self.config["cache_flush_interval"]) if "cache_flush_interval" in self.config else 30
+        for cache in (self.guild_cache, self.user_cache):
+            cache.configure(
+                max_size=int(self.config["cache_max_size"]) if "cache_max_size" in self.config else None,
+                ttl=int(self.config["cache_ttl"]) if "cache_ttl" in self.config else None
+            )
\ No newline at end of file
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import signal
+import time
+
+"""
+
+Runs the bot as several processes. Each worker process connects one or more gateway shards (discord sends all of a
+guild's events to the shard (guild_id >> 22) % shard_count, so a guild's data and cache only ever live in one worker)
+and the ancillary bot gets a process of its own, so mixing audio never competes with commands. The ancillary process
+keeps nothing about a guild in memory, the game each shard is running and the guild's data are read from the shared
+storage as its commands need them. The supervisor restarts any process that dies.
+
+"""
+
+
+def get_process_log_path(config, process_name):
+    # The rotating log file can't be shared between processes, so each one gets its own next to the configured one
+    path = config["log_file"] if "log_file" in config and isinstance(config["log_file"], str) else os.path.join(os.getcwd(), "logs", "dndiscord.log")
+    root, extension = os.path.splitext(path)
+    return root + "." + process_name + extension
+
+
+def run_process(config, debug):
+    # Imported here so the supervisor itself never loads discord or the bot
+    from new_implementation.runtimes.bot_runtime.dndiscord_bot import DNDiscordBot
+
+    dnd_bot = DNDiscordBot(config)
+    dnd_bot.run(debug=debug)
+
+
+class SupervisedProcess:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.process = None
+        self.started = 0.0
+        self.restarts = 0
+        self.restart_at = None
+
+
+class ShardSupervisor:
+    """
+    Starts shard_count shards, one per worker process, plus a process for the ancillary bot if there is one, and keeps
+    them running. Every process shares the data directory, which the storage layer locks between them.
+    """
+
+    def __init__(self, config, shard_count, debug=False, restart_delay=5, max_restart_delay=300, stable_after=60):
+        self.config = config
+        self.shard_count = shard_count
+        self.debug = debug
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_after = stable_after
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = self.__create_processes()
+        self.stopping = False
+
+    def get_processes(self):
+        return self.processes
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.__request_stop)
+        signal.signal(signal.SIGTERM, self.__request_stop)
+
+        for supervised in self.processes:
+            self.__start(supervised)
+
+        try:
+            while not self.stopping:
+                time.sleep(1)
+                for supervised in self.processes:
+                    self.__check(supervised)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopping = True
+        for supervised in self.processes:
+            if supervised.process is not None and supervised.process.is_alive():
+                supervised.process.terminate()
+
+        for supervised in self.processes:
+            if supervised.process is not None:
+                supervised.process.join(timeout=30)
+                if supervised.process.is_alive():
+                    supervised.process.kill()
+                supervised.process = None
+
+    def __create_processes(self):
+        processes = list()
+        for shard_id in range(self.shard_count):
+            name = "shard-" + str(shard_id)
+            config = dict(self.config, shard_id=shard_id, shard_count=self.shard_count, shared_storage=True)
+
+            # Only the ancillary process runs the ancillary bot
+            config.pop("ancillary_token", None)
+            if "log_file" in config and config["log_file"]:
+                config["log_file"] = get_process_log_path(self.config, name)
+            processes.append(SupervisedProcess(name, config))
+
+        if "ancillary_token" in self.config:
+            config = dict(self.config, primary=False, shared_storage=True)
+            if "log_file" in config and config["log_file"]:
+                config["log_file"] = get_process_log_path(self.config, "ancillary")
+            processes.append(SupervisedProcess("ancillary", config))
+
+        return processes
+
+    def __start(self, supervised):
+        supervised.process = self.context.Process(target=run_process, args=(supervised.config, self.debug), name="dndiscord-" + supervised.name)
+        supervised.process.start()
+        supervised.started = time.monotonic()
+        supervised.restart_at = None
+        print("Started " + supervised.name + " as process " + str(supervised.process.pid))
+
+    def __check(self, supervised):
+        if supervised.restart_at is not None:
+            if time.monotonic() >= supervised.restart_at:
+                self.__start(supervised)
+            return
+
+        if supervised.process.is_alive():
+            return
+
+        # Back off if the process keeps dying straight away, but start afresh once it has been up for a while
+        if time.monotonic() - supervised.started >= self.stable_after:
+            supervised.restarts = 0
+        delay = min(self.restart_delay * 2 ** supervised.restarts, self.max_restart_delay)
+        supervised.restarts += 1
+        supervised.restart_at = time.monotonic() + delay
+        print(supervised.name + " exited with code " + str(supervised.process.exitcode) + ", restarting in " + str(delay) + "s")
+
+    def __request_stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from new_implementation.benchmarks.fake_discord import FakeContext, FakeGuild
+from new_implementation.core.engine import Engine
+from new_implementation.runtimes.bot_runtime.dndiscord_bot import DNDiscordBot
+from new_implementation.utils.message_scheduler import configure_message_scheduler
+
+
+@pytest.fixture
+def run():
+    # Every test gets a loop of its own, the bot's singletons are created on whichever loop first uses them
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop.run_until_complete
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture
+def bot_directory(tmp_path, monkeypatch):
+    # The bot keeps its data relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def create_bot(run, bot_directory):
+    bots = list()
+
+    def create(**config):
+        async def build():
+            bot = DNDiscordBot(dict({"discord_token": "test", "log_file": False}, **config))
+            configure_message_scheduler(rate=1e9, burst=1e9)
+            return bot
+
+        bot = run(build())
+        bots.append(bot)
+        return bot
+
+    yield create
+
+    async def close(bot):
+        await bot.get_guild_log().flush_all()
+        await Engine.shutdown(bot)
+
+    for bot in bots:
+        run(close(bot))
+
+
+def create_context(bot, guild=None, role_names=()):
+    guild = guild if guild is not None else FakeGuild("Test guild")
+    member = guild.add_member("Member " + str(len(guild.members)), role_names=role_names)
+    channel = guild.text_channels[0] if guild.text_channels else None
+    if channel is None:
+        channel = asyncio.get_event_loop().run_until_complete(guild.create_text_channel("general"))
+    return FakeContext(bot, guild, member, channel)
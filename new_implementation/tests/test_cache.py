@@ -0,0 +1,84 @@
+import pytest
+
+from new_implementation.core.cache import ResourceCache
+
+
+def create_cache(flushed, max_size=2, min_idle=0, flusher=None):
+    async def record_flush(key, value):
+        flushed.append((key, value))
+
+    return ResourceCache("test", flusher or record_flush, max_size=max_size, min_idle=min_idle)
+
+
+def test_eviction_flushes_dirty_entries(run):
+    flushed = list()
+    cache = create_cache(flushed)
+
+    async def fill():
+        await cache.put("a", 1)
+        cache.mark_dirty("a")
+        await cache.put("b", 2)
+        await cache.put("c", 3)
+
+    run(fill())
+
+    # The least recently used entry goes, written out first
+    assert "a" not in cache
+    assert flushed == [("a", 1)]
+    assert cache.get_statistics()["evictions"] == 1
+
+
+def test_clean_entries_are_evicted_without_flushing(run):
+    flushed = list()
+    cache = create_cache(flushed)
+
+    async def fill():
+        await cache.put("a", 1)
+        await cache.put("b", 2)
+        cache.get("a")
+        await cache.put("c", 3)
+
+    run(fill())
+
+    assert "b" not in cache and "a" in cache
+    assert flushed == []
+
+
+def test_failed_flush_keeps_the_entry(run):
+    async def failing_flush(key, value):
+        raise OSError("disk full")
+
+    cache = create_cache(list(), flusher=failing_flush)
+    run(cache.put("a", 1))
+    cache.mark_dirty("a")
+
+    with pytest.raises(OSError):
+        run(cache.evict("a"))
+    assert "a" in cache and cache.is_dirty("a")
+
+
+def test_entry_dirtied_mid_flush_is_kept(run):
+    cache = None
+
+    async def redirtying_flush(key, value):
+        cache.mark_dirty(key)
+
+    cache = create_cache(list(), flusher=redirtying_flush)
+    run(cache.put("a", 1))
+    cache.mark_dirty("a")
+
+    assert not run(cache.evict("a"))
+    assert "a" in cache and cache.is_dirty("a")
+
+
+def test_entries_in_use_are_not_evicted(run):
+    flushed = list()
+    cache = create_cache(flushed, min_idle=60)
+
+    async def fill():
+        for key in "abc":
+            await cache.put(key, key)
+
+    run(fill())
+
+    assert len(cache) == 3
@@ -0,0 +1,54 @@
+import json
+
+from discord.ext import commands
+
+from new_implementation.benchmarks.fake_discord import FakeCommand
+from new_implementation.tests.conftest import create_context
+from new_implementation.utils.file_log import get_file_log
+
+
+def invoke(run, cog, ctx, command, error=None):
+    # The order discord.py calls the hooks in, after_invoke runs in a finally whether or not the command failed
+    async def invocation():
+        ctx.command = FakeCommand(command)
+        ctx.command_failed = False
+        await cog.cog_before_invoke(ctx)
+        if error is not None:
+            ctx.command_failed = True
+        await cog.cog_after_invoke(ctx)
+        if error is not None:
+            await cog.cog_command_error(ctx, error)
+
+    run(invocation())
+
+
+def read_log(path):
+    get_file_log().stop()
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_completed_commands_are_logged_once(run, create_bot, bot_directory):
+    log_path = str(bot_directory / "commands.log")
+    bot = create_bot(log_file=log_path)
+    cog = bot.get_cog("CoreCog")
+    ctx = create_context(bot)
+
+    invoke(run, cog, ctx, cog.purge_memory_command)
+
+    assert [line["message"] for line in read_log(log_path)] == ["Command completed"]
+
+
+def test_failed_commands_are_only_logged_as_failed(run, create_bot, bot_directory):
+    log_path = str(bot_directory / "commands.log")
+    bot = create_bot(log_file=log_path)
+    cog = bot.get_cog("CoreCog")
+    ctx = create_context(bot)
+
+    invoke(run, cog, ctx, cog.purge_memory_command, error=commands.CommandInvokeError(RuntimeError("broken")))
+
+    # The error is also sent to the guild's log channel, which is mirrored to the file
+    lines = [line for line in read_log(log_path) if line["message"].startswith("Command ")]
+    assert [line["message"] for line in lines] == ["Command failed"]
+    assert lines[0]["error"] == "RuntimeError"
+    assert lines[0]["command"] == "purge_memory"
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+
+import pytest
+
+from new_implementation.audio import extraction
+from new_implementation.audio.audio import Track
+from new_implementation.audio.extraction import ExtractionExecutor, ExtractionQueueFull, get_extraction_executor
+from new_implementation.audio.resolver import TrackResolver
+from new_implementation.benchmarks.fake_discord import FakeContext, FakeGuild
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    # A single worker, so the order jobs are started in is the order they were dispatched in
+    executor = ExtractionExecutor(max_workers=1, max_queued_per_guild=2)
+    monkeypatch.setattr(extraction, "extraction_executor", executor)
+    yield executor
+    executor.shutdown()
+
+
+def blocked_job(gate, started, name):
+    def job():
+        started.append(name)
+        gate.wait(5)
+        return name
+    return job
+
+
+class GatedSource:
+    """
+    Stands in for a source type, its lookups block on the extraction executor until the gate is opened.
+    """
+    gate = None
+    started = None
+
+    @classmethod
+    async def fetch_info(cls, search, *, loop=None, guild_id=None):
+        name = await get_extraction_executor().run(guild_id, blocked_job(cls.gate, cls.started, search))
+        return {"title": name, "webpage_url": name}
+
+
+def test_guilds_take_turns(run, executor):
+    gate = threading.Event()
+    started = list()
+
+    async def request():
+        first = [asyncio.ensure_future(executor.run(1, blocked_job(gate, started, "first:" + str(i)))) for i in range(2)]
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(executor.run(2, blocked_job(gate, started, "second:0")))
+        third = asyncio.ensure_future(executor.run(1, blocked_job(gate, started, "first:2")))
+        gate.set()
+        return await asyncio.gather(*first, second, third)
+
+    run(request())
+
+    # The second guild only asked once the first had queued up, but doesn't wait for all of the first guild's jobs
+    assert started == ["first:0", "first:1", "second:0", "first:2"]
+    assert executor.get_statistics()["completed"] == 4
+
+
+def test_guilds_asking_for_too_much_are_turned_away(run, executor):
+    gate = threading.Event()
+    started = list()
+
+    async def request():
+        jobs = [asyncio.ensure_future(executor.run(1, blocked_job(gate, started, str(i)))) for i in range(3)]
+        await asyncio.sleep(0.05)
+
+        # One is running and two are waiting, which is as many as a guild can have waiting
+        with pytest.raises(ExtractionQueueFull):
+            await executor.run(1, blocked_job(gate, started, "rejected"))
+        jobs.append(asyncio.ensure_future(executor.run(2, blocked_job(gate, started, "other guild"))))
+
+        gate.set()
+        return await asyncio.gather(*jobs)
+
+    assert run(request()) == ["0", "1", "2", "other guild"]
+    assert executor.get_statistics()["rejected"] == 1
+
+
+def test_closing_a_track_drops_its_lookup(run, executor):
+    gate = threading.Event()
+    started = list()
+    GatedSource.gate = gate
+    GatedSource.started = started
+    guild = FakeGuild("Test guild")
+    ctx = FakeContext(None, guild, guild.add_member("Member"), None)
+    resolver = TrackResolver()
+
+    async def request():
+        # Keep the only worker busy, so the tracks are still waiting for it when the first is closed
+        busy = asyncio.ensure_future(executor.run(0, blocked_job(gate, started, "busy")))
+        removed = Track(ctx, "removed", source_type=GatedSource)
+        kept = Track(ctx, "kept", source_type=GatedSource)
+        resolver.submit(removed)
+        resolver.submit(kept)
+        await asyncio.sleep(0.05)
+        assert executor.get_statistics()["queued"] == 2
+
+        removed.close()
+        await asyncio.sleep(0.01)
+        assert executor.get_statistics()["queued"] == 1
+
+        gate.set()
+        await busy
+        return removed, await kept.resolution
+
+    removed, info = run(request())
+    assert info["title"] == "kept"
+    assert "removed" not in started
+    assert removed.resolution.exception() is not None
+    assert resolver.get_statistics()["cancelled"] == 1
+    assert executor.get_statistics()["cancelled"] == 1
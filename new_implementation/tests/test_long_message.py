@@ -0,0 +1,38 @@
+import pytest
+
+from shared.long_message import split_offsets, chunk_lines
+
+
+def test_lines_are_packed_into_chunks():
+    # "aaa\nbb\ncccc" split into chunks of at most 6 characters
+    assert split_offsets([3, 2, 4], 6) == [(0, 6), (7, 11)]
+
+
+def test_forced_split():
+    assert split_offsets([1, None, 1], 10) == [(0, 1), (2, 3)]
+    assert split_offsets([None, 1, None, None], 10) == [(0, 1)]
+
+
+def test_long_lines_are_hard_split():
+    assert split_offsets([2, 7], 3) == [(0, 2), (3, 6), (6, 9), (9, 10)]
+
+
+def test_nothing_to_split():
+    assert split_offsets([], 10) == []
+
+
+def test_chunks_fit_and_keep_every_line():
+    lines = ["line " + str(index) for index in range(40)]
+    chunks = list(chunk_lines(lines, max_length=50, prefix="<", suffix=">"))
+
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert "\n".join(chunk[1:-1] for chunk in chunks).split("\n") == lines
+
+
+def test_forced_split_starts_a_new_chunk():
+    assert list(chunk_lines(["a", None, "b"], prefix="", suffix="")) == ["a", "b"]
+
+
+def test_prefix_and_suffix_must_fit():
+    with pytest.raises(ValueError):
+        list(chunk_lines(["a"], max_length=3, prefix="<<", suffix=">>"))
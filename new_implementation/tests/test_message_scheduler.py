@@ -0,0 +1,35 @@
+import asyncio
+
+from new_implementation.core.instrumentation import PHASE_SEND, CommandMetrics
+from new_implementation.utils.message_scheduler import MessageScheduler
+
+
+class SlowDestination:
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = list()
+
+    async def send(self, content, embed=None):
+        await asyncio.sleep(self.delay)
+        self.sent.append(content)
+
+
+def test_sends_are_timed_against_the_command_that_queued_them(run):
+    metrics = CommandMetrics()
+    scheduler = MessageScheduler()
+    destination = SlowDestination(0.05)
+
+    async def command():
+        metrics.begin_command("calendar:today")
+        scheduler.enqueue("channel", destination, content="first")
+        scheduler.enqueue("channel", destination, content="second")
+        metrics.end_command()
+
+    # The command is over before its message goes out, the send is still added to it
+    run(command())
+    run(scheduler.flush())
+
+    send = metrics.get_snapshot()["calendar:today"]["phases"][PHASE_SEND]
+    assert destination.sent == ["first\nsecond"]
+    assert send["count"] == 1
+    assert send["max_ms"] >= 50
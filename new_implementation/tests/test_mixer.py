@@ -0,0 +1,69 @@
+import asyncio
+
+import discord
+
+from new_implementation.audio.mixer import AudioMixer, FRAME_SIZE, mix_frames
+
+
+class FrameSource(discord.AudioSource):
+    """
+    Plays the given number of frames, each frame filled with its own number, then runs out.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.position = 0
+        self.cleanups = 0
+
+    def read(self):
+        if self.position >= self.frames:
+            return b""
+        self.position += 1
+        return bytes([self.position % 256]) * FRAME_SIZE
+
+    def cleanup(self):
+        self.cleanups += 1
+
+
+def create_mixer():
+    # The run fixture has already made its loop the current one
+    return AudioMixer(asyncio.get_event_loop())
+
+
+def test_layers_are_scaled_and_clipped():
+    loud = (b"\xff\x7f" * (FRAME_SIZE // 2))
+    quiet = (b"\x00\x10" * (FRAME_SIZE // 2))
+    assert mix_frames([loud, quiet], [1.0, 1.0]) == loud
+    assert mix_frames([quiet, quiet], [0.5, 0.5]) == quiet
+
+
+def test_short_layers_are_looped_from_memory(run):
+    mixer = create_mixer()
+    finished = list()
+    source = FrameSource(3)
+    mixer.add_layer("rain", discord.PCMVolumeTransformer(source, 1.0), after=finished.append, min_recording=2, max_recording=10)
+
+    played = [mixer.read()[0] for _ in range(7)]
+    run(asyncio.sleep(0))
+
+    # The source was only played through once, everything after that came out of memory
+    assert played == [1, 2, 3, 1, 2, 3, 1]
+    assert source.position == 3
+    assert source.cleanups == 1
+    assert finished == []
+    assert mixer.has_layers()
+
+
+def test_long_and_broken_layers_run_out(run):
+    mixer = create_mixer()
+    finished = list()
+    mixer.add_layer("river", FrameSource(5), after=finished.append, min_recording=2, max_recording=3)
+    mixer.add_layer("static", FrameSource(1), after=finished.append, min_recording=2, max_recording=3)
+
+    for _ in range(6):
+        mixer.read()
+    run(asyncio.sleep(0))
+
+    # Too long to keep in memory and too short to be worth looping, whoever added them decides what happens next
+    assert sorted(layer.name for layer in finished) == ["river", "static"]
+    assert not mixer.has_layers()
@@ -0,0 +1,38 @@
+from new_implementation.data.games import GameData
+from new_implementation.modules.calendar.calendar_data import CalendarHolderData
+from new_implementation.tests.conftest import create_context
+from new_implementation.utils import utils
+
+
+def test_modules_marked_after_changes_are_saved(run, create_bot):
+    bot = create_bot()
+    ctx = create_context(bot)
+    game = GameData(utils.get_guild_id_from_context(ctx), "campaign", utils.get_user_id_from_context(ctx), ctx.author.name)
+    game.set_module_data("notes", {"sessions": 1})
+    run(bot.save_game(ctx, game))
+
+    # Changed in place, then flagged as dirty
+    loaded = run(bot.get_game(ctx, "campaign"))
+    loaded.get_module_data("notes")["sessions"] = 2
+    loaded.mark_module_data_dirty("notes")
+    run(bot.save_game(ctx, loaded))
+
+    assert run(bot.get_game(ctx, "campaign")).get_module_data("notes") == {"sessions": 2}
+
+
+def test_only_changed_modules_are_saved():
+    game = GameData("1", "campaign", "2", "Game master")
+    game.set_module_data("notes", {"sessions": 1})
+    game.set_module_data("calendars", CalendarHolderData())
+    game.take_dirty_module_data()
+
+    game.attach_unmaterialized_module_data("rolls", {"count": 3})
+    assert game.take_dirty_module_data() == dict()
+
+    # Reading a module leaves it alone, only marked modules are written
+    game.get_module_data("notes")
+    game.get_module_data("rolls")
+    assert game.take_dirty_module_data() == dict()
+
+    game.mark_module_data_dirty("notes")
+    assert list(game.take_dirty_module_data()) == ["notes"]
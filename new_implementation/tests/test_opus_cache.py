@@ -0,0 +1,27 @@
+from new_implementation.audio.sources.opus_cache import CachedOpusSource, OpusCache
+from new_implementation.audio.sources.ytdl_source import YTDLSource
+from new_implementation.benchmarks.fake_discord import FakeContext, FakeGuild
+
+
+def create_context():
+    guild = FakeGuild("Test guild")
+    return FakeContext(None, guild, guild.add_member("Member"), None)
+
+
+def test_tracks_are_only_played_from_the_cache_at_its_volume(run, tmp_path):
+    # Never transcode here, there is no ffmpeg
+    opus_cache = OpusCache(str(tmp_path), min_plays=1000, volume=0.5)
+    info = {"title": "Track", "webpage_url": "https://track/1", "url": "https://stream/1"}
+    open(opus_cache.get_path(opus_cache.get_key(YTDLSource, info["webpage_url"])), "wb").close()
+
+    async def open_at(volume):
+        return opus_cache.open(create_context(), YTDLSource, info, volume)
+
+    source = run(open_at(0.5))
+    assert isinstance(source, CachedOpusSource)
+    source.cleanup()
+
+    # A different volume goes back to the original rather than keeping a second copy
+    assert run(open_at(0.8)) is None
+    assert opus_cache.get_statistics()["hits"] == 1
+    assert len(list(tmp_path.iterdir())) == 1
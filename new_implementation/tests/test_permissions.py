@@ -0,0 +1,68 @@
+from new_implementation.core.permissions_handler import PermissionLevel
+from new_implementation.data.games import GameData
+from new_implementation.data.roles import RoleInterner
+from new_implementation.tests.conftest import create_context
+from new_implementation.utils import utils
+
+
+def start_game(run, bot, ctx, players=()):
+    game = GameData(utils.get_guild_id_from_context(ctx), "campaign", utils.get_user_id_from_context(ctx), ctx.author.name, players=list(players))
+    run(bot.save_game(ctx, game))
+    bot.set_active_game_for_context(ctx, game)
+    return game
+
+
+def test_decisions_survive_plain_saves(run, create_bot):
+    bot = create_bot()
+    handler = bot.get_permission_handler()
+    cache = handler.get_decision_cache()
+    ctx = create_context(bot)
+    game = start_game(run, bot, ctx)
+
+    assert run(handler.check_active_game_permissions_for_user(ctx, "calendar:increment", permissions_level=PermissionLevel.GAME_MASTER))[0]
+    misses = cache.misses
+
+    # Saving game and guild data (i.e. a calendar increment) doesn't change who can do what
+    run(bot.save_game(ctx, game))
+    run(bot.save_guild_data_for_context(ctx))
+    assert run(handler.check_active_game_permissions_for_user(ctx, "calendar:increment", permissions_level=PermissionLevel.GAME_MASTER))[0]
+    assert cache.misses == misses
+
+
+def test_permission_changes_invalidate_decisions(run, create_bot):
+    bot = create_bot()
+    handler = bot.get_permission_handler()
+    game_master = create_context(bot)
+    player = create_context(bot, guild=game_master.guild)
+    start_game(run, bot, game_master, players=[utils.get_user_id_from_context(player)])
+
+    assert not run(handler.check_active_game_permissions_for_user(player, "calendar:increment", permissions_level=PermissionLevel.GAME_MASTER))[0]
+
+    run(handler.set_game_permissions_for_context(game_master, "calendar:increment", PermissionLevel.PARTY))
+    assert run(handler.check_active_game_permissions_for_user(player, "calendar:increment", permissions_level=PermissionLevel.GAME_MASTER))[0]
+
+
+def test_ending_the_game_invalidates_decisions(run, create_bot):
+    bot = create_bot()
+    handler = bot.get_permission_handler()
+    ctx = create_context(bot)
+    start_game(run, bot, ctx)
+
+    assert run(handler.check_active_game_permissions_for_user(ctx, "calendar:increment", permissions_level=PermissionLevel.GAME_MASTER))[0]
+    run(bot.end_active_game_for_context(ctx))
+    assert not run(handler.check_active_game_permissions_for_user(ctx, "calendar:increment", permissions_level=PermissionLevel.GAME_MASTER))[0]
+
+
+def test_game_role_permissions_survive_a_new_role_interner(run, create_bot):
+    bot = create_bot()
+    ctx = create_context(bot)
+    game = start_game(run, bot, ctx)
+    game.get_or_create_permissions_for("calendar:increment").add_allowed_role(ctx.guild.get_role("Bard"))
+    run(bot.save_game(ctx, game))
+
+    # The guild was never saved, so after a restart its interner hands the role bits out in a different order
+    loaded = run(create_bot().get_game(ctx, "campaign"))
+    role_interner = RoleInterner()
+    role_interner.intern("GameMaster")
+    mask = loaded.get_permissions_for("calendar:increment").get_allowed_role_mask(role_interner)
+    assert role_interner.get_names_for_mask(mask) == ["Bard"]
@@ -0,0 +1,185 @@
+import os
+
+from new_implementation.data.data import DataAccessObject
+from new_implementation.data.persistence import PersistenceLayer
+from shared import serialization
+from shared.serialization import LazyObject
+
+
+class Record:
+    def __init__(self, name, counter, notes):
+        self.name = name
+        self.counter = counter
+        self.notes = notes
+
+
+def save(run, persistence, path, record):
+    dao = DataAccessObject()
+    dao.set_payload(record)
+    run(persistence.save(path, dao))
+
+
+def load(run, persistence, path):
+    return run(persistence.load(path, DataAccessObject())).get_payload()
+
+
+def read_journal(path):
+    with open(path + PersistenceLayer.JOURNAL_SUFFIX, "rb") as journal_file:
+        return journal_file.read().splitlines()
+
+
+def test_snapshots_serialize_like_the_objects_they_were_taken_of():
+    record = Record("campaign", 3, [Record("nested", 1, {"a": (1, 2)})])
+    tree = serialization.snapshot(record)
+    assert serialization.dumps(tree) == serialization.dumps(record)
+
+    # Nothing in the snapshot is shared with the record
+    record.notes[0].notes["a"] = None
+    record.notes.append("later")
+    assert serialization.dumps(tree) != serialization.dumps(record)
+
+    lazy = LazyObject(serialization.loads_raw(serialization.dumps(record)))
+    assert serialization.snapshot(lazy) == serialization.loads_raw(serialization.dumps(record))
+
+
+def test_changed_fields_are_journaled(run, tmp_path):
+    persistence = PersistenceLayer(journal_enabled=True)
+    path = str(tmp_path / "record.json")
+    record = Record("campaign", 0, ["a long list of notes"] * 10)
+
+    save(run, persistence, path, record)
+    for counter in range(1, 4):
+        record.counter = counter
+        save(run, persistence, path, record)
+
+    # Only the counter was written after the first save
+    journal = read_journal(path)
+    assert len(journal) == 3
+    assert all(b"notes" not in line for line in journal)
+    assert load(run, PersistenceLayer(journal_enabled=True), path).counter == 3
+
+
+def test_replay_stops_at_a_torn_entry(run, tmp_path):
+    persistence = PersistenceLayer(journal_enabled=True)
+    path = str(tmp_path / "record.json")
+    record = Record("campaign", 0, ["notes"])
+
+    save(run, persistence, path, record)
+    record.counter = 1
+    save(run, persistence, path, record)
+    record.counter = 2
+    save(run, persistence, path, record)
+
+    # A crash part way through appending the last entry
+    with open(path + PersistenceLayer.JOURNAL_SUFFIX, "rb+") as journal_file:
+        journal_file.truncate(journal_file.seek(0, 2) - 5)
+
+    assert load(run, PersistenceLayer(journal_enabled=True), path).counter == 1
+
+
+def test_saves_after_a_torn_entry_are_kept(run, tmp_path):
+    path = str(tmp_path / "record.json")
+    record = Record("campaign", 0, ["notes"])
+
+    persistence = PersistenceLayer(journal_enabled=True)
+    save(run, persistence, path, record)
+    record.counter = 1
+    save(run, persistence, path, record)
+
+    # A crash part way through appending, then a restart that carries on saving
+    with open(path + PersistenceLayer.JOURNAL_SUFFIX, "ab") as journal_file:
+        journal_file.write(b'{"base":1,"se')
+
+    persistence = PersistenceLayer(journal_enabled=True)
+    record = load(run, persistence, path)
+    record.name = "renamed"
+    save(run, persistence, path, record)
+
+    reloaded = load(run, PersistenceLayer(journal_enabled=True), path)
+    assert (reloaded.name, reloaded.counter) == ("renamed", 1)
+
+    run(persistence.compact(path))
+    compacted = load(run, PersistenceLayer(), path)
+    assert (compacted.name, compacted.counter) == ("renamed", 1)
+
+
+def test_replay_skips_entries_for_an_older_base(run, tmp_path):
+    persistence = PersistenceLayer(journal_enabled=True)
+    path = str(tmp_path / "record.json")
+    record = Record("campaign", 0, ["notes"])
+
+    save(run, persistence, path, record)
+    record.counter = 1
+    save(run, persistence, path, record)
+    stale_journal = read_journal(path)
+
+    # Rewrite the base without the journal, as if compaction crashed before removing it
+    record.counter = 5
+    save(run, PersistenceLayer(), path, record)
+    with open(path + PersistenceLayer.JOURNAL_SUFFIX, "wb") as journal_file:
+        journal_file.write(b"\n".join(stale_journal) + b"\n")
+
+    assert load(run, PersistenceLayer(journal_enabled=True), path).counter == 5
+
+
+def test_compaction_folds_the_journal_into_the_base(run, tmp_path):
+    persistence = PersistenceLayer(journal_enabled=True)
+    path = str(tmp_path / "record.json")
+    record = Record("campaign", 0, ["notes"])
+
+    save(run, persistence, path, record)
+    record.counter = 1
+    save(run, persistence, path, record)
+    record.name = "renamed"
+    save(run, persistence, path, record)
+    run(persistence.compact_all())
+
+    assert not os.path.exists(path + PersistenceLayer.JOURNAL_SUFFIX)
+    compacted = load(run, PersistenceLayer(), path)
+    assert (compacted.name, compacted.counter) == ("renamed", 1)
+
+    # Later saves journal against the compacted base
+    record.counter = 2
+    save(run, persistence, path, record)
+    assert len(read_journal(path)) == 1
+    assert load(run, PersistenceLayer(journal_enabled=True), path).counter == 2
+
+
+def test_full_write_once_the_journal_reaches_the_threshold(run, tmp_path):
+    persistence = PersistenceLayer(journal_enabled=True, compaction_threshold=2)
+    path = str(tmp_path / "record.json")
+    record = Record("campaign", 0, ["notes"])
+
+    save(run, persistence, path, record)
+    for counter in range(1, 4):
+        record.counter = counter
+        save(run, persistence, path, record)
+
+    assert not os.path.exists(path + PersistenceLayer.JOURNAL_SUFFIX)
+    assert load(run, PersistenceLayer(), path).counter == 3
+
+
+def test_journal_append_rebases_onto_another_processes_write(run, tmp_path):
+    lock_directory = str(tmp_path / "locks")
+    path = str(tmp_path / "record.json")
+    first = PersistenceLayer(journal_enabled=True)
+    first.configure(lock_directory=lock_directory)
+    second = PersistenceLayer(journal_enabled=True)
+    second.configure(lock_directory=lock_directory)
+
+    record = Record("campaign", 0, ["notes"])
+    save(run, first, path, record)
+    loaded = load(run, second, path)
+
+    # The first process changes the counter and rewrites the base under the second
+    record.counter = 1
+    save(run, first, path, record)
+    run(first.compact(path))
+
+    # The second process only changed the name, which must land on top of the first's counter
+    loaded.name = "renamed"
+    save(run, second, path, loaded)
+
+    assert not os.path.exists(path + PersistenceLayer.JOURNAL_SUFFIX)
+    merged = load(run, PersistenceLayer(), path)
+    assert (merged.name, merged.counter) == ("renamed", 1)
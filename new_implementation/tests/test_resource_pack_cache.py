@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+import pytest
+
+from new_implementation.core import resource_pack_cache, resource_pack_index
+from new_implementation.core.resource_handler import ResourcePack
+from new_implementation.core.resource_pack_index import RESOURCE_PACK_DESCRIPTOR
+from new_implementation.modules.calendar.calendar_data import CalendarResourcePack
+from new_implementation.modules.calendar.waterdeep_calendar import WaterdeepCalendarData
+from shared import serialization
+
+PACK_ID = "application:calendars:waterdeep"
+
+
+def install_pack(bot, data_to_load=("calendar_format.json",)):
+    path = bot.get_resource_handler().get_resource_pack_path(PACK_ID)
+    os.makedirs(path, exist_ok=True)
+    calendar_module = WaterdeepCalendarData.__module__
+    files = {
+        RESOURCE_PACK_DESCRIPTOR: ResourcePack(list(data_to_load)),
+        "calendar_format.json": CalendarResourcePack(calendar_module, calendar_module)
+    }
+    for name, payload in files.items():
+        data = serialization.dumps(payload)
+        with open(os.path.join(path, name), "wb") as data_file:
+            data_file.write(data if isinstance(data, bytes) else data.encode("utf-8"))
+
+
+def count_fingerprints(monkeypatch):
+    calls = list()
+    fingerprint = resource_pack_cache.fingerprint_resource_pack
+
+    def counted(path):
+        calls.append(path)
+        return fingerprint(path)
+
+    monkeypatch.setattr(resource_pack_cache, "fingerprint_resource_pack", counted)
+    return calls
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watched_packs_are_only_checked_when_they_change(run, create_bot, monkeypatch, use_inotify):
+    if use_inotify and resource_pack_index.INotify is None:
+        pytest.skip("inotify_simple isn't installed")
+    if not use_inotify:
+        monkeypatch.setattr(resource_pack_index, "INotify", None)
+
+    bot = create_bot()
+    cache = bot.get_resource_pack_cache()
+    index = bot.get_resource_handler().get_resource_pack_index()
+    index.configure(poll_interval=3600)
+    install_pack(bot)
+    run(index.start())
+    fingerprints = count_fingerprints(monkeypatch)
+
+    for _ in range(5):
+        assert run(cache.get(PACK_ID)) is not None
+    assert len(fingerprints) == 1
+    assert cache.get_statistics()["loads"] == 1
+
+    # Nothing is looked at again until the index notices the change
+    install_pack(bot, ("calendar_format.json", "notes.json"))
+    if use_inotify:
+        run(asyncio.sleep(0.1))
+    else:
+        assert run(cache.get(PACK_ID)).get_data_to_load() == ["calendar_format.json"]
+        assert run(index.poll()) == 1
+
+    assert run(cache.get(PACK_ID)).get_data_to_load() == ["calendar_format.json", "notes.json"]
+    assert cache.get_statistics()["loads"] == 2
+
+
+def test_unwatched_packs_are_checked_on_every_lookup(run, create_bot, monkeypatch):
+    bot = create_bot()
+    cache = bot.get_resource_pack_cache()
+    install_pack(bot)
+    fingerprints = count_fingerprints(monkeypatch)
+
+    for _ in range(3):
+        assert run(cache.get(PACK_ID)) is not None
+    assert len(fingerprints) == 3
+
+    install_pack(bot, ("calendar_format.json", "notes.json"))
+    assert run(cache.get(PACK_ID)).get_data_to_load() == ["calendar_format.json", "notes.json"]
+    assert cache.get_statistics()["loads"] == 2
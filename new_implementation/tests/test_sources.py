@@ -0,0 +1,62 @@
+import time
+
+import discord
+import pytest
+
+from new_implementation.audio.sources import metadata_cache, ytdl_source
+from new_implementation.audio.sources.ytdl_source import YTDLSource
+from new_implementation.benchmarks.fake_discord import FakeContext, FakeGuild
+
+
+class FakeStream(discord.AudioSource):
+    def __init__(self, url, **options):
+        self.url = url
+
+    def read(self):
+        return b''
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    # No ffmpeg or network here, record what would have been looked up and opened instead
+    lookups = list()
+
+    async def resolve(webpage_url, guild_id=None):
+        lookups.append(webpage_url)
+        return create_info(webpage_url, "https://stream/" + str(len(lookups)))
+
+    monkeypatch.setattr(ytdl_source.discord, "FFmpegPCMAudio", FakeStream)
+    monkeypatch.setattr(YTDLSource, "resolve", resolve)
+    monkeypatch.setattr(metadata_cache, "metadata_cache", None)
+    return lookups
+
+
+def create_info(webpage_url, url, resolved_at=None):
+    return {"title": "Track", "webpage_url": webpage_url, "url": url, "upload_date": "20200101", "duration": 60, "resolved_at": resolved_at if resolved_at is not None else time.time()}
+
+
+def create_context():
+    guild = FakeGuild("Test guild")
+    return FakeContext(None, guild, guild.add_member("Member"), None)
+
+
+def test_resolved_tracks_are_opened_without_looking_them_up(run, lookups):
+    source = run(YTDLSource.from_info(create_context(), create_info("https://track", "https://stream/0")))
+    assert lookups == []
+    assert source.original.url == "https://stream/0"
+
+
+def test_expired_stream_urls_are_looked_up_again(run, lookups):
+    info = create_info("https://track", "https://stream/0", resolved_at=time.time() - metadata_cache.STREAM_TTL)
+    source = run(YTDLSource.from_info(create_context(), info))
+    assert lookups == ["https://track"]
+    assert source.original.url == "https://stream/1"
+
+    # Repeats of the now fresh stream url don't need another lookup
+    run(source.recreate())
+    assert lookups == ["https://track"]
+
+    source.data["resolved_at"] = time.time() - metadata_cache.STREAM_TTL
+    run(source.recreate())
+    assert lookups == ["https://track", "https://track"]
+    assert source.original.url == "https://stream/2"
@@ -0,0 +1,78 @@
+from new_implementation.data.games import GameData
+from new_implementation.runtimes.sharded_runtime.supervisor import ShardSupervisor
+from new_implementation.tests.conftest import create_context
+from new_implementation.utils import utils
+
+
+def create_shards(create_bot, **config):
+    # A shard and the ancillary process, sharing one data directory
+    shard = create_bot(shared_storage=True, **config)
+    ancillary = create_bot(shared_storage=True, primary=False, **config)
+    return shard, ancillary
+
+
+def start_game(run, bot, ctx):
+    game = GameData(utils.get_guild_id_from_context(ctx), "campaign", utils.get_user_id_from_context(ctx), ctx.author.name)
+    run(bot.save_game(ctx, game))
+    bot.set_active_game_for_context(ctx, game)
+    run(bot.save_session_for_context(ctx))
+    return game
+
+
+def test_ancillary_bot_runs_in_its_own_process():
+    supervisor = ShardSupervisor({"discord_token": "test", "ancillary_token": "ancillary", "log_file": False}, 2)
+    processes = supervisor.get_processes()
+
+    assert [supervised.name for supervised in processes] == ["shard-0", "shard-1", "ancillary"]
+    for supervised in processes[:2]:
+        assert "ancillary_token" not in supervised.config
+    assert processes[2].config["primary"] is False
+    assert processes[2].config["shared_storage"] is True
+
+
+def test_ancillary_process_follows_the_shards_sessions(run, create_bot):
+    shard, ancillary = create_shards(create_bot)
+    ctx = create_context(shard)
+    ancillary_ctx = create_context(ancillary, guild=ctx.guild)
+
+    start_game(run, shard, ctx)
+    run(ancillary.load_session_for_context(ancillary_ctx))
+    assert ancillary.get_active_game_for_context(ancillary_ctx).get_name() == "campaign"
+
+    run(shard.end_active_game_for_context(ctx))
+    run(ancillary.load_session_for_context(ancillary_ctx))
+    assert ancillary.get_active_game_for_context(ancillary_ctx) is None
+
+
+def test_restarted_shard_clears_its_sessions(run, create_bot):
+    shard, ancillary = create_shards(create_bot)
+    ctx = create_context(shard)
+    ancillary_ctx = create_context(ancillary, guild=ctx.guild)
+    start_game(run, shard, ctx)
+
+    run(create_bot(shared_storage=True).clear_sessions())
+    run(ancillary.load_session_for_context(ancillary_ctx))
+    assert ancillary.get_active_game_for_context(ancillary_ctx) is None
+
+
+def test_ancillary_process_never_holds_guild_data(run, create_bot):
+    shard, ancillary = create_shards(create_bot, cache_write_back=True)
+    ctx = create_context(shard)
+    ancillary_ctx = create_context(ancillary, guild=ctx.guild)
+    assert not ancillary.cache_write_back
+
+    run(ancillary.get_guild_data_for_context(ancillary_ctx))
+    guild_data = run(shard.get_guild_data_for_context(ctx))
+    guild_data.add_game("campaign")
+    run(shard.save_guild_data_for_context(ctx))
+    run(shard.flush_caches())
+
+    assert "campaign" in run(ancillary.get_guild_data_for_context(ancillary_ctx)).get_games()
+
+
+def test_process_log_files_are_opt_in():
+    processes = ShardSupervisor({"discord_token": "test", "ancillary_token": "ancillary"}, 2).get_processes()
+    assert all("log_file" not in supervised.config for supervised in processes)
+
+    processes = ShardSupervisor({"discord_token": "test", "ancillary_token": "ancillary", "log_file": True}, 2).get_processes()
+    assert len({supervised.config["log_file"] for supervised in processes}) == 3
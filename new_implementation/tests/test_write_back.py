@@ -0,0 +1,57 @@
+import asyncio
+
+from new_implementation.core.engine import Engine
+from new_implementation.tests.conftest import create_context
+from new_implementation.utils import utils
+
+
+def add_game_to_guild(run, bot, ctx, game_name):
+    async def update():
+        guild_data = await bot.get_guild_data_for_context(ctx)
+        guild_data.add_game(game_name)
+        await bot.save_guild_data_for_context(ctx)
+
+    run(update())
+
+
+def read_guild_games(run, create_bot, ctx):
+    # A second bot over the same directory only sees what reached the disk
+    bot = create_bot()
+    return run(bot.get_guild_data_for_context(ctx)).get_games()
+
+
+def test_write_back_defers_saves(run, create_bot):
+    bot = create_bot(cache_write_back=True)
+    ctx = create_context(bot)
+    add_game_to_guild(run, bot, ctx, "campaign")
+
+    assert bot.guild_cache.is_dirty(utils.get_guild_id_from_context(ctx))
+    assert "campaign" not in read_guild_games(run, create_bot, ctx)
+
+
+def test_shutdown_writes_back_dirty_entries(run, create_bot):
+    bot = create_bot(cache_write_back=True)
+    ctx = create_context(bot)
+    add_game_to_guild(run, bot, ctx, "campaign")
+
+    run(Engine.shutdown(bot))
+
+    assert not bot.guild_cache.is_dirty(utils.get_guild_id_from_context(ctx))
+    assert "campaign" in read_guild_games(run, create_bot, ctx)
+
+
+def test_dirty_entries_are_flushed_periodically(run, create_bot):
+    bot = create_bot(cache_write_back=True)
+    ctx = create_context(bot)
+    add_game_to_guild(run, bot, ctx, "campaign")
+
+    async def flush_for_a_while():
+        task = asyncio.get_event_loop().create_task(bot.run_periodic_cache_flush(0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    run(flush_for_a_while())
+
+    # Still cached, but already on disk
+    assert utils.get_guild_id_from_context(ctx) in bot.guild_cache
+    assert "campaign" in read_guild_games(run, create_bot, ctx)
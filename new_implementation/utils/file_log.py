@@ -0,0 +1,179 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from new_implementation.utils import utils
+
+LOGGER_NAME = "dndiscord"
+
+# Extra fields that are copied from the log record into the json line when present
+RECORD_FIELDS = ("guild", "game", "command", "user", "latency_ms", "error", "traceback")
+
+
+def get_default_log_path():
+    return os.path.join(os.getcwd(), "logs", "dndiscord.log")
+
+
+def compress_file(source, destination):
+    with open(source, "rb") as source_file, gzip.open(destination, "wb") as destination_file:
+        shutil.copyfileobj(source_file, destination_file)
+    os.remove(source)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        line = {
+            "time": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+        for field in RECORD_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                line[field] = value
+
+        return json.dumps(line, default=str)
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    Rotating file handler that gzips old segments. The segment is moved out of the way straight away and compressed
+    in the background, so writing carries on into the new segment whilst the old one is compressed.
+    """
+
+    def __init__(self, path, max_bytes, backup_count):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self.__rotate
+        self.compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dndiscord-log-compression")
+        self.compression = None
+
+    def doRollover(self):
+        # The older segments are renamed during a roll over, so the last segment needs to have finished compressing
+        if self.compression is not None:
+            self.compression.result()
+            self.compression = None
+
+        super().doRollover()
+
+    def close(self):
+        super().close()
+        self.compressor.shutdown(wait=True)
+
+    def __rotate(self, source, destination):
+        pending = destination + ".pending"
+        os.replace(source, pending)
+        self.compression = self.compressor.submit(compress_file, pending, destination)
+
+
+class FileLog:
+    """
+    Writes json lines to a rotating log file without blocking the event loop. Records are put onto a queue by the
+    logger and written out by a listener thread.
+    """
+
+    def __init__(self, path=None, max_bytes=10 * 1024 * 1024, backup_count=10):
+        self.path = path if path is not None else get_default_log_path()
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.queue_handler = None
+        self.listener = None
+
+    def start(self):
+        if self.listener is not None:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        file_handler = CompressingRotatingFileHandler(self.path, self.max_bytes, self.backup_count)
+        file_handler.setFormatter(JsonLinesFormatter())
+
+        records = queue.SimpleQueue()
+        self.queue_handler = QueueHandler(records)
+        self.listener = QueueListener(records, file_handler)
+        self.logger.addHandler(self.queue_handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is None:
+            return
+
+        # Stopping the listener writes out anything still queued
+        self.logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+        self.queue_handler = None
+
+    def get_logger(self):
+        return self.logger
+
+
+file_log = None
+
+
+def configure_file_log(path=None, max_bytes=None, backup_count=None):
+    global file_log
+    if file_log is not None:
+        file_log.stop()
+
+    file_log = FileLog(
+        path=path,
+        max_bytes=max_bytes if max_bytes is not None else 10 * 1024 * 1024,
+        backup_count=backup_count if backup_count is not None else 10
+    )
+    file_log.start()
+    return file_log
+
+
+def get_file_log():
+    return file_log
+
+
+def get_command_fields(engine, ctx):
+    fields = {
+        "command": ctx.command.qualified_name if ctx.command is not None else None,
+        "user": utils.get_user_id_from_context(ctx)
+    }
+
+    # Direct messages have no guild (or game)
+    if ctx.guild is not None:
+        fields["guild"] = utils.get_guild_id_from_context(ctx)
+        game = engine.get_active_game_for_context(ctx)
+        if game is not None:
+            fields["game"] = game.get_name()
+
+    # Set when the command was invoked
+    invoked_at = getattr(ctx, "invoked_at", None)
+    if invoked_at is not None:
+        fields["latency_ms"] = round((time.perf_counter() - invoked_at) * 1000, 3)
+
+    return fields
+
+
+def log_command(engine, ctx, message, level=logging.INFO, error=None):
+    """
+    Writes a line about the command being run in ctx to the log file, if there is one.
+    """
+    if file_log is None:
+        return
+
+    fields = get_command_fields(engine, ctx)
+    if error is not None:
+        fields["error"] = type(error).__name__
+        fields["traceback"] = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    file_log.get_logger().log(level, message, extra=fields)
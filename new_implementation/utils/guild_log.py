@@ -0,0 +1,161 @@
+import asyncio
+import traceback
+
+import discord
+
+from new_implementation.utils import utils
+from new_implementation.utils.message import send_message
+from shared.long_message import LongMessage
+
+
+class GuildLogBuffer:
+    def __init__(self, invocation_context):
+        self.invocation_context = invocation_context
+        self.lines = list()
+        self.task = None
+
+
+class GuildLog:
+    """
+    Per guild log channel sink.
+
+    The log channel is resolved (and created if required) once per guild and then cached until the channel is deleted
+    or changed. Log lines are buffered and sent in batches, either after flush_interval seconds or once max_lines have
+    built up. Guild data is only saved when the channel's name differs from the name we have stored.
+    """
+
+    def __init__(self, engine, flush_interval=2, max_lines=50):
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self.channels = dict()
+        self.channel_ids = dict()
+        self.buffers = dict()
+
+        # Statistics
+        self.resolutions = 0
+        self.lines_logged = 0
+        self.flushes = 0
+
+    def configure(self, flush_interval=None, max_lines=None):
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if max_lines is not None:
+            self.max_lines = max_lines
+
+    def log(self, invocation_context, message):
+        guild_id = utils.get_guild_id_from_context(invocation_context)
+        buffer = self.buffers.get(guild_id)
+        if buffer is None:
+            buffer = GuildLogBuffer(invocation_context)
+            self.buffers[guild_id] = buffer
+
+        buffer.invocation_context = invocation_context
+        buffer.lines.append(message)
+        self.lines_logged += 1
+
+        # Flush now if the buffer is full, otherwise give other lines the chance to join this one
+        if len(buffer.lines) >= self.max_lines:
+            if buffer.task is not None:
+                buffer.task.cancel()
+            buffer.task = asyncio.get_event_loop().create_task(self.__flush(guild_id, buffer, 0))
+        elif buffer.task is None:
+            buffer.task = asyncio.get_event_loop().create_task(self.__flush(guild_id, buffer, self.flush_interval))
+
+    async def flush_all(self):
+        for guild_id, buffer in list(self.buffers.items()):
+            if buffer.task is not None:
+                buffer.task.cancel()
+            await self.__flush(guild_id, buffer, 0)
+
+    def invalidate_channel(self, channel, deleted=False):
+        # Called for channel deletes and updates, only matters if it is our log channel
+        guild_id = str(channel.guild.id)
+        if self.channel_ids.get(guild_id) != channel.id:
+            return
+
+        # A renamed channel is still our log channel, we just need to pick up (and save) its new name
+        self.channels.pop(guild_id, None)
+        if deleted:
+            del self.channel_ids[guild_id]
+
+    def invalidate_guild(self, guild_id):
+        self.channels.pop(guild_id, None)
+        self.channel_ids.pop(guild_id, None)
+
+    def get_statistics(self):
+        return {
+            "guilds": len(self.channels),
+            "buffered": sum(len(buffer.lines) for buffer in self.buffers.values()),
+            "resolutions": self.resolutions,
+            "lines_logged": self.lines_logged,
+            "flushes": self.flushes
+        }
+
+    async def get_channel(self, invocation_context):
+        guild_id = utils.get_guild_id_from_context(invocation_context)
+        channel = self.channels.get(guild_id)
+        if channel is None:
+            channel = await self.__resolve_channel(invocation_context, self.channel_ids.get(guild_id))
+            self.channels[guild_id] = channel
+            self.channel_ids[guild_id] = channel.id
+
+        return channel
+
+    async def __flush(self, guild_id, buffer, delay):
+        if delay:
+            await asyncio.sleep(delay)
+
+        # Take the lines before any awaits so anything logged during the flush goes into the next one
+        lines = buffer.lines
+        buffer.lines = list()
+        buffer.task = None
+        if self.buffers.get(guild_id) is buffer:
+            del self.buffers[guild_id]
+        if not lines:
+            return
+
+        try:
+            channel = await self.get_channel(buffer.invocation_context)
+            long_message = LongMessage()
+            for line in lines:
+                long_message.add(line)
+            await send_message(buffer.invocation_context, long_message, channel=channel)
+            self.flushes += 1
+
+        except Exception:
+            print("Could not write " + str(len(lines)) + " log lines to the log channel for guild: " + guild_id)
+            traceback.print_exc()
+
+    async def __resolve_channel(self, invocation_context, channel_id):
+        self.resolutions += 1
+        guild = invocation_context.guild
+
+        # Try to get the log channel, by id if we have seen it before as it may have been renamed
+        guild_data = await self.engine.get_guild_data_for_context(invocation_context)
+        channel_name = guild_data.get_log_channel_name()
+        channel = guild.get_channel(channel_id) if channel_id is not None else None
+        if channel is None:
+            channel = discord.utils.get(guild.text_channels, name=channel_name)
+
+        # Channel handling
+        if channel is None:
+            # Category handling
+            category = discord.utils.get(guild.categories, name="Bot Channels")
+            if category is None:
+                category = await guild.create_category("Bot Channels")
+
+            # Admin role
+            admin_role = discord.utils.get(guild.roles, name="@admin")
+            overwrites = {
+                guild.default_role: discord.PermissionOverwrite(read_messages=False, send_messages=False),
+                admin_role: discord.PermissionOverwrite(read_messages=True, send_messages=True)
+            }
+            channel = await guild.create_text_channel(channel_name, category=category, overwrites=overwrites)
+
+        # Ensure the name is saved correctly, only touching the disk if it has changed
+        if guild_data.get_log_channel_name() != channel.name:
+            guild_data.set_log_channel_name(channel.name)
+            await self.engine.save_guild_data_for_context(invocation_context)
+
+        return channel
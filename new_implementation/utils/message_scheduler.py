@@ -0,0 +1,205 @@
+import asyncio
+import time
+import traceback
+
+from new_implementation.core.instrumentation import current_command, record_send
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to capacity sends, refilling at rate sends per second.
+    """
+
+    def __init__(self, rate=1.0, capacity=5):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+
+    def get_delay(self):
+        # How long until a token is available, 0 if one is available now
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+        if self.tokens >= 1:
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        delay = self.get_delay()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.get_delay()
+
+        self.tokens -= 1
+
+
+class OutboundMessage:
+    __slots__ = ("content", "embed", "futures", "commands")
+
+    def __init__(self, content, embed, future, command=None):
+        self.content = content
+        self.embed = embed
+        self.futures = [future]
+
+        # Timings of the commands that queued this message, the send is added to them once it has gone out
+        self.commands = [command] if command is not None else []
+
+    def can_merge(self, other):
+        # Anything after an embed has to be a new message, otherwise it would display above it
+        if self.embed is not None or other.content is None:
+            return False
+        if self.content is None:
+            return True
+
+        return len(self.content) + 1 + len(other.content) <= MAX_MESSAGE_LENGTH
+
+    def merge(self, other):
+        if self.content is None:
+            self.content = other.content
+        elif other.content is not None:
+            self.content = self.content + "\n" + other.content
+        self.embed = other.embed
+        self.futures.extend(other.futures)
+        self.commands.extend(command for command in other.commands if command not in self.commands)
+
+
+class ChannelQueue:
+    def __init__(self, destination):
+        self.destination = destination
+        self.pending = list()
+        self.bucket = None
+        self.task = None
+
+
+class MessageScheduler:
+    """
+    Outbound messages are queued per destination (a channel or a user's DMs) and sent by a task per destination, so
+    callers don't wait on each round trip. Sends are rate limited per destination by a token bucket, and whilst a
+    destination is waiting on its bucket adjacent small messages are merged up to the message length limit. Embeds
+    are attached to the text sent immediately before them.
+    """
+
+    def __init__(self, rate=1.0, burst=5, idle_timeout=60):
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = idle_timeout
+        self.queues = dict()
+
+        # Statistics
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+
+    def configure(self, rate=None, burst=None):
+        if rate is not None:
+            self.rate = rate
+        if burst is not None:
+            self.burst = burst
+
+    def enqueue(self, key, destination, content=None, embed=None):
+        """
+        Queues a message to the destination (anything with a discord send method). Returns a future that resolves to
+        whether the message containing it was sent.
+        """
+        future = asyncio.get_event_loop().create_future()
+        message = OutboundMessage(content, embed, future, command=current_command.get())
+
+        channel_queue = self.queues.get(key)
+        if channel_queue is None:
+            channel_queue = ChannelQueue(destination)
+            self.queues[key] = channel_queue
+
+        # Fold into the last message waiting to go out if we can
+        if channel_queue.pending and channel_queue.pending[-1].can_merge(message):
+            channel_queue.pending[-1].merge(message)
+        else:
+            channel_queue.pending.append(message)
+        self.queued += 1
+
+        if channel_queue.task is None:
+            channel_queue.task = asyncio.get_event_loop().create_task(self.__drain(key, channel_queue))
+
+        return future
+
+    async def flush(self):
+        tasks = [channel_queue.task for channel_queue in self.queues.values() if channel_queue.task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_statistics(self):
+        return {
+            "destinations": len(self.queues),
+            "pending": sum(len(channel_queue.pending) for channel_queue in self.queues.values()),
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed
+        }
+
+    async def __drain(self, key, channel_queue):
+        if channel_queue.bucket is None:
+            channel_queue.bucket = TokenBucket(rate=self.rate, capacity=self.burst)
+
+        try:
+            while channel_queue.pending:
+                # Wait for our turn before taking the message, anything queued in the meantime can still be merged in
+                await channel_queue.bucket.acquire()
+                message = channel_queue.pending.pop(0)
+                started = time.perf_counter()
+                try:
+                    if message.embed is not None:
+                        await channel_queue.destination.send(message.content, embed=message.embed)
+                    else:
+                        await channel_queue.destination.send(message.content)
+
+                except Exception:
+                    self.failed += 1
+                    traceback.print_exc()
+                    self.__resolve(message, False)
+                    continue
+
+                finally:
+                    # Only the request itself counts, time spent queued or waiting on the bucket is not the command's
+                    elapsed = time.perf_counter() - started
+                    for command in message.commands:
+                        record_send(command, elapsed)
+
+                self.sent += 1
+                self.__resolve(message, True)
+
+        finally:
+            channel_queue.task = None
+
+            # Keep the bucket around for a while so bursts can't be used to get around the rate limit
+            if not channel_queue.pending:
+                asyncio.get_event_loop().call_later(self.idle_timeout, self.__expire, key, channel_queue)
+
+    @staticmethod
+    def __resolve(message, outcome):
+        for future in message.futures:
+            if not future.done():
+                future.set_result(outcome)
+
+    def __expire(self, key, channel_queue):
+        if self.queues.get(key) is channel_queue and channel_queue.task is None and not channel_queue.pending:
+            del self.queues[key]
+
+
+message_scheduler = None
+
+
+def configure_message_scheduler(rate=None, burst=None):
+    scheduler = get_message_scheduler()
+    scheduler.configure(rate=rate, burst=burst)
+    return scheduler
+
+
+def get_message_scheduler():
+    global message_scheduler
+    if message_scheduler is None:
+        message_scheduler = MessageScheduler()
+
+    return message_scheduler
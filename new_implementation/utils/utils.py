@@ -14,9 +14,9 @@ def load_class(path, interface):
     module = importlib.import_module(path)
     results = list()
 
-    # Inspect every class to see if it implements the provided interface
+    # Inspect every class defined in the module to see if it implements the provided interface
     for name, cls in inspect.getmembers(module, inspect.isclass):
-        if isinstance(cls, interface):
+        if cls.__module__ == module.__name__ and issubclass(cls, interface):
             results.append(cls)
 
     # Handle non singleton results
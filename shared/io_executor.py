@@ -0,0 +1,151 @@
+import asyncio
+import contextlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def write_bytes(path, data):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "wb") as data_file:
+        data_file.write(data)
+
+
+def encode_and_write(path, payload, encoder, writer):
+    writer(path, encoder(payload))
+
+
+class PendingWrite:
+    """
+    The write state for a single path. Only the latest payload offered is kept, everything offered while a write is
+    in flight is folded into the next write and shares its future.
+    """
+
+    def __init__(self):
+        self.payload = None
+        self.snapshot = None
+        self.encoder = None
+        self.writer = None
+        self.future = None
+        self.task = None
+
+    def offer(self, payload, snapshot, encoder, writer):
+        self.payload = payload
+        self.snapshot = snapshot
+        self.encoder = encoder
+        self.writer = writer
+        if self.future is None:
+            self.future = asyncio.get_event_loop().create_future()
+
+        return self.future
+
+    def has_payload(self):
+        return self.future is not None
+
+    def take(self):
+        taken = self.payload, self.snapshot, self.encoder, self.writer, self.future
+        self.payload = None
+        self.snapshot = None
+        self.encoder = None
+        self.writer = None
+        self.future = None
+        return taken
+
+
+class IOExecutor:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dndiscord-io")
+        self.pending_writes = dict()
+
+    def get_max_workers(self):
+        return self.max_workers
+
+    async def run(self, function, *args):
+        loop = asyncio.get_event_loop()
+        with io_timer():
+            return await loop.run_in_executor(self.executor, function, *args)
+
+    async def read(self, path, reader):
+        # Never read underneath a write that has been requested but not yet completed
+        await self.wait_for_pending_write(path)
+        return await self.run(reader, path)
+
+    async def write(self, path, payload, encoder, writer=write_bytes, snapshot=None):
+        """
+        Queue a write of payload to path. The snapshot is called on the event loop thread just before the write so the
+        payload is captured in a consistent state, the encoder and then the writer are called with what it returns in
+        the executor. Without a snapshot the payload itself is encoded, so it must not change once it has been offered.
+        If a write for the same path is already queued, the older payload is dropped and both callers wait on the newer.
+        """
+        pending_write = self.pending_writes.get(path)
+        if pending_write is None:
+            pending_write = PendingWrite()
+            self.pending_writes[path] = pending_write
+
+        future = pending_write.offer(payload, snapshot, encoder, writer)
+        if pending_write.task is None:
+            pending_write.task = asyncio.get_event_loop().create_task(self.__drain(path, pending_write))
+
+        return await asyncio.shield(future)
+
+    async def wait_for_pending_write(self, path):
+        pending_write = self.pending_writes.get(path)
+        if pending_write is not None and pending_write.task is not None:
+            await asyncio.shield(pending_write.task)
+
+    async def flush(self):
+        tasks = [pending_write.task for pending_write in self.pending_writes.values() if pending_write.task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    async def __drain(self, path, pending_write):
+        try:
+            while pending_write.has_payload():
+                payload, snapshot, encoder, writer, future = pending_write.take()
+                try:
+                    if snapshot is not None:
+                        payload = snapshot(payload)
+                    await self.run(encode_and_write, path, payload, encoder, writer)
+
+                except Exception as e:
+                    future.set_exception(e)
+
+                else:
+                    future.set_result(None)
+
+        finally:
+            del self.pending_writes[path]
+
+
+io_executor = None
+
+# Context manager factory wrapped around every call into the executor, lets the bot count the time spent waiting on it
+io_timer = contextlib.nullcontext
+
+
+def configure_io_executor(max_workers):
+    global io_executor
+    if io_executor is not None:
+        io_executor.shutdown()
+
+    io_executor = IOExecutor(max_workers=max_workers)
+    return io_executor
+
+
+def get_io_executor():
+    global io_executor
+    if io_executor is None:
+        io_executor = IOExecutor()
+
+    return io_executor
+
+
+def set_io_timer(timer):
+    global io_timer
+    io_timer = timer
@@ -0,0 +1,88 @@
+MAX_MESSAGE_LENGTH = 2000
+
+# Every chunk is displayed as a code block, the leading blank line lets it display better
+CHUNK_PREFIX = "` \n"
+CHUNK_SUFFIX = "`"
+
+
+def split_offsets(lengths, max_length):
+    """
+    Works out where to split lines of the given lengths (None being a forced split) once they are joined by new lines,
+    such that no chunk is longer than max_length. Returns the (start, end) offsets of each chunk in the joined text.
+    Lines longer than max_length are split across as many chunks as they need.
+    """
+    offsets = list()
+    position = 0
+    chunk_start = 0
+    chunk_end = None
+
+    for length in lengths:
+        # Forced split
+        if length is None:
+            if chunk_end is not None:
+                offsets.append((chunk_start, chunk_end))
+                chunk_end = None
+            continue
+
+        line_start = position
+        line_end = position + length
+        position = line_end + 1
+
+        # Doesn't fit onto what we have so far
+        if chunk_end is not None and line_end - chunk_start > max_length:
+            offsets.append((chunk_start, chunk_end))
+            chunk_end = None
+
+        if chunk_end is None:
+            chunk_start = line_start
+
+            # Hard split lines too long to ever fit in a chunk
+            while line_end - chunk_start > max_length:
+                offsets.append((chunk_start, chunk_start + max_length))
+                chunk_start += max_length
+
+        chunk_end = line_end
+
+    if chunk_end is not None:
+        offsets.append((chunk_start, chunk_end))
+
+    return offsets
+
+
+def chunk_lines(lines, max_length=MAX_MESSAGE_LENGTH, prefix=CHUNK_PREFIX, suffix=CHUNK_SUFFIX):
+    """
+    Yields the lines (None being a forced split) joined into chunks of at most max_length characters, including the
+    prefix and suffix each chunk is wrapped in.
+    """
+    budget = max_length - len(prefix) - len(suffix)
+    if budget <= 0:
+        raise ValueError("max_length must leave room for the chunk prefix and suffix")
+
+    offsets = split_offsets([len(line) if line is not None else None for line in lines], budget)
+    if not offsets:
+        return
+
+    # One buffer for the whole message, each chunk is a slice of it
+    text = "\n".join([line for line in lines if line is not None])
+    for start, end in offsets:
+        yield prefix + text[start:end] + suffix
+
+
+class LongMessage:
+    """
+    A message built up line by line that is split into as many discord messages as it needs when iterated. Adding
+    None forces a split at that point.
+    """
+
+    def __init__(self, max_length=MAX_MESSAGE_LENGTH):
+        self.max_length = max_length
+        self.lines = list()
+
+    def add(self, content):
+        self.lines.append(content)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return chunk_lines(self.lines, max_length=self.max_length)
@@ -0,0 +1,377 @@
+import importlib
+import json
+
+# msgpack is optional - without it only the json backends are available
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class SerializationModifier:
+    def __init__(self):
+        self.ignored_items = list()
+
+    def add_item_to_be_ignored(self, item):
+        self.ignored_items.append(item)
+
+    def get_dict_items_that_should_not_be_serialized(self):
+        return self.ignored_items
+
+
+class ContextDependent(SerializationModifier):
+    def __init__(self):
+        super().__init__()
+        self.current_path = None
+        self.add_item_to_be_ignored("current_path")
+
+    def set_file_location(self, path):
+        self.current_path = path
+
+
+class SerializationError(Exception):
+    pass
+
+
+class ClassRegistry:
+    """
+    A lookup of (module name, class name) -> class used when rebuilding objects from their serialized form.
+    Classes can be registered up front, anything else is imported the first time it is seen and then remembered.
+    """
+
+    def __init__(self):
+        self.classes = dict()
+
+    def register(self, clazz):
+        self.classes[(clazz.__module__, clazz.__name__)] = clazz
+        return clazz
+
+    def resolve(self, module_name, class_name):
+        key = (module_name, class_name)
+        clazz = self.classes.get(key)
+        if clazz is not None:
+            return clazz
+
+        # Unknown class, import its module once and cache the result so we never walk the module again
+        module = importlib.import_module(module_name)
+        clazz = getattr(module, class_name)
+        self.classes[key] = clazz
+        return clazz
+
+
+class_registry = ClassRegistry()
+
+
+def serializable(clazz):
+    """
+    Class decorator that registers a class with the class registry ahead of the first load.
+    """
+    return class_registry.register(clazz)
+
+
+def convert_to_dict(obj):
+    """
+    A function takes in a custom object and returns a dictionary representation of the object.
+    This dict representation includes meta data such as the object's module and class names.
+    """
+
+    # Proxies that were never used still hold exactly what was read, so that can be written straight back out
+    if isinstance(obj, LazyObject):
+        return obj.get_serialized_form()
+
+    #  Populate the dictionary with object meta data and properties
+    obj_dict = {
+        "__class__": obj.__class__.__name__,
+        "__module__": obj.__module__
+    }
+    obj_dict.update(obj.__dict__)
+
+    # Do not serialize out anything we shouldn't, including the list of what we shouldn't
+    if isinstance(obj, SerializationModifier):
+        del obj_dict["ignored_items"]
+        for ignored_item in obj.get_dict_items_that_should_not_be_serialized():
+            del obj_dict[ignored_item]
+
+    return obj_dict
+
+
+def snapshot(obj):
+    """
+    A copy of obj made of plain dicts and lists, as it would be serialized. It shares nothing that can change with obj
+    so it can be serialized on another thread whilst obj carries on being used.
+    """
+    if type(obj) is LazyObject:
+        if not obj.is_materialized():
+            # Whatever was read is never changed, only replaced once the object is built
+            return obj.get_serialized_form()
+        obj = obj.get_target()
+
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+
+    if isinstance(obj, (list, tuple)):
+        return [snapshot(value) for value in obj]
+
+    if hasattr(obj, "__dict__"):
+        return snapshot(convert_to_dict(obj))
+
+    return obj
+
+
+def dict_to_obj(our_dict):
+    """
+    Function that takes in a dict and returns a custom object associated with the dict.
+    This function makes use of the "__module__" and "__class__" metadata in the dictionary
+    to know which object type to create.
+    """
+    if "__class__" not in our_dict:
+        return our_dict
+
+    # Pop ensures we remove metadata from the dict to leave only the instance arguments
+    class_name = our_dict.pop("__class__")
+    module_name = our_dict.pop("__module__")
+    class_ = class_registry.resolve(module_name, class_name)
+
+    # Use dictionary unpacking to initialize the object
+    return class_(**our_dict)
+
+
+def materialize(tree):
+    """
+    Rebuild the objects within a tree of plain dicts and lists, as produced by Serializer.loads_raw.
+    The provided tree is left untouched.
+    """
+    if isinstance(tree, dict):
+        return dict_to_obj({key: materialize(value) for key, value in tree.items()})
+
+    if isinstance(tree, list):
+        return [materialize(value) for value in tree]
+
+    return tree
+
+
+class LazyObject:
+    """
+    A stand in for an object that has been read but not yet built. The raw tree is kept as parsed and only turned into
+    the real object, one level at a time, the first time one of its attributes is used. isinstance checks are answered
+    from the tree's class metadata so they never force the object to be built.
+    """
+
+    __slots__ = ("_LazyObject__tree", "_LazyObject__target")
+
+    def __init__(self, tree):
+        object.__setattr__(self, "_LazyObject__tree", tree)
+        object.__setattr__(self, "_LazyObject__target", None)
+
+    @property
+    def __class__(self):
+        target = self.__target
+        if target is not None:
+            return target.__class__
+
+        return class_registry.resolve(self.__tree["__module__"], self.__tree["__class__"])
+
+    def is_materialized(self):
+        return self.__target is not None
+
+    def get_target(self):
+        target = self.__target
+        if target is None:
+            target = materialize_lazily(self.__tree)
+            object.__setattr__(self, "_LazyObject__target", target)
+            object.__setattr__(self, "_LazyObject__tree", None)
+
+        return target
+
+    def get_serialized_form(self):
+        target = self.__target
+        if target is not None:
+            return convert_to_dict(target)
+
+        return self.__tree
+
+    def __getattr__(self, name):
+        return getattr(self.get_target(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_target(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self.get_target(), name)
+
+    def __eq__(self, other):
+        if type(other) is LazyObject:
+            other = other.get_target()
+        return self.get_target() == other
+
+    def __hash__(self):
+        return hash(self.get_target())
+
+    def __repr__(self):
+        return repr(self.get_target())
+
+
+def defer(value):
+    if isinstance(value, dict):
+        if "__class__" in value:
+            return LazyObject(value)
+        return {key: defer(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [defer(item) for item in value]
+
+    return value
+
+
+def materialize_lazily(tree):
+    """
+    Build only the outermost object of a tree produced by Serializer.loads_raw, everything below it is deferred.
+    The provided tree is left untouched.
+    """
+    if not isinstance(tree, dict) or "__class__" not in tree:
+        return defer(tree)
+
+    class_ = class_registry.resolve(tree["__module__"], tree["__class__"])
+    return class_(**{key: defer(value) for key, value in tree.items() if key != "__class__" and key != "__module__"})
+
+
+class Serializer:
+    name = None
+
+    def dumps(self, obj):
+        pass
+
+    def loads(self, data):
+        pass
+
+    def loads_raw(self, data):
+        pass
+
+    def is_format_of(self, data):
+        pass
+
+
+class JsonSerializer(Serializer):
+    def __init__(self, name, indent=None):
+        self.name = name
+        self.indent = indent
+
+        # Compact output drops all of the optional whitespace
+        self.separators = (",", ":") if indent is None else None
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=convert_to_dict, indent=self.indent, separators=self.separators).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data, object_hook=dict_to_obj)
+
+    def loads_raw(self, data):
+        return json.loads(data)
+
+    def is_format_of(self, data):
+        # Json is our fallback, anything that isn't recognised as another format is treated as json
+        return True
+
+
+class MsgpackSerializer(Serializer):
+    # 0xc1 is never used by msgpack and can never start a json document, so this prefix is unambiguous
+    MAGIC = b"\xc1DND"
+
+    def __init__(self, name):
+        self.name = name
+
+    def is_available(self):
+        return msgpack is not None
+
+    def dumps(self, obj):
+        self.__check_available()
+        return MsgpackSerializer.MAGIC + msgpack.packb(obj, default=convert_to_dict, use_bin_type=True)
+
+    def loads(self, data):
+        self.__check_available()
+        return msgpack.unpackb(data[len(MsgpackSerializer.MAGIC):], object_hook=dict_to_obj, raw=False, strict_map_key=False)
+
+    def loads_raw(self, data):
+        self.__check_available()
+        return msgpack.unpackb(data[len(MsgpackSerializer.MAGIC):], raw=False, strict_map_key=False)
+
+    def is_format_of(self, data):
+        return data[:len(MsgpackSerializer.MAGIC)] == MsgpackSerializer.MAGIC
+
+    def __check_available(self):
+        if not self.is_available():
+            raise SerializationError("The msgpack package is required to read or write binary data files.")
+
+
+# Detection is performed in order so json, being the catch all, must be last
+serializers = {
+    "msgpack": MsgpackSerializer("msgpack"),
+    "json": JsonSerializer("json"),
+    "json_pretty": JsonSerializer("json_pretty", indent=4)
+}
+default_serializer = serializers["json"]
+lazy_loading = False
+
+
+def get_serializer(name):
+    if name not in serializers:
+        raise SerializationError("Unknown serialization format: " + str(name) + ". Valid options are: " + ", ".join(serializers.keys()))
+
+    serializer = serializers[name]
+    if isinstance(serializer, MsgpackSerializer) and not serializer.is_available():
+        raise SerializationError("The msgpack serialization format was requested but the msgpack package is not installed.")
+
+    return serializer
+
+
+def get_default_serializer():
+    return default_serializer
+
+
+def set_default_serializer(name):
+    global default_serializer
+    default_serializer = get_serializer(name)
+
+
+def is_lazy_loading():
+    return lazy_loading
+
+
+def set_lazy_loading(enabled):
+    global lazy_loading
+    lazy_loading = enabled
+
+
+def rebuild(tree):
+    """
+    Build the objects for a raw tree, either fully or lazily depending on the current loading mode.
+    """
+    return materialize_lazily(tree) if lazy_loading else materialize(tree)
+
+
+def detect_serializer(data):
+    for serializer in serializers.values():
+        if serializer.is_format_of(data):
+            return serializer
+
+
+def dumps(obj, serializer=None):
+    if serializer is None:
+        serializer = default_serializer
+
+    return serializer.dumps(obj)
+
+
+def loads(data):
+    serializer = detect_serializer(data)
+    if lazy_loading:
+        return materialize_lazily(serializer.loads_raw(data))
+
+    return serializer.loads(data)
+
+
+def loads_raw(data):
+    return detect_serializer(data).loads_raw(data)